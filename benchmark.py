@@ -0,0 +1,341 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# measures the hot paths of the rendering and the probes, so regressions show up before they reach the
+# pi. the gui runs with the dummy video driver of sdl, the probes against servers on the loopback
+# interface, so the results only depend on the machine. the results are printed as json and can be
+# saved as a baseline that later runs are compared with, e.g.
+#   python3 benchmark.py --output baseline.json
+#   python3 benchmark.py --baseline baseline.json
+import argparse
+import json
+import os
+import platform
+import socket
+import socketserver
+import statistics
+import struct
+import sys
+import threading
+import time
+
+# the resources of the gui and the config file are found relative to the working directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+# the greeting of pygame would end up in the json
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from dns_helper import dns_resolver, decode_name, DNS_TYPE_A, DNS_CLASS_IN
+from netlink_helper import pack_attribute, NLMSG_HEADER, NLMSG_DONE
+from nl80211_helper import parse_scan_dump, GENL_HEADER, NL80211_CMD_NEW_SCAN_RESULTS, \
+    NL80211_ATTR_IFINDEX, NL80211_ATTR_BSS, NL80211_BSS_BSSID, NL80211_BSS_FREQUENCY, \
+    NL80211_BSS_CAPABILITY, NL80211_BSS_INFORMATION_ELEMENTS, NL80211_BSS_SIGNAL_MBM, \
+    NL80211_BSS_SEEN_MS_AGO
+from wifi_helper import CHANNELS_24, CHANNELS_5
+
+# call a function repeatedly for at least min_time seconds and min_runs times and return the median, the
+# minimum and the 95th percentile of its duration in ms. the first call warms up the caches
+def measure(function, min_time=0.5, min_runs=5, max_runs=100000):
+    function()
+    durations = []
+    start = time.perf_counter()
+    while len(durations) < min_runs or (time.perf_counter() - start < min_time and len(durations) < max_runs):
+        begin = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - begin) * 1000)
+    durations.sort()
+    return {
+        "ms": round(statistics.median(durations), 4),
+        "min_ms": round(durations[0], 4),
+        "p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 4),
+        "runs": len(durations),
+    }
+
+# a dns server on the loopback interface that answers every a query with 127.0.0.1 and every other
+# query without records
+class dns_stub:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, name="dns_stub", daemon=True).start()
+
+    def _serve(self):
+        while True:
+            packet, address = self.sock.recvfrom(512)
+            try:
+                _, offset = decode_name(packet, 12)
+                qtype = struct.unpack("!H", packet[offset:offset + 2])[0]
+            except (ValueError, struct.error):
+                continue
+            question = packet[12:offset + 4]
+            answers = b""
+            if qtype == DNS_TYPE_A:
+                # the name of the answer points to the question
+                answers = struct.pack("!HHHIH", 0xc00c, DNS_TYPE_A, DNS_CLASS_IN, 300, 4) + \
+                    socket.inet_aton("127.0.0.1")
+            header = struct.pack("!HHHHHH", struct.unpack("!H", packet[:2])[0], 0x8180, 1,
+                                 1 if answers else 0, 0, 0)
+            self.sock.sendto(header + question + answers, address)
+
+# a tcp server on the loopback interface that closes every connection right away. a thread per
+# connection couldn't keep up with the connects of the benchmark
+class tcp_stub:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, name="tcp_stub", daemon=True).start()
+
+    def _serve(self):
+        while True:
+            self.sock.accept()[0].close()
+
+# a tcp server on the loopback interface that answers http requests with a short body and keeps the
+# connection open
+class http_stub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                line = self.rfile.readline()
+                if line == b"":
+                    return
+                # skip the headers of the request
+                while line not in (b"\r\n", b"\n", b""):
+                    line = self.rfile.readline()
+                self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), self.handler)
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, name="http_stub", daemon=True).start()
+
+# a recorded nl80211 scan dump with the given number of access points spread over both bands
+def canned_scan_dump(count):
+    channels = CHANNELS_24 + CHANNELS_5
+    messages = []
+    for index in range(count):
+        channel, frequency = channels[index % len(channels)]
+        # ssid, rsn with ccmp and psk and a channel width of 20 MHz
+        rsn = bytes([1, 0]) + b"\x00\x0f\xac\x04" + struct.pack("<H", 1) + b"\x00\x0f\xac\x04" + \
+            struct.pack("<H", 1) + b"\x00\x0f\xac\x02"
+        ssid = ("bench-%d" % index).encode()
+        elements = bytes([0, len(ssid)]) + ssid + bytes([48, len(rsn)]) + rsn
+        bss = pack_attribute(NL80211_BSS_BSSID, struct.pack("!IH", 0x02000000 + index, index)) + \
+            pack_attribute(NL80211_BSS_FREQUENCY, struct.pack("=I", frequency)) + \
+            pack_attribute(NL80211_BSS_CAPABILITY, struct.pack("=H", 0x11)) + \
+            pack_attribute(NL80211_BSS_INFORMATION_ELEMENTS, elements) + \
+            pack_attribute(NL80211_BSS_SIGNAL_MBM, struct.pack("=i", -4000 - (index % 50) * 100)) + \
+            pack_attribute(NL80211_BSS_SEEN_MS_AGO, struct.pack("=I", 100))
+        payload = GENL_HEADER.pack(NL80211_CMD_NEW_SCAN_RESULTS, 1) + \
+            pack_attribute(NL80211_ATTR_IFINDEX, struct.pack("=I", 3)) + \
+            pack_attribute(0x8000 | NL80211_ATTR_BSS, bss)
+        messages.append(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), 0x1c, 2, 1, 0) + payload)
+    done = struct.pack("=i", 0)
+    messages.append(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(done), NLMSG_DONE, 2, 1, 0) + done)
+    return b"".join(messages)
+
+# the rendering of the titlebar, the menu and the textbox. the caches of the gui are emptied before
+# every run, so a run paints like a frame with new content
+def benchmark_gui(min_time):
+    import pygame
+    from gui import gui
+    from config import config
+    settings = config().config
+    nettester_gui = gui(settings["resolution"], settings["fg_color"], settings["bg_color"],
+                        settings["font_size_correction"], settings["show_mouse_cursor"])
+    # the same size on every machine
+    nettester_gui.display_size = (800, 480)
+    nettester_gui.display_resize()
+    nettester_gui.titlebar_buttons.append({"text": "Menü"})
+    nettester_gui.interface_text = "eth0"
+    for index in range(15):
+        nettester_gui.menu_buttons.append({"icon": ("internet.png", "search.png", "wired.png")[index % 3],
+                                           "text": "Button %d" % index})
+    nettester_gui.update_menu()
+    results = {}
+
+    def add(name, function):
+        result = measure(function, min_time)
+        result["fps"] = round(1000 / result["ms"], 1) if result["ms"] > 0 else None
+        results[name] = result
+
+    add("titlebar.border", nettester_gui.render_titlebar_border)
+    add("titlebar.buttons", nettester_gui.render_titlebar_buttons)
+    add("titlebar.interface_text", nettester_gui.render_interface_text)
+    add("titlebar.clock", lambda: nettester_gui.render_clock("12:34:56"))
+    add("titlebar", lambda: (nettester_gui.render_titlebar_border(), nettester_gui.render_titlebar_buttons(),
+                             nettester_gui.render_interface_text(), nettester_gui.render_clock("12:34:56")))
+
+    def render_menu():
+        nettester_gui._menu_cache = None, None
+        nettester_gui.render_menu()
+    add("menu", render_menu)
+
+    def render_textbox(page=0):
+        nettester_gui._page_cache.clear()
+        nettester_gui._line_cache.clear()
+        nettester_gui.textbox_current_page = page
+        nettester_gui.render_textbox()
+
+    texts = {
+        "short": ["Zeile %d: 192.168.1.%d erreichbar (%.1f ms)" % (index, index, index * 0.7)
+                  for index in range(10)],
+        "long": ["%6d  %-17s  192.168.%d.%d  Hersteller %d" % (index, "02:00:00:00:%02x:%02x" % (
+            index // 256 % 256, index % 256), index // 256 % 256, index % 256, index % 97) for index in range(100000)],
+        "wrapped": [("%d " % index) + "abcdefghij" * 30 for index in range(2000)],
+    }
+    for name, text in texts.items():
+        # a new text is stored and wrapped for the textbox once
+        def set_text(text=text):
+            nettester_gui.set_text(["-"])
+            nettester_gui.set_text(text)
+            nettester_gui.textbox_layout()
+        add("textbox.%s.set_text" % name, set_text)
+        nettester_gui.set_text(text)
+        pages = nettester_gui.textbox_layout().pages
+        add("textbox.%s.render" % name, lambda: render_textbox(0))
+        add("textbox.%s.render_middle" % name, lambda pages=pages: render_textbox(pages // 2))
+
+    # a whole frame painted from scratch and a frame where only the clock has changed
+    nettester_gui.menu_open = False
+    nettester_gui.set_text(texts["short"])
+
+    def full_frame():
+        nettester_gui._page_cache.clear()
+        nettester_gui.invalidate_display()
+        nettester_gui.update_display()
+    add("frame.full", full_frame)
+
+    def clock_frame():
+        nettester_gui._elements.pop("clock", None)
+        nettester_gui.update_display()
+    add("frame.clock", clock_frame)
+    pygame.quit()
+    return results
+
+# the probes, the wifi scan and the custom command against the stand-ins on the loopback interface
+def benchmark_net(min_time):
+    from net import net
+    from net_helper import icmp_echo
+    from http_helper import tcp_connect, http_probe
+    from wifi_helper import survey_table
+    import random
+    dns = dns_stub()
+    tcp = tcp_stub()
+    http = http_stub()
+    nettester_net = net()
+    nettester_net.history = None
+    nettester_net.resolver = dns_resolver(["127.0.0.1"], timeout=1.0, port=dns.port)
+    results = {}
+
+    def add(name, function):
+        try:
+            results[name] = measure(function, min_time)
+        except OSError as exc:
+            # e.g. no icmp socket without the permission
+            results[name] = {"skipped": str(exc)}
+
+    # wait for a job and raise its error
+    def wait(job):
+        job.future.result()
+        if job.error() is not None:
+            raise job.error()
+
+    names = iter(range(1 << 30))
+    add("dns.cold", lambda: nettester_net.resolver.resolve("host%d.bench" % next(names), False))
+    nettester_net.resolver.resolve("cached.bench")
+    add("dns.cached", lambda: nettester_net.resolver.resolve("cached.bench"))
+    add("probe.icmp_echo_10", lambda: icmp_echo("127.0.0.1", 10, 0, 1.0))
+    add("probe.tcp_connect", lambda: tcp_connect("127.0.0.1", tcp.port, 1.0))
+    add("probe.http_5", lambda: http_probe("localhost", "127.0.0.1", http.port, False, "/", 5, 2.0))
+    remotes = ["127.0.0.1", "check.bench", "tcp://127.0.0.1:%d" % tcp.port, "http://127.0.0.1:%d/" % http.port]
+    add("job.net_check", lambda: wait(nettester_net.net_checker(remotes, 3, 3)))
+    add("job.latency", lambda: wait(nettester_net.latency_checker(["127.0.0.1"], 20, 0)))
+
+    dump = canned_scan_dump(300)
+    add("scan.parse_nl80211_300", lambda: parse_scan_dump(dump))
+    access_points = parse_scan_dump(dump)
+    for access_point in access_points:
+        access_point["interface"] = "wlan0"
+
+    # every scan changes the signals, so the survey has something to update and to format
+    def survey():
+        for access_point in access_points:
+            access_point["signal"] = -40 - random.random() * 50
+        nettester_net.wifi_survey.update(access_points)
+        nettester_net.get_wifi_scan()
+    nettester_net.wifi_survey = survey_table()
+    add("scan.survey_300", survey)
+    entries = nettester_net.wifi_survey.snapshot()
+    add("scan.channel_analysis_300", lambda: [analysis.analyse(entries)
+                                              for band, analysis, candidates in nettester_net.channel_analyses])
+
+    add("command.short", lambda: wait(nettester_net.custom_command("true", 10, 1000)))
+    add("command.output_20000", lambda: wait(nettester_net.custom_command("seq 1 20000", 10, 1000)))
+    nettester_net.jobs.shutdown()
+    http.shutdown()
+    return results
+
+# compare the results with a baseline. returns the changes of the median durations and the names of the
+# benchmarks that got slower than the tolerance allows
+def compare(results, baseline, tolerance):
+    comparison = {}
+    regressions = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None or "ms" not in old or "ms" not in result or old["ms"] <= 0:
+            continue
+        change = result["ms"] / old["ms"] - 1
+        comparison[name] = {"baseline_ms": old["ms"], "ms": result["ms"], "change": round(change, 3)}
+        if change > tolerance:
+            regressions.append(name)
+    return comparison, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the c't Net-Tester")
+    parser.add_argument("parts", nargs="*", help="the parts to run, gui and net, all by default")
+    parser.add_argument("--output", help="save the results as json, e.g. as a baseline")
+    parser.add_argument("--baseline", help="compare the results with a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="the share a benchmark may get slower than the baseline (default 0.2)")
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="the minimum time in seconds every benchmark runs (default 0.5)")
+    arguments = parser.parse_args()
+    parts = arguments.parts or ["gui", "net"]
+    for part in parts:
+        if part not in ("gui", "net"):
+            parser.error("unknown part: " + part)
+
+    results = {}
+    if "gui" in parts:
+        results.update(("gui." + name, result) for name, result in benchmark_gui(arguments.min_time).items())
+    if "net" in parts:
+        results.update(("net." + name, result) for name, result in benchmark_net(arguments.min_time).items())
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.machine()},
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline:
+            report["comparison"], regressions = compare(results, json.load(baseline)["results"],
+                                                        arguments.tolerance)
+        report["regressions"] = regressions
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    print()
+    # a failed comparison can stop a build script
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
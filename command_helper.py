@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os,select,shlex,signal,subprocess,time
+from collections import deque
+
+# stop a command and all processes it started. it gets the grace period to exit after SIGTERM, then it
+# is killed
+def terminate_command(process, grace=2.0):
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            # the process group is already gone
+            pass
+        try:
+            process.wait(grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+    process.wait()
+
+# run a command and read its output while it is running. stdout and stderr are read together, so the
+# lines keep their order. only the last max_lines lines are kept. on_output is called with the kept
+# lines and the number of dropped ones whenever new output arrived, but at most every update_interval
+# seconds. the command is stopped after timeout seconds or when should_stop returns True. returns
+# the return code (None if the command was stopped), the kept lines, the number of dropped lines and
+# whether the command timed out. lines longer than max_line_length bytes are split, so output without
+# line breaks doesn't grow without limit either. raises OSError if the command can't be started
+def run_command(command, timeout=10.0, max_lines=1000, on_output=None, should_stop=None,
+                update_interval=0.1, grace=2.0, max_line_length=4096):
+    arguments = shlex.split(command) if isinstance(command, str) else list(command)
+    if len(arguments) == 0:
+        raise OSError("empty command")
+    # a session of its own lets us stop the children of the command as well
+    process = subprocess.Popen(arguments, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, start_new_session=True)
+    output = process.stdout.fileno()
+    os.set_blocking(output, False)
+    lines = deque(maxlen=max_lines)
+    total_lines = 0
+    # the pieces of the unfinished last line and their size in bytes
+    partial = []
+    partial_size = 0
+    deadline = time.monotonic() + timeout if timeout else None
+    last_update = 0.0
+    changed = False
+    timed_out = stopped = False
+
+    # add a line to the ring buffer, split into pieces of at most max_line_length bytes
+    def add_line(line):
+        nonlocal total_lines
+        for start in range(0, max(1, len(line)), max_line_length):
+            lines.append(line[start:start + max_line_length].rstrip(b"\r").decode("utf-8", errors="replace"))
+            total_lines += 1
+
+    def publish():
+        if on_output is not None:
+            on_output(list(lines), total_lines - len(lines))
+
+    try:
+        while True:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                timed_out = True
+                break
+            if should_stop is not None and should_stop():
+                stopped = True
+                break
+            wait = 0.25 if deadline is None else min(0.25, deadline - now)
+            readable, _, _ = select.select([output], [], [], max(0.0, wait))
+            if readable:
+                try:
+                    data = os.read(output, 65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    # the command closed its output, usually because it has ended
+                    break
+                chunks = data.split(b"\n")
+                for chunk in chunks[:-1]:
+                    partial.append(chunk)
+                    add_line(b"".join(partial))
+                    partial = []
+                    partial_size = 0
+                partial.append(chunks[-1])
+                partial_size += len(chunks[-1])
+                # a long unfinished line is split, only the rest waits for the end of the line
+                if partial_size >= max_line_length:
+                    line = b"".join(partial)
+                    cut = len(line) - len(line) % max_line_length
+                    add_line(line[:cut])
+                    partial = [line[cut:]]
+                    partial_size = len(partial[0])
+                changed = True
+            if changed and time.monotonic() - last_update >= update_interval:
+                last_update = time.monotonic()
+                changed = False
+                publish()
+        if partial_size > 0:
+            add_line(b"".join(partial))
+        if not timed_out and not stopped:
+            # the output is closed, but the command may still be running
+            try:
+                process.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+    finally:
+        # children that still hold the output open are stopped even if the command itself has ended
+        if timed_out or stopped or process.poll() is None:
+            terminate_command(process, grace)
+        process.stdout.close()
+    publish()
+    return {
+        "returncode": None if timed_out or stopped else process.returncode,
+        "lines": list(lines),
+        "dropped": total_lines - len(lines),
+        "timed_out": timed_out,
+    }
@@ -5,7 +5,13 @@ import configparser
 class config:
     def __init__(self):
         self._parser = configparser.ConfigParser()
+        # keep the case of the keys, the names of the commands are shown in the menu
+        self._parser.optionxform = str
         self.config = ""
+        # named commands of the commands segment, every one gets its own menu button
+        self.commands = {}
+        # the probes of the probes segment, which are run by the monitoring in the background
+        self.probes = {}
         self._load_config()
 
     def _load_config(self):
@@ -14,6 +20,10 @@ class config:
             self._parser.read('nettester.conf')
             if "nettester" in self._parser:
                 self.config = self._parser['nettester']
+            if "commands" in self._parser:
+                self.commands = dict(self._parser['commands'])
+            if "probes" in self._parser:
+                self.probes = dict(self._parser['probes'])
         except Exception as exc:
             # return the error and exit
             print("Loading the configuration file failed")
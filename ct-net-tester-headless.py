@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import signal
+import socket
+import time
+from net import net
+from config import config
+from job_helper import result_cache
+from server_helper import start_http_server, json_response, text_response, format_metric, \
+    METRICS_CONTENT_TYPE
+from netlink_helper import IFF_UP
+from history_helper import open_history
+from monitor_helper import parse_probes
+
+# runs the net engine without the gui and answers its results over http as json and as prometheus
+# metrics. the results are cached for a short time, so many clients never start the same probe twice
+class nettester_headless:
+
+    def __init__(self):
+        # load the config file
+        self.nettester_config = config()
+        # initialize the networking
+        self.nettester_net = net()
+        self.nettester_net.dns_cache_enabled = self.nettester_config.config.get("dns_cache", "1") == "1"
+        # record the probe results
+        self.nettester_net.history = open_history(self.nettester_config.config, system=True)
+        self.monitor_errors = []
+        self.cache = result_cache(float(self.nettester_config.config.get("headless_cache_ttl", "10")))
+        self.routes = {
+            "/": self.index,
+            "/interfaces": self.interfaces,
+            "/netcheck": self.net_check,
+            "/latency": self.latency,
+            "/wifi": self.wifi,
+            "/monitor": self.monitor,
+            "/command": self.command,
+            "/metrics": self.metrics,
+        }
+
+    # serve until SIGINT or SIGTERM
+    def execute(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            # stop the background jobs, so they don't delay the exit
+            self.nettester_net.jobs.shutdown()
+            # write the last samples of the history
+            if self.nettester_net.history is not None:
+                self.nettester_net.history.close()
+
+    async def serve(self):
+        # the wifi survey runs all the time, like in the gui
+        self.nettester_net.wifi_scanner(
+            float(self.nettester_config.config.get("wifi_scan_interval", "10")),
+            float(self.nettester_config.config.get("wifi_scan_max_interval", "60")),
+            float(self.nettester_config.config.get("wifi_ap_max_age", "120")))
+        # the probes of the config file run all the time as well
+        probes, self.monitor_errors = parse_probes(
+            self.nettester_config.probes, float(self.nettester_config.config.get("monitor_interval", "30")))
+        if len(probes) > 0:
+            self.nettester_net.monitor(
+                probes,
+                int(self.nettester_config.config.get("monitor_workers", "16")),
+                float(self.nettester_config.config.get("monitor_jitter", "0.1")),
+                int(self.nettester_config.config.get("monitor_alert_after", "3")),
+                int(self.nettester_config.config.get("monitor_clear_after", "3")),
+                float(self.nettester_config.config.get("monitor_clear_ratio", "0.8")))
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        server = await start_http_server(self.handle,
+                                         self.nettester_config.config.get("headless_address", "127.0.0.1"),
+                                         int(self.nettester_config.config.get("headless_port", "8080")))
+        async with server:
+            await stop.wait()
+
+    # answer a request by its path. named commands of the config file are found at /command/<name>
+    async def handle(self, method, path, query):
+        if path.startswith("/command/"):
+            return await self.command(path[len("/command/"):])
+        route = self.routes.get(path.rstrip("/") or "/")
+        if route is None:
+            return text_response("not found\n", 404)
+        return await route()
+
+    # wait for a job without blocking the other requests. asyncio.wait doesn't raise if the job failed
+    # or its future has been cancelled, e.g. at the shutdown, so the caller can still answer with the error
+    async def wait(self, job):
+        if not job.done():
+            await asyncio.wait([asyncio.wrap_future(job.future)])
+        return job
+
+    def get_remotes(self):
+        return [remote.strip() for remote in self.nettester_config.config["online_test_remote"].split(',')
+                if remote.strip() != ""]
+
+    async def index(self):
+        return json_response({"endpoints": sorted(self.routes) + ["/command/<name>"],
+                              "commands": sorted(self.nettester_config.commands)})
+
+    # the interfaces with their addresses
+    def get_interfaces(self):
+        interfaces = {}
+        for interface in self.nettester_net.wired_interfaces + self.nettester_net.wireless_interfaces:
+            if interface == "None":
+                continue
+            try:
+                addresses = self.nettester_net.ifaddresses(interface)
+            except ValueError:
+                continue
+            interfaces[interface] = {
+                "wireless": interface in self.nettester_net.wireless_interfaces,
+                "mac": addresses.get(socket.AF_PACKET, [{}])[0].get("addr"),
+                "ipv4": addresses.get(socket.AF_INET, []),
+                "ipv6": addresses.get(socket.AF_INET6, []),
+            }
+        return interfaces
+
+    async def interfaces(self):
+        return json_response({"current": self.nettester_net.current_interface,
+                              "interfaces": self.get_interfaces()})
+
+    async def net_check(self):
+        remotes = self.get_remotes()
+        deadline = float(self.nettester_config.config.get("online_test_timeout", "3"))
+        samples = int(self.nettester_config.config.get("online_test_samples", "3"))
+        job = await self.wait(self.cache.get("net_check", lambda: self.nettester_net.net_checker(
+            remotes, deadline, samples)))
+        return json_response({"lines": job.get_results(), "error": self.error_text(job)})
+
+    # start or reuse the latency measurement and return its statistics
+    async def get_latency(self):
+        count = int(self.nettester_config.config.get("latency_test_count", "50"))
+        interval = float(self.nettester_config.config.get("latency_test_interval", "0.02"))
+        job = await self.wait(self.cache.get("latency", lambda: self.nettester_net.latency_checker(
+            self.get_remotes(), count, interval)))
+        return job.future.result() if job.error() is None and not job.future.cancelled() else [], job
+
+    async def latency(self):
+        summaries, job = await self.get_latency()
+        return json_response({"targets": summaries, "error": self.error_text(job)})
+
+    # the access points of the survey and the channel analysis
+    def get_wifi(self):
+        now = time.monotonic()
+        access_points = []
+        for entry in self.nettester_net.wifi_survey.snapshot():
+            access_point = {key: value for key, value in entry.items()
+                            if key not in ("version", "first_seen", "last_seen")}
+            # the times of the survey are only meaningful on this machine
+            access_point["age"] = round(now - entry["last_seen"], 1)
+            access_points.append(access_point)
+        channels = []
+        for band, rows, recommended in self.nettester_net.get_channel_analysis() or []:
+            channels.append({
+                "band": band,
+                "channels": [{"channel": channel, "access_points": count, "score": float(score)}
+                             for channel, count, score in rows],
+                "recommended": recommended,
+            })
+        return access_points, channels
+
+    async def wifi(self):
+        access_points, channels = self.get_wifi()
+        return json_response({"scans": self.nettester_net.wifi_survey.scans,
+                              "errors": self.nettester_net.wifi_scan_errors,
+                              "access_points": access_points, "channels": channels})
+
+    # the state of the probes of the monitoring
+    def get_monitor(self):
+        probes = []
+        if self.nettester_net.probe_monitor is not None:
+            for name, kind, target, runs, result, firing in self.nettester_net.probe_monitor.status():
+                probes.append({"name": name, "type": kind, "target": target, "runs": runs, "result": result,
+                               "alerts": firing})
+        return probes
+
+    async def monitor(self):
+        return json_response({"alerting": self.nettester_net.is_alerting(), "probes": self.get_monitor(),
+                              "errors": self.monitor_errors})
+
+    # run the custom command or a named command of the config file
+    async def command(self, name=None):
+        if name is None:
+            command = self.nettester_config.config["custom_command"]
+        elif name in self.nettester_config.commands:
+            command = self.nettester_config.commands[name]
+        else:
+            return text_response("not found\n", 404)
+        timeout = float(self.nettester_config.config.get("custom_command_timeout", "10"))
+        max_lines = int(self.nettester_config.config.get("custom_command_lines", "1000"))
+        job = await self.wait(self.cache.get(("command", command), lambda: self.nettester_net.custom_command(
+            command, timeout, max_lines)))
+        result = job.future.result() if job.error() is None and not job.future.cancelled() else None
+        return json_response({
+            "command": command,
+            "returncode": result["returncode"] if result is not None else None,
+            "timed_out": result["timed_out"] if result is not None else None,
+            "lines": job.get_results(),
+            "error": self.error_text(job),
+        })
+
+    @staticmethod
+    def error_text(job):
+        if job.future.cancelled() or job.is_cancelled():
+            return "cancelled"
+        return str(job.error()) if job.error() is not None else None
+
+    # all results as prometheus metrics
+    async def metrics(self):
+        lines = []
+
+        def add(name, kind, description, samples):
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+            lines.extend(line for line in (format_metric(name, labels, value) for labels, value in samples)
+                         if line is not None)
+
+        summaries, job = await self.get_latency()
+        summaries = [summary for summary in summaries if "error" not in summary]
+        add("nettester_latency_loss_ratio", "gauge", "Share of the lost echo requests",
+            [({"target": summary["target"]}, summary["loss"]) for summary in summaries])
+        add("nettester_latency_rtt_milliseconds", "gauge", "Round trip time statistics of the echo requests",
+            [({"target": summary["target"], "statistic": statistic}, summary[statistic])
+             for summary in summaries for statistic in ("min", "median", "p95", "max", "average", "jitter")])
+
+        interfaces = self.get_interfaces()
+        links = self.nettester_net.interface_monitor.interfaces() \
+            if self.nettester_net.interface_monitor is not None else {}
+        add("nettester_interface_up", "gauge", "Whether the interface is up",
+            [({"interface": name}, 1 if links[name]["flags"] & IFF_UP else 0)
+             for name in interfaces if name in links])
+        add("nettester_interface_addresses", "gauge", "Number of addresses of the interface",
+            [({"interface": name, "family": family}, len(interface[family]))
+             for name, interface in interfaces.items() for family in ("ipv4", "ipv6")])
+
+        access_points, channels = self.get_wifi()
+        add("nettester_wifi_scans_total", "counter", "Number of completed wifi scans",
+            [({}, self.nettester_net.wifi_survey.scans)])
+        add("nettester_wifi_access_points", "gauge", "Number of access points found by the wifi survey",
+            [({}, len(access_points))])
+        add("nettester_wifi_signal_dbm", "gauge", "Average signal of the access point",
+            [({"bssid": access_point["bssid"], "ssid": access_point["ssid"],
+               "channel": access_point["channel"] or ""}, access_point["signal"])
+             for access_point in access_points])
+        add("nettester_wifi_channel_congestion", "gauge", "Congestion score of the channel",
+            [({"band": band["band"], "channel": channel["channel"]}, channel["score"])
+             for band in channels for channel in band["channels"]])
+
+        probes = [probe for probe in self.get_monitor() if probe["result"] is not None]
+        add("nettester_probe_loss_ratio", "gauge", "Loss of the last run of the probe",
+            [({"probe": probe["name"]}, probe["result"].get("loss")) for probe in probes])
+        add("nettester_probe_rtt_milliseconds", "gauge", "Round trip time of the last run of the probe",
+            [({"probe": probe["name"]}, probe["result"].get("rtt")) for probe in probes])
+        add("nettester_probe_dns_milliseconds", "gauge", "Resolution time of the last run of the probe",
+            [({"probe": probe["name"]}, probe["result"].get("dns")) for probe in probes])
+        add("nettester_probe_alerts", "gauge", "Number of the firing rules of the probe",
+            [({"probe": probe["name"]}, len(probe["alerts"])) for probe in probes])
+        return text_response("\n".join(lines) + "\n", content_type=METRICS_CONTENT_TYPE)
+
+if __name__ == "__main__":
+    application = nettester_headless()
+    application.execute()
@@ -6,12 +6,24 @@ from gui import gui
 from net import net
 from config import config
 from subprocess import call
+from net_helper import is_valid_ipv4_address, is_valid_ipv6_address, parse_remote
+from dns_helper import read_system_resolvers
+from history_helper import open_history
+from probe_stats import format_ms
+from monitor_helper import parse_probes
+import time
 
 class nettester:
 
     def __init__(self):
         # are we running
         self._running = False
+        # the background job whose results are shown, see show_results
+        self.active_task = None
+        # the version of the interface whose information is shown, None if something else is shown
+        self.shown_interface_version = None
+        # the probes of the config file that couldn't be parsed
+        self.monitor_errors = []
     
     @staticmethod
     def cleanup():
@@ -24,6 +36,11 @@ class nettester:
         self._running = self.init()
         while self._running:
             self.loop()
+        # stop the background jobs, so they don't delay the exit
+        self.nettester_net.jobs.shutdown()
+        # write the last samples of the history
+        if self.nettester_net.history is not None:
+            self.nettester_net.history.close()
         # clean up end end
         self.cleanup()
 
@@ -37,9 +54,19 @@ class nettester:
             self.nettester_config.config["bg_color"],
             self.nettester_config.config["font_size_correction"],
             self.nettester_config.config["show_mouse_cursor"],
+            self.nettester_config.config.get("alert_color", "255,0,0"),
             )
         # initialize the networking
         self.nettester_net = net()
+        self.nettester_net.dns_cache_enabled = self.nettester_config.config.get("dns_cache", "1") == "1"
+        # record the probe results
+        self.nettester_net.history = open_history(self.nettester_config.config)
+        # the background threads wake up the main loop when they have new results
+        self.nettester_net.notify = self.nettester_gui.wake_up
+        # start the wifi survey in the background
+        self.start_wifi_survey()
+        # run the probes of the config file in the background
+        self.start_monitor()
         # create the buttons
         self.create_buttons()
         self.switch_to_wired()
@@ -80,29 +107,91 @@ class nettester:
             "icon": "search.png",
             "text": "Wifi-Scan",
         },
+        {
+            "command": self.analyse_channels,
+            "icon": "search.png",
+            "text": "Kanalanalyse",
+        },
         {
             "command": self.custom_command,
             "icon": "custom.png",
             "text": "Custom Command",
+        },
+        {
+            "command": self.check_latency,
+            "icon": "internet.png",
+            "text": "Latenz",
+        },
+        {
+            "command": self.benchmark_dns,
+            "icon": "search.png",
+            "text": "DNS-Test",
+        },
+        {
+            "command": self.test_throughput,
+            "icon": "internet.png",
+            "text": "Durchsatz",
+        },
+        {
+            "command": self.test_bufferbloat,
+            "icon": "internet.png",
+            "text": "Bufferbloat",
+        },
+        {
+            "command": self.trace_route,
+            "icon": "search.png",
+            "text": "Traceroute",
+        },
+        {
+            "command": self.scan_lan,
+            "icon": "search.png",
+            "text": "LAN-Scan",
+        },
+        {
+            "command": self.show_history,
+            "icon": "internet.png",
+            "text": "Verlauf",
+        },
+        {
+            "command": self.show_monitor,
+            "icon": "internet.png",
+            "text": "Überwachung",
         }]
         )
+        # every named command of the config file gets a button
+        for name, command in self.nettester_config.commands.items():
+            self.nettester_gui.menu_buttons.append({
+                "command": lambda name=name, command=command: self.custom_command(name, command),
+                "icon": "custom.png",
+                "text": name,
+            })
+        # the menu layout depends on the number of buttons
+        self.nettester_gui.update_menu()
 
         self.nettester_gui.paging_buttons[0]["command"] = self.page_up
         self.nettester_gui.paging_buttons[1]["command"] = self.page_down
 
-    # the main loop
+    # the main loop. it sleeps until an event arrives, a background task has new results or the clock
+    # in the titlebar has to show the next second
     def loop(self):
-        # process all events since the last cycle
-        self.process_events()
+        # wait for and process all events since the last cycle
+        self.process_events(self.nettester_gui.wait_events(self.nettester_gui.time_to_next_second()))
+        # show the newest results of the running task
+        self.update_task()
+        # show the interface again if it has changed
+        self.update_interface_info()
+        # show the alert of the monitoring in the titlebar
+        self.nettester_gui.alert = self.nettester_net.is_alerting()
         # update the display
         self.nettester_gui.update_display()
-        # call the guis tick to limit the framerate
-        self.nettester_gui.tick()
+        # a running task can send results faster than they can be read, so limit the framerate
+        if self.active_task is not None:
+            self.nettester_gui.tick()
 
     # process the pygame events
-    def process_events(self):
+    def process_events(self, events):
         # walk all events received from the gui
-        for event in self.nettester_gui.get_events():
+        for event in events:
             # if the event is any type of quit request end the programm
             if event.type == pygame.QUIT:
                 self._running = False
@@ -148,40 +237,118 @@ class nettester:
     # switch to the wireless interface and update the display accordingly
     def switch_to_wireless(self):
         self.nettester_net.switch_to_wireless()
-        self.nettester_gui.interface_text = self.nettester_net.current_interface
-        self.nettester_gui.set_text(self.nettester_net.get_interface_info())
+        self.show_interface_info()
 
     # switch to the wired interface and update the display accordingly
     def switch_to_wired(self):
         self.nettester_net.switch_to_wired()
+        self.show_interface_info()
+    
+    # start the wifi survey with the settings of the config file, unless it is already running
+    def start_wifi_survey(self):
+        interval = float(self.nettester_config.config.get("wifi_scan_interval", "10"))
+        max_interval = float(self.nettester_config.config.get("wifi_scan_max_interval", "60"))
+        max_age = float(self.nettester_config.config.get("wifi_ap_max_age", "120"))
+        return self.nettester_net.wifi_scanner(interval, max_interval, max_age)
+
+    # start the monitoring of the probes of the config file, unless there are none
+    def start_monitor(self):
+        probes, self.monitor_errors = parse_probes(
+            self.nettester_config.probes, float(self.nettester_config.config.get("monitor_interval", "30")))
+        if len(probes) == 0:
+            return None
+        return self.nettester_net.monitor(
+            probes,
+            int(self.nettester_config.config.get("monitor_workers", "16")),
+            float(self.nettester_config.config.get("monitor_jitter", "0.1")),
+            int(self.nettester_config.config.get("monitor_alert_after", "3")),
+            int(self.nettester_config.config.get("monitor_clear_after", "3")),
+            float(self.nettester_config.config.get("monitor_clear_ratio", "0.8")))
+
+    # show the information of the current interface
+    def show_interface_info(self):
         self.nettester_gui.interface_text = self.nettester_net.current_interface
+        self.shown_interface_version = self.nettester_net.get_interface_version()
         self.nettester_gui.set_text(self.nettester_net.get_interface_info())
-    
-    # show the last results of the wifi scan
+
+    # show the information of the current interface again if it has changed, e.g. because it got an address
+    def update_interface_info(self):
+        if self.shown_interface_version is None:
+            return
+        version = self.nettester_net.get_interface_version()
+        if version != self.shown_interface_version:
+            self.shown_interface_version = version
+            self.nettester_gui.set_text(self.nettester_net.get_interface_info(), keep_page=True)
+
+    # show the access points found by the wifi survey
     def scan_wifi(self):
         # update the display
         self.nettester_gui.interface_text = "WiFi-Scan"
         # hide the menu
         self.toggle_menu()
-        # this is set to false if the user opens the menu again or the scan completes
-        self.wifi_scan_in_progress = True
-        # wait for the results
-        while self.wifi_scan_in_progress:
-            # try to get the scan data
-            scan_data = self.nettester_net.get_wifi_scan()
-            # if there are scan data show them and exit the loop
-            if scan_data != None:
-                self.nettester_gui.set_text(scan_data)
-                self.wifi_scan_in_progress = False
-                break
-            else:
-                # if there are no scan data show yet show a please wait notification
-                text = []
-                text.append("Bitte warten")
-                self.nettester_gui.set_text(text)
-                # update the interface although the main loop is blocked. this is easier than maintaining a proper loop management
-                self.loop()
-        self.nettester_net.wifi_scanner_thread.join(30)
+        # the survey keeps running, but scans right away while the results are shown
+        self.show_results(self.start_wifi_survey(),
+                          lambda results: self.nettester_net.get_wifi_scan() or ["Bitte warten"], live=True)
+        self.nettester_net.request_wifi_scan()
+
+    # show the congestion of the wifi channels and the least congested ones
+    def analyse_channels(self):
+        # update the display
+        self.nettester_gui.interface_text = "Kanalanalyse"
+        # hide the menu
+        self.toggle_menu()
+        # the analysis follows the survey, which scans right away while the results are shown
+        self.show_results(self.start_wifi_survey(), lambda results: self.format_channel_analysis(), live=True)
+        self.nettester_net.request_wifi_scan()
+
+    # convert the channel analysis into text
+    def format_channel_analysis(self):
+        analysis = self.nettester_net.get_channel_analysis()
+        if analysis is None:
+            return ["Bitte warten"]
+        text = []
+        for band, rows, recommended in analysis:
+            text.append("Empfohlen " + band + ": " + ", ".join(str(channel) for channel in recommended))
+        text.append(" ")
+        for band, rows, recommended in analysis:
+            text.extend(self.nettester_gui.format_table([band, "APs", "Last"], rows))
+            text.append(" ")
+        return text
+
+    # show the state of the probes of the monitoring
+    def show_monitor(self):
+        # update the display
+        self.nettester_gui.interface_text = "Überwachung"
+        # hide the menu
+        self.toggle_menu()
+        job = self.start_monitor()
+        if job is None:
+            self.nettester_gui.set_text(self.monitor_errors + ["Keine Messungen im probes-Abschnitt konfiguriert"])
+            return
+        # the monitoring keeps running, its state is shown until something else is selected
+        self.show_results(job, lambda results: self.monitor_errors + self.nettester_gui.format_table(
+            ["Messung", "Verl", "RTT", "DNS", "Status"], self.nettester_net.get_monitor_status()), live=True)
+
+    # show a summary of the recorded probe results of the last hour
+    def show_history(self):
+        # update the display
+        self.nettester_gui.interface_text = "Verlauf"
+        # hide the menu
+        self.toggle_menu()
+        history = self.nettester_net.history
+        if history is None:
+            self.nettester_gui.set_text(["Kein history_file konfiguriert"])
+            return
+        rows = []
+        for kind, target, count, rtt, rtt_max, loss, value in history.summary(time.time() - 3600):
+            # samples without an rtt show their value, e.g. the signal of an access point
+            average = format_ms(rtt) if rtt is not None else ("%.0f" % value if value is not None else "-")
+            rows.append([kind + " " + target, count,
+                         "%d%%" % round(loss * 100) if loss is not None else "-", average, format_ms(rtt_max)])
+        if len(rows) == 0:
+            self.nettester_gui.set_text(["Noch keine Messwerte"])
+        else:
+            self.nettester_gui.set_table(["Letzte Stunde", "Anz", "Verl", "Mit", "Max"], rows)
 
     # show the results of the net scan
     def check_net(self):
@@ -189,59 +356,191 @@ class nettester:
         self.nettester_gui.interface_text = "Netztest"
         # hide the menu
         self.toggle_menu()
-        # this is set to false if the user opens the menu again or the scan completes
-        self.check_net_in_progress = True
         # get the remotes from the config file
         remotes = self.nettester_config.config["online_test_remote"].split(',')
-        # start the check thread 
-        self.nettester_net.net_checker(remotes)
-        # wait for the results
-        while self.check_net_in_progress:
-            # try to get the scan data
-            scan_data = self.nettester_net.get_net_status()
-            # if there are scan data show them and exit the loop
-            if scan_data != None:
-                self.nettester_gui.set_text(scan_data)
-                self.check_net_in_progress = False
-                break
-            else:
-                # if there are no scan data show yet show a please wait notification
-                text = []
-                text.append("Bitte warten")
-                self.nettester_gui.set_text(text)
-                # update the interface although the main loop is blocked. this is easier than maintaining a proper loop management
-                self.loop()
-        self.nettester_net.check_net_thread.join(30)
+        # every remote must be finished within this many seconds
+        deadline = float(self.nettester_config.config.get("online_test_timeout", "3"))
+        # number of tcp connects or http requests for tcp:// and http(s):// remotes
+        samples = int(self.nettester_config.config.get("online_test_samples", "3"))
+        # start the check and show the results while the remotes finish
+        self.show_results(self.nettester_net.net_checker(remotes, deadline, samples))
 
-    # show the results of the custom command
-    def custom_command(self):
+    # show the output of the custom command or of a named command of the config file
+    def custom_command(self, name="Eigener Befehl", command=None):
         # update the display
-        self.nettester_gui.interface_text = "Eigener Befehl"
+        self.nettester_gui.interface_text = name
         # hide the menu
         self.toggle_menu()
-        # this is set to false if the user opens the menu again or the command completes
-        self.custom_command_in_progress = True
         # get the command from the config file
-        command = self.nettester_config.config["custom_command"]
-        # start the command thread 
-        self.nettester_net.custom_command(command)
-        # wait for the results
-        while self.custom_command_in_progress:
-            # try to get the scan data
-            command_result = self.nettester_net.get_custom_command_status()
-            # if there are scan data show them and exit the loop
-            if command_result != None:
-                self.nettester_gui.set_text(command_result)
-                self.check_net_in_progress = False
-                break
+        if command is None:
+            command = self.nettester_config.config["custom_command"]
+        # commands that don't end on their own are stopped after the timeout
+        timeout = float(self.nettester_config.config.get("custom_command_timeout", "10"))
+        max_lines = int(self.nettester_config.config.get("custom_command_lines", "1000"))
+        # start the command, its output is shown while it is running
+        self.show_results(self.nettester_net.custom_command(command, timeout, max_lines))
+
+    # show the results of a background job while it is running. format_results turns the results
+    # published so far into text. the main loop updates the text until the job is complete or the user
+    # opens the menu again, which cancels the job. live jobs like the wifi survey run on their own, they
+    # are shown without a please wait notification and keep running when the menu is opened
+    def show_results(self, job, format_results=None, live=False):
+        self.active_task = job, format_results, live
+        self.shown_interface_version = None
+        self.update_task(True)
+
+    # show the current results of the active job
+    def update_task(self, first=False):
+        if self.active_task is None:
+            return
+        job, format_results, live = self.active_task
+        # check for completion first, so the last results are not missed
+        complete = job.done()
+        text = job.get_results()
+        if format_results is not None:
+            text = format_results(text)
+        # if the job is done show the results and stop updating them
+        if complete:
+            if job.error() is not None:
+                text.append("Fehler: " + str(job.error()))
+            self.active_task = None
+        if live:
+            # stay on the page the user has scrolled to
+            self.nettester_gui.set_text(text, keep_page=not first)
+            return
+        # follow the newest results as long as the last page is shown, otherwise stay on the page the
+        # user has scrolled to
+        follow = not first and self.nettester_gui.is_last_page()
+        # show the results we already have and a please wait notification with the progress
+        if not complete:
+            if job.progress is not None:
+                text.append("Bitte warten (%d%%)" % (job.progress * 100))
             else:
-                # if there are no results show yet show a please wait notification
-                text = []
                 text.append("Bitte warten")
-                self.nettester_gui.set_text(text)
-                # update the interface although the main loop is blocked. this is easier than maintaining a proper loop management
-                self.loop()
-        self.nettester_net.custom_command_thread.join(30)
+        self.nettester_gui.set_text(text, keep_page=not first)
+        if follow:
+            self.nettester_gui.show_last_page()
+
+    # return the remotes of the config file
+    def get_remotes(self):
+        return [remote.strip() for remote in self.nettester_config.config["online_test_remote"].split(',')
+                if remote.strip() != ""]
+
+    # show the latency statistics of all remotes
+    def check_latency(self):
+        # update the display
+        self.nettester_gui.interface_text = "Latenz"
+        # hide the menu
+        self.toggle_menu()
+        # get the burst settings from the config file
+        count = int(self.nettester_config.config.get("latency_test_count", "50"))
+        interval = float(self.nettester_config.config.get("latency_test_interval", "0.02"))
+        # start the measurement
+        header = ["Ziel", "Verl", "Min", "Med", "P95", "Max", "Jit"]
+        self.show_results(self.nettester_net.latency_checker(self.get_remotes(), count, interval),
+                          lambda rows: self.nettester_gui.format_table(header, rows))
+
+    # compare the system resolvers with the configured ones
+    def benchmark_dns(self):
+        # update the display
+        self.nettester_gui.interface_text = "DNS-Test"
+        # hide the menu
+        self.toggle_menu()
+        # the resolvers of resolv.conf come first, then the configured ones
+        resolvers = []
+        for server in read_system_resolvers():
+            resolvers.append(("System " + server, server))
+        for server in self.nettester_config.config.get("dns_benchmark_resolvers", "").split(','):
+            if server.strip() != "":
+                resolvers.append((server.strip(), server.strip()))
+        # use the names of the remotes, ip addresses can't be resolved
+        names = []
+        for remote in self.get_remotes():
+            try:
+                host = parse_remote(remote)["host"]
+            except ValueError:
+                continue
+            if not is_valid_ipv4_address(host) and not is_valid_ipv6_address(host) and host not in names:
+                names.append(host)
+        names.extend([name.strip() for name in
+                      self.nettester_config.config.get("dns_benchmark_names", "").split(',') if name.strip() != ""])
+        if len(resolvers) == 0 or len(names) == 0:
+            self.nettester_gui.set_text(["Keine Resolver oder Namen konfiguriert"])
+            return
+        rounds = int(self.nettester_config.config.get("dns_benchmark_rounds", "3"))
+        # start the benchmark
+        header = ["Resolver", "Fehl", "Med", "P95"]
+        self.show_results(self.nettester_net.dns_benchmark(resolvers, names, rounds),
+                          lambda rows: self.nettester_gui.format_table(header, rows))
+
+    # measure the throughput against the companion server
+    def test_throughput(self):
+        # update the display
+        self.nettester_gui.interface_text = "Durchsatz"
+        # hide the menu
+        self.toggle_menu()
+        server = self.nettester_config.config.get("throughput_server", "").strip()
+        if server == "":
+            self.nettester_gui.set_text(["Kein throughput_server konfiguriert",
+                                         "Auf dem Server starten:",
+                                         "python3 throughput_server.py"])
+            return
+        port = int(self.nettester_config.config.get("throughput_port", "5201"))
+        streams = int(self.nettester_config.config.get("throughput_streams", "4"))
+        duration = float(self.nettester_config.config.get("throughput_duration", "5"))
+        udp_rate = float(self.nettester_config.config.get("throughput_udp_rate", "10")) * 1e6
+        # start the test
+        self.show_results(self.nettester_net.throughput_test(server, port, streams, duration, udp_rate))
+
+    # compare the latency of an idle and a saturated link
+    def test_bufferbloat(self):
+        # update the display
+        self.nettester_gui.interface_text = "Bufferbloat"
+        # hide the menu
+        self.toggle_menu()
+        server = self.nettester_config.config.get("throughput_server", "").strip()
+        if server == "":
+            self.nettester_gui.set_text(["Kein throughput_server konfiguriert",
+                                         "Auf dem Server starten:",
+                                         "python3 throughput_server.py"])
+            return
+        # the latency is measured to the configured target or the first remote
+        remote = self.nettester_config.config.get("bufferbloat_target", "").strip()
+        if remote == "" and len(self.get_remotes()) > 0:
+            remote = self.get_remotes()[0]
+        port = int(self.nettester_config.config.get("throughput_port", "5201"))
+        streams = int(self.nettester_config.config.get("throughput_streams", "4"))
+        duration = float(self.nettester_config.config.get("bufferbloat_duration", "5"))
+        # start the test
+        header = ["Phase", "Verl", "Med", "P95", "+Med"]
+        self.show_results(self.nettester_net.bufferbloat_test(remote, server, port, streams, duration),
+                          lambda rows: self.nettester_gui.format_table(header, rows))
+
+    # show the route to a remote with the statistics of every hop
+    def trace_route(self):
+        # update the display
+        self.nettester_gui.interface_text = "Traceroute"
+        # hide the menu
+        self.toggle_menu()
+        # trace the route to the configured target or the first remote
+        remote = self.nettester_config.config.get("traceroute_target", "").strip()
+        if remote == "" and len(self.get_remotes()) > 0:
+            remote = self.get_remotes()[0]
+        rounds = int(self.nettester_config.config.get("traceroute_rounds", "10"))
+        # start the traceroute
+        header = ["Hop", "Verl", "Letzt", "Avg", "Best", "Wrst"]
+        self.show_results(self.nettester_net.traceroute(remote, rounds),
+                          lambda rows: self.nettester_gui.format_table(header, rows))
+
+    def scan_lan(self):
+        # update the display
+        self.nettester_gui.interface_text = "LAN-Scan " + self.nettester_net.current_interface
+        # hide the menu
+        self.toggle_menu()
+        rate = int(self.nettester_config.config.get("lan_scan_rate", "2000"))
+        # start the lan scan
+        self.show_results(self.nettester_net.lan_scan(rate, self.nettester_config.config.get("oui_file", "").strip()),
+                          lambda rows: self.nettester_gui.format_table(["IP", "MAC"], rows))
 
     # scroll the page down 
     def page_down(self):
@@ -254,10 +553,11 @@ class nettester:
     # toggle the menu
     def toggle_menu(self):
         self.nettester_gui.menu_open = not self.nettester_gui.menu_open
-        # stop the running background tasks
-        self.wifi_scan_in_progress = False
-        self.check_net_in_progress = False
-        self.custom_command_in_progress = False
+        self.shown_interface_version = None
+        # stop the background job whose results are shown
+        if self.active_task is not None and not self.active_task[2]:
+            self.active_task[0].cancel()
+        self.active_task = None
 
     # exit the programm and say bye
     def shutdown(self):
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,struct,random,select,time,threading,ipaddress
+from collections import OrderedDict
+
+# record types and classes we care about
+DNS_TYPE_A = 1
+DNS_TYPE_NS = 2
+DNS_TYPE_CNAME = 5
+DNS_TYPE_SOA = 6
+DNS_TYPE_PTR = 12
+DNS_TYPE_AAAA = 28
+DNS_CLASS_IN = 1
+
+# response codes
+DNS_RCODE_NOERROR = 0
+DNS_RCODE_NXDOMAIN = 3
+
+# seconds a result is cached if one of the address families wasn't answered in time
+MISSING_ANSWER_TTL = 30
+
+# encode a domain name into dns labels
+def encode_name(name):
+    encoded = b""
+    for label in name.strip(".").split("."):
+        if label == "":
+            continue
+        label = label.encode("idna")
+        if len(label) > 63:
+            raise ValueError("label too long: " + str(label))
+        encoded += struct.pack("!B", len(label)) + label
+    return encoded + b"\x00"
+
+# build a query packet with recursion desired
+def encode_query(name, qtype, query_id):
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    return header + encode_name(name) + struct.pack("!HH", qtype, DNS_CLASS_IN)
+
+# decode a possibly compressed domain name at the given offset and return it with the offset behind it
+def decode_name(packet, offset):
+    labels = []
+    # the offset behind the name, compression pointers don't count
+    end = None
+    # protect against pointer loops
+    jumps = 0
+    while True:
+        if offset >= len(packet):
+            raise ValueError("name exceeds packet")
+        length = packet[offset]
+        # a compression pointer to an earlier name
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3f) << 8) | packet[offset + 1]
+            jumps += 1
+            if jumps > 64:
+                raise ValueError("compression loop")
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(packet[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    return ".".join(labels), (offset if end is None else end)
+
+# decode the record data of the types we know, everything else is returned as bytes
+def decode_rdata(packet, offset, rtype, length):
+    data = packet[offset:offset + length]
+    if rtype == DNS_TYPE_A and length == 4:
+        return socket.inet_ntop(socket.AF_INET, data)
+    if rtype == DNS_TYPE_AAAA and length == 16:
+        return socket.inet_ntop(socket.AF_INET6, data)
+    if rtype in (DNS_TYPE_CNAME, DNS_TYPE_PTR, DNS_TYPE_NS):
+        return decode_name(packet, offset)[0]
+    if rtype == DNS_TYPE_SOA:
+        # only the minimum ttl is interesting, it's the last field
+        return struct.unpack("!I", data[-4:])[0] if length >= 4 else None
+    return data
+
+# decode a response packet. returns a dict with the id, the response code, the truncation flag and the
+# answer and authority records as (name, type, ttl, data) tuples
+def decode_response(packet):
+    if len(packet) < 12:
+        raise ValueError("packet too short")
+    query_id, flags, qdcount, ancount, nscount, arcount = struct.unpack("!HHHHHH", packet[:12])
+    offset = 12
+    # skip the questions
+    for _ in range(qdcount):
+        _, offset = decode_name(packet, offset)
+        offset += 4
+    sections = []
+    for count in (ancount, nscount):
+        records = []
+        for _ in range(count):
+            name, offset = decode_name(packet, offset)
+            rtype, rclass, ttl, length = struct.unpack("!HHIH", packet[offset:offset + 10])
+            offset += 10
+            if offset + length > len(packet):
+                raise ValueError("record exceeds packet")
+            records.append((name, rtype, ttl, decode_rdata(packet, offset, rtype, length)))
+            offset += length
+        sections.append(records)
+    return {
+        "id": query_id,
+        "response": bool(flags & 0x8000),
+        "truncated": bool(flags & 0x0200),
+        "rcode": flags & 0x000f,
+        "answers": sections[0],
+        "authority": sections[1],
+    }
+
+# return the name servers from resolv.conf
+def read_system_resolvers(path="/etc/resolv.conf"):
+    resolvers = []
+    try:
+        with open(path) as resolv_conf:
+            for line in resolv_conf:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    # strip the zone index of link local ipv6 servers
+                    resolvers.append(fields[1].split("%")[0])
+    except OSError:
+        pass
+    return resolvers
+
+# send the given queries to a name server from one socket at the same time. queries is a list of
+# (name, qtype). returns a list with a (decoded response or None, seconds from sending the query until
+# its answer) tuple for every query.
+# once the first answer arrived the others are only awaited for the resolution delay (happy eyeballs),
+# so a server that drops the aaaa queries doesn't stall every resolution for the whole timeout
+def dns_exchange(server, queries, timeout=2.0, resolution_delay=None, port=53):
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    results = [(None, None)] * len(queries)
+    try:
+        sock.setblocking(False)
+        sock.connect((server, port))
+        start = time.monotonic()
+        deadline = start + timeout
+        pending = {}
+        for index, (name, qtype) in enumerate(queries):
+            query_id = random.getrandbits(16)
+            while query_id in pending:
+                query_id = random.getrandbits(16)
+            sock.send(encode_query(name, qtype, query_id))
+            pending[query_id] = (index, time.monotonic())
+        while len(pending) > 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([sock], [], [], remaining)
+            if not readable:
+                break
+            try:
+                packet = sock.recv(4096)
+            except OSError:
+                # e.g. the server port is unreachable
+                break
+            received = time.monotonic()
+            try:
+                response = decode_response(packet)
+            except (ValueError, struct.error):
+                continue
+            if not response["response"] or response["id"] not in pending:
+                continue
+            index, sent = pending.pop(response["id"])
+            results[index] = (response, received - sent)
+            # don't wait much longer for the other answers
+            if resolution_delay is not None:
+                deadline = min(deadline, received + resolution_delay)
+    finally:
+        sock.close()
+    return results
+
+# a stub resolver that asks the a and aaaa records of a name at the same time and caches the answers
+# as long as their ttl allows. the least recently used names are evicted when the cache is full
+class dns_resolver:
+    def __init__(self, nameservers=None, cache_size=256, timeout=2.0, resolution_delay=0.05, port=53):
+        self.nameservers = nameservers if nameservers is not None else read_system_resolvers()
+        # the port of the name servers, which only differs for local test servers
+        self.port = port
+        self.cache_size = cache_size
+        self.timeout = timeout
+        # how long to wait for the second address family once the first one has been answered
+        self.resolution_delay = resolution_delay
+        # name -> (expiry timestamp, ipv4 addresses, ipv6 addresses)
+        self._cache = OrderedDict()
+        # address -> (expiry timestamp, name or None)
+        self._reverse_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # resolve a name. returns a dict with the ipv4 and ipv6 addresses, the time the resolution took
+    # in seconds and whether the answer came from the cache. use_cache=False measures a cold resolution
+    def resolve(self, name, use_cache=True):
+        key = name.lower().rstrip(".")
+        start = time.monotonic()
+        if use_cache:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] > start:
+                    self._cache.move_to_end(key)
+                    return {"ipv4": list(entry[1]), "ipv6": list(entry[2]),
+                            "time": time.monotonic() - start, "cached": True}
+
+        ipv4, ipv6, ttl = self._query(key)
+        if len(ipv4) == 0 and len(ipv6) == 0:
+            # names from /etc/hosts, mdns and the like are only known to the system resolver
+            ipv4, ipv6 = self._system_resolve(key)
+            ttl = None
+        elapsed = time.monotonic() - start
+
+        # a cold resolution replaces the cached entry as well
+        if ttl is not None and ttl > 0:
+            self._store(self._cache, key, (time.monotonic() + ttl, ipv4, ipv6))
+        return {"ipv4": ipv4, "ipv6": ipv6, "time": elapsed, "cached": False}
+
+    # look up the name of an address with a ptr query. returns None if it has no name. negative answers
+    # are cached as well, since most addresses along a route don't have a name
+    def reverse(self, address, use_cache=True):
+        now = time.monotonic()
+        if use_cache:
+            with self._lock:
+                entry = self._reverse_cache.get(address)
+                if entry is not None and entry[0] > now:
+                    self._reverse_cache.move_to_end(address)
+                    return entry[1]
+
+        name = None
+        ttl = None
+        query = ipaddress.ip_address(address).reverse_pointer
+        for server in self.nameservers:
+            try:
+                response, _ = dns_exchange(server, [(query, DNS_TYPE_PTR)], self.timeout,
+                                            port=self.port)[0]
+            except (OSError, ValueError):
+                continue
+            if response is None or response["rcode"] not in (DNS_RCODE_NOERROR, DNS_RCODE_NXDOMAIN):
+                continue
+            for _, rtype, record_ttl, data in response["answers"]:
+                if rtype == DNS_TYPE_PTR:
+                    name = data
+                    ttl = record_ttl
+                    break
+            if name is None:
+                # the soa record of the authority section limits how long the negative answer is valid
+                ttl = 60
+                for _, rtype, record_ttl, data in response["authority"]:
+                    if rtype == DNS_TYPE_SOA and data is not None:
+                        ttl = min(record_ttl, data)
+            break
+        if ttl is not None and ttl > 0:
+            self._store(self._reverse_cache, address, (time.monotonic() + ttl, name))
+        return name
+
+    # store an entry in a cache and evict the least recently used ones if it's full
+    def _store(self, cache, key, entry):
+        with self._lock:
+            cache[key] = entry
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    # forget all cached answers
+    def flush(self):
+        with self._lock:
+            self._cache.clear()
+            self._reverse_cache.clear()
+
+    # ask the configured name servers one after another until one of them answers
+    def _query(self, name):
+        for server in self.nameservers:
+            try:
+                results = dns_exchange(server, [(name, DNS_TYPE_A), (name, DNS_TYPE_AAAA)],
+                                       self.timeout, self.resolution_delay, self.port)
+            except (OSError, ValueError):
+                continue
+            answered = [response for response, _ in results if response is not None]
+            if len(answered) == 0:
+                continue
+            addresses = {DNS_TYPE_A: [], DNS_TYPE_AAAA: []}
+            ttls = []
+            for response in answered:
+                for record_name, rtype, ttl, data in response["answers"]:
+                    if rtype in addresses and data not in addresses[rtype]:
+                        addresses[rtype].append(data)
+                        ttls.append(ttl)
+            # the shortest ttl of all used records limits the lifetime of the cache entry. if one of the
+            # answers missed the resolution delay the missing family is only cached for a short time, so
+            # a server that drops the aaaa queries doesn't cost the delay on every check
+            if len(ttls) == 0:
+                return addresses[DNS_TYPE_A], addresses[DNS_TYPE_AAAA], None
+            if len(answered) < len(results):
+                return addresses[DNS_TYPE_A], addresses[DNS_TYPE_AAAA], min(ttls + [MISSING_ANSWER_TTL])
+            return addresses[DNS_TYPE_A], addresses[DNS_TYPE_AAAA], min(ttls)
+        return [], [], None
+
+    # resolve a name with getaddrinfo, which doesn't tell us any ttl
+    def _system_resolve(self, name):
+        ipv4 = []
+        ipv6 = []
+        try:
+            for family, _, _, _, address in socket.getaddrinfo(name, None, proto=socket.IPPROTO_TCP):
+                if family == socket.AF_INET and address[0] not in ipv4:
+                    ipv4.append(address[0])
+                elif family == socket.AF_INET6 and address[0] not in ipv6:
+                    ipv6.append(address[0])
+        except (socket.gaierror, UnicodeError):
+            pass
+        return ipv4, ipv6
+
+# the resolver shared by the whole program
+_default_resolver = None
+_default_resolver_lock = threading.Lock()
+
+def default_resolver():
+    global _default_resolver
+    with _default_resolver_lock:
+        if _default_resolver is None:
+            _default_resolver = dns_resolver()
+        return _default_resolver
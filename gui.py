@@ -4,13 +4,17 @@ import pygame
 import os
 import math
 import datetime
+from collections import OrderedDict
 from time import time
 from aspect_scale import aspect_scale
+from layout_helper import text_store, text_layout
 
+# posted by background threads to wake up the main loop when they have new results
+RESULTS_EVENT = pygame.USEREVENT + 1
 
 class gui:
     def __init__(self, display_resolution, fg_color, bg_color,
-                 scale_correction, cursor_visible):
+                 scale_correction, cursor_visible, alert_color="255,0,0"):
         # a fullscreen switch for debugging purposes
         self.fullscreen = True
         # the display resolution as a tuple
@@ -19,13 +23,33 @@ class gui:
         # colors for foreground and background
         self.fg_color = self.string_to_color(fg_color)
         self.bg_color = self.string_to_color(bg_color)
+        # the titlebar is filled with the alert color while a rule of the monitoring is firing
+        self.alert_color = self.string_to_color(alert_color)
+        self.alert = False
         # the window size if the program is not set for fullscreen
         self.window_size = (640, 480)
         # should the mouse cursor be visible?
         self.cursor_visible = True if cursor_visible == "1" else False
         # correction factor for text elements
         self.scale_correction = float(scale_correction)
-        self._textbox_text = ""
+        # the text of the textbox and its layout for the current size, see text_layout
+        self._textbox_text = text_store()
+        self._textbox_layout = None
+        self.pages = 0
+        # rendered lines of text by (text, color, antialiasing), the least recently used are dropped first
+        self._line_cache = OrderedDict()
+        self.line_cache_size = 256
+        # rendered pages of the textbox by page number. they are valid until the text or the size changes
+        self._page_cache = {}
+        # incremented whenever the text of the textbox changes
+        self._textbox_version = 0
+        # the icons as loaded from the resource files and scaled to the sizes used so far
+        self._icons = {}
+        self._scaled_icons = {}
+        # the composed menu and the layout it was composed for
+        self._menu_cache = None, None
+        # the painted elements of the screen, see update_display
+        self.invalidate_display()
         # size of the menubuttons will be calculated but should not be bigger than 200
         self.max_menu_icon_size = 200
         # variables for resource files
@@ -49,6 +73,11 @@ class gui:
         ]
         # the menu should be closed at first
         self.menu_open = True
+        # the clock limits the framerate while results are streaming in, the rest of the time the main
+        # loop sleeps until something happens
+        self.clock = pygame.time.Clock()
+        self.max_frame_rate = 30
+        self._wake_up_pending = False
         # start the gui
         pygame.init()
         self.init()
@@ -84,9 +113,37 @@ class gui:
     def get_events(self):
         return pygame.event.get()
 
-    # Tick the internal pygame clock to limit the framerate to 60fps
+    # wait up to timeout ms for events and return them all. returns an empty list after the timeout
+    def wait_events(self, timeout):
+        # the flag is cleared before the queue is read, so every later wake up posts a new event. if it
+        # was set, a wake up since the last call may have been skipped after its event had already been
+        # drained, so we only poll then. at worst this costs a spare cycle of the main loop
+        woken = self._wake_up_pending
+        self._wake_up_pending = False
+        if woken:
+            return pygame.event.get()
+        event = pygame.event.wait(max(1, int(timeout)))
+        return [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+
+    # wake up the main loop. may be called from any thread, events are only posted if the main loop
+    # hasn't been woken up already
+    def wake_up(self):
+        if self._wake_up_pending:
+            return
+        self._wake_up_pending = True
+        try:
+            pygame.event.post(pygame.event.Event(RESULTS_EVENT))
+        except pygame.error:
+            # the display has already been closed
+            self._wake_up_pending = False
+
+    # ms until the clock in the titlebar shows the next second. one ms more, so we don't wake up too early
+    def time_to_next_second(self):
+        return 1001 - datetime.datetime.now().microsecond // 1000
+
+    # Tick the internal pygame clock to limit the framerate
     def tick(self):
-        pygame.time.Clock().tick(60)
+        self.clock.tick(self.max_frame_rate)
 
     # set the window caption and the icon
     def set_window_details(self):
@@ -107,6 +164,9 @@ class gui:
 
         self.titlebar_size = self.display_size[0], int(
             self.titlebar_font_size * 1.5)
+        # position of the titlebar texts and width of its lines
+        self.titlebar_text_pos_y = int(self.titlebar_size[1] / 6)
+        self.titlebar_line_width = int(math.ceil(self.titlebar_size[1] / 100))
         # textbox can be as wide as the screen but must leave space for the
         # titlebar
         self.textbox_size = self.display_size[0], self.display_size[1] - \
@@ -133,24 +193,41 @@ class gui:
             paging_button_height
         )
 
-        # We want three buttons in a row and two rows of buttons, evenly spaced
-        menu_button_size_x = int(math.floor((self.textbox_size[0] / 3) * 0.9))
-        menu_button_size_y = int(math.floor((self.textbox_size[1] / 2) * 0.9))
+        # We want at least three buttons in a row and two rows of buttons, evenly spaced.
+        # if there are more buttons add columns and rows according to the aspect ratio of the textbox
+        button_count = max(len(self.menu_buttons), 6)
+        self.menu_columns = max(3, int(math.ceil(math.sqrt(
+            button_count * self.textbox_size[0] / self.textbox_size[1]))))
+        self.menu_rows = int(math.ceil(button_count / self.menu_columns))
+        menu_button_size_x = int(math.floor((self.textbox_size[0] / self.menu_columns) * 0.9))
+        menu_button_size_y = int(math.floor((self.textbox_size[1] / self.menu_rows) * 0.9))
         # pick the smaller size, so we don't oversize the buttons
         self.menu_button_size = min(menu_button_size_x, menu_button_size_y)
 
-        # We want three buttons in a row and two rows of buttons, evenly spaced
+        # spread the remaining space evenly between the buttons
         menu_button_padding_x = int(
-            (self.textbox_size[0] - (3 * self.menu_button_size)) / 4)
+            (self.textbox_size[0] - (self.menu_columns * self.menu_button_size)) / (self.menu_columns + 1))
         menu_button_padding_y = int(
-            (self.textbox_size[1] - (2 * self.menu_button_size)) / 3)
+            (self.textbox_size[1] - (self.menu_rows * self.menu_button_size)) / (self.menu_rows + 1))
         # pick the smaller size, so we don't oversize the buttons
         self.menu_button_padding = min(
-            menu_button_padding_y, menu_button_padding_y)
-        self.menu_icon_size = int(self.menu_button_size * 0.9)
+            menu_button_padding_x, menu_button_padding_y)
+        # the lower part of the button shows its caption
+        self.menu_caption_height = int(self.menu_button_size * 0.2)
+        self.menu_icon_size = self.menu_button_size - self.menu_caption_height
         # icons should look good, so don't oversize them
         if self.menu_icon_size > self.max_menu_icon_size:
             self.menu_icon_size = self.max_menu_icon_size
+        # the caption font must fit the longest caption into the button. freemono characters are
+        # about 0.6 times the font size wide
+        longest_caption = max([len(button["text"]) for button in self.menu_buttons] + [1])
+        self.menu_caption_font_size = max(1, min(self.menu_caption_height,
+                                                 int(self.menu_button_size * 0.95 / (longest_caption * 0.6))))
+        # everything on the screen has to be painted again with the new sizes
+        self.invalidate_display()
+        # scale the icons now instead of on the first paint of the menu
+        for button in self.menu_buttons:
+            self.get_icon(button["icon"], self.menu_icon_size)
 
     def create_fonts(self):
         # create a font object for titlebar and textbox text
@@ -158,9 +235,59 @@ class gui:
             self.resource_path, self.basefont), self.titlebar_font_size)
         self.text_font = pygame.font.Font(os.path.join(
             self.resource_path, self.basefont), self.text_font_size)
+        self.menu_caption_font = pygame.font.Font(os.path.join(
+            self.resource_path, self.basefont), self.menu_caption_font_size)
         # enable or disable font antialiasing
         if self.text_font_size < self.alias_threshold:
             self.font_antialiased = False
+        # measure the text font once. the width of an M is the width of every character of a monospaced font
+        self.text_em_width = self.text_font.size("M")[0]
+        self.text_line_height = self.text_font.get_linesize()
+        # everything rendered with the old font is invalid now
+        self._line_cache.clear()
+        self._page_cache.clear()
+        self.create_glyph_atlas()
+
+    # render the characters used for wrapped lines once into a single surface, so wrapped lines can be
+    # assembled by blitting parts of it instead of rendering every character on every frame
+    def create_glyph_atlas(self):
+        characters = [chr(code) for code in range(32, 127)] + [chr(code) for code in range(160, 256)]
+        # characters without width like the soft hyphen can't be rendered
+        characters = [char for char in characters if self.text_font.size(char)[0] > 0] + ["⏎"]
+        glyphs = [self.text_font.render(char, self.font_antialiased, self.fg_color).convert_alpha()
+                  for char in characters]
+        self.glyph_atlas = pygame.Surface((sum(glyph.get_width() for glyph in glyphs),
+                                           max(glyph.get_height() for glyph in glyphs)), pygame.SRCALPHA, 32)
+        # the position of every character inside the atlas
+        self.glyph_rects = {}
+        glyph_pos_x = 0
+        for char, glyph in zip(characters, glyphs):
+            # copy the pixels including their alpha instead of blending them onto the empty atlas
+            self.glyph_atlas.blit(glyph, (glyph_pos_x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            self.glyph_rects[char] = pygame.Rect(glyph_pos_x, 0, glyph.get_width(), glyph.get_height())
+            glyph_pos_x += glyph.get_width()
+        # the wrapping sign at the start of a continued line points the other way
+        self.wrap_sign_flipped = pygame.transform.flip(glyphs[-1], 1, 0)
+
+    # paint a character from the atlas onto a surface. characters missing in the atlas are rendered and
+    # added to the line cache
+    def blit_glyph(self, surface, char, position):
+        if char in self.glyph_rects:
+            surface.blit(self.glyph_atlas, position, self.glyph_rects[char])
+        elif self.text_font.size(char)[0] > 0:
+            surface.blit(self.render_line(char), position)
+
+    # return a rendered line of text. the surfaces are cached, since most lines stay the same for a long time
+    def render_line(self, text):
+        key = (text, tuple(self.fg_color), self.font_antialiased)
+        if key in self._line_cache:
+            self._line_cache.move_to_end(key)
+            return self._line_cache[key]
+        text_surface = self.text_font.render(text, self.font_antialiased, self.fg_color)
+        self._line_cache[key] = text_surface
+        if len(self._line_cache) > self.line_cache_size:
+            self._line_cache.popitem(last=False)
+        return text_surface
 
     # show splash screen to better the user experience
     def show_splash_screen(self):
@@ -183,25 +310,23 @@ class gui:
         self.display_surface.blit(splash_logo, splash_logo_position)
         pygame.display.flip()
 
-    def render_titlebar(self):
+    # the titlebar consists of several elements, so a new second only repaints the clock
+    def render_titlebar_border(self):
         # create an empty surface for the titlebar
         surface = pygame.Surface(self.titlebar_size, pygame.SRCALPHA, 32)
-        # titlebars position will always be 0,0
-        position = (0, 0)
+        if self.alert:
+            surface.fill(self.alert_color)
 
         # calculate border for titlebar
         line_start = (0, self.titlebar_size[1]-1)
         line_end = (self.titlebar_size[0], self.titlebar_size[1]-1)
-        line_width = int(math.ceil(self.titlebar_size[1] / 100))
         # paint the bottom border
         pygame.draw.line(surface, self.fg_color,
-                         line_start, line_end, line_width)
-
-        # calculate the text position
-        text_pos_y = int(self.titlebar_size[1] / 6)
+                         line_start, line_end, self.titlebar_line_width)
+        # titlebars position will always be 0,0
+        return surface, (0, 0)
 
-        # get current time
-        time = str(datetime.datetime.now().strftime("%H:%M:%S"))
+    def render_clock(self, time):
         # create the text_surface
         time_text_surface = self.titlebar_font.render(time,
                                                       self.font_antialiased,
@@ -209,9 +334,12 @@ class gui:
         # calculate the text position
         time_text_surface_length = time_text_surface.get_rect()[2]
         time_text_pos_x = self.titlebar_size[0] - time_text_surface_length
+        return time_text_surface, (time_text_pos_x, self.titlebar_text_pos_y)
 
-        # blit it to the titlebar surface
-        surface.blit(time_text_surface, (time_text_pos_x, text_pos_y))
+    def render_titlebar_buttons(self):
+        # create an empty surface for the buttons
+        surface = pygame.Surface(self.titlebar_size, pygame.SRCALPHA, 32)
+        text_pos_y = self.titlebar_text_pos_y
         # the first button should be at 0
         button_pos_x = 0
         # iterate through all buttons
@@ -237,10 +365,12 @@ class gui:
             line_end = (button_size[0], button_size[1] + (text_pos_y * 2))
             # draw the line
             pygame.draw.line(surface, self.fg_color,
-                             line_start, line_end, line_width)
+                             line_start, line_end, self.titlebar_line_width)
             # add the button size with some padding to the button position
             button_pos_x += (button_size[0]*1.1)
+        return surface, (0, 0)
 
+    def render_interface_text(self):
         # create the text of the interface text in the title
         interface_text_surface = self.titlebar_font.render(self.interface_text,
                                                            self.font_antialiased,
@@ -248,15 +378,27 @@ class gui:
         # get the length of the surface
         interface_text_surface_length = interface_text_surface.get_rect()[2]
         # calculate the position of the interface text so it is centered
-        interface_text_pos_x = (
-            self.titlebar_size[0] - interface_text_surface_length) / 2
-        # paint it to the titlebar surface
-        surface.blit(interface_text_surface,
-                     (interface_text_pos_x, text_pos_y))
-        # return the titlebar and its position
-        return surface, position
+        interface_text_pos_x = int((
+            self.titlebar_size[0] - interface_text_surface_length) / 2)
+        return interface_text_surface, (interface_text_pos_x, self.titlebar_text_pos_y)
+
+    # return an icon of the resource path in the given size. every file is only loaded and converted to
+    # the pixel format of the display once and every size is only scaled once
+    def get_icon(self, name, size):
+        if (name, size) not in self._scaled_icons:
+            if name not in self._icons:
+                self._icons[name] = pygame.image.load(os.path.join(
+                    self.resource_path, name)).convert_alpha()
+            self._scaled_icons[(name, size)] = pygame.transform.smoothscale(self._icons[name], (size, size))
+        return self._scaled_icons[(name, size)]
 
     def render_menu(self):
+        # the menu only changes with its buttons, sizes and colors
+        layout = (tuple((button["icon"], button["text"]) for button in self.menu_buttons),
+                  self.textbox_size, self.menu_button_size, self.menu_icon_size, self.menu_button_padding,
+                  self.menu_columns, self.menu_caption_font_size, tuple(self.fg_color), tuple(self.bg_color))
+        if self._menu_cache[0] == layout:
+            return self._menu_cache[1], self.menu_position
         # create an empty surface for the menu
         menu_surface = pygame.Surface(self.textbox_size, pygame.SRCALPHA, 32)
         # set the initial button position
@@ -274,17 +416,23 @@ class gui:
             # paint the background
             pygame.draw.rect(button_surface, self.fg_color, border_rect, 0)
 
-            # load the button icon
-            icon = pygame.image.load(os.path.join(
-                self.resource_path, button["icon"]))
-            # scale the icon
-            icon = pygame.transform.smoothscale(icon, (self.menu_icon_size,
-                                                       self.menu_icon_size))
-            # calculate the icon position so it is centered
-            icon_pos = (self.menu_button_size / 2) - (self.menu_icon_size / 2)
+            # get the scaled button icon
+            icon = self.get_icon(button["icon"], self.menu_icon_size)
+            # calculate the icon position so it is centered above the caption
+            icon_pos_x = (self.menu_button_size / 2) - (self.menu_icon_size / 2)
+            icon_pos_y = (self.menu_button_size - self.menu_caption_height) / 2 - (self.menu_icon_size / 2)
 
             # paint the icon onto the button surface
-            button_surface.blit(icon, (icon_pos, icon_pos))
+            button_surface.blit(icon, (icon_pos_x, icon_pos_y))
+
+            # paint the caption centered at the bottom of the button
+            caption_surface = self.menu_caption_font.render(button["text"],
+                                                            self.font_antialiased,
+                                                            self.bg_color)
+            caption_pos_x = (self.menu_button_size - caption_surface.get_width()) / 2
+            caption_pos_y = self.menu_button_size - self.menu_caption_height + \
+                (self.menu_caption_height - caption_surface.get_height()) / 2
+            button_surface.blit(caption_surface, (caption_pos_x, caption_pos_y))
 
             # paint the button onto the icon surface
             menu_surface.blit(button_surface, (button_pos_x, button_pos_y))
@@ -301,14 +449,20 @@ class gui:
             button_pos_x += self.menu_button_size + self.menu_button_padding
             # increment the button counter
             button_count += 1
-            # wrap around if the button counter has reached 3
-            if button_count == 3:
+            # wrap around if the row is full
+            if button_count % self.menu_columns == 0:
                 button_pos_x = self.menu_button_padding
                 button_pos_y += self.menu_button_size + self.menu_button_padding
 
+        self._menu_cache = layout, menu_surface
         # return the titlebar and its position
         return menu_surface, self.menu_position
 
+    # recalculate the menu layout after buttons have been added or removed
+    def update_menu(self):
+        self.calculate_sizes()
+        self.create_fonts()
+
     # reinitialize display and recalculate all relevant sizes
 
     def display_resize(self):
@@ -325,118 +479,193 @@ class gui:
         self.calculate_sizes()
         self.create_fonts()
 
-    # refresh the display
+    # forget all painted elements, so the next update paints the whole screen
+    def invalidate_display(self):
+        self._elements = {}
+        self._full_redraw = True
+
+    # refresh the display. every element of the screen keeps its surface together with a key describing
+    # its content. only elements whose key changed are rendered again and only the screen areas they
+    # covered before and cover now are painted and sent to the display
     def update_display(self):
-        # paint the background color
-        self.display_surface.fill(self.bg_color)
-        # create a list of all known surfaces
-        element_surfaces = []
-        # append the titlebar to the surfaces
-        element_surfaces.append(self.render_titlebar())
+        # the elements in painting order as name, key and render function
+        elements = [
+            ("titlebar", (self.titlebar_size, self.alert), self.render_titlebar_border),
+            ("titlebar_buttons", tuple(button["text"] for button in self.titlebar_buttons),
+             self.render_titlebar_buttons),
+            ("interface_text", self.interface_text, self.render_interface_text),
+        ]
+        # get current time
+        time = str(datetime.datetime.now().strftime("%H:%M:%S"))
+        elements.append(("clock", time, lambda: self.render_clock(time)))
         # if the menu is open render the menu, otherwise show the textbox
         if (self.menu_open):
-            element_surfaces.append(self.render_menu())
+            elements.append(("content", ("menu", tuple(button["text"] for button in self.menu_buttons)),
+                             self.render_menu))
         else:
-            element_surfaces.append(self.render_textbox())
-        # paint all surfaces
-        self.compose_image(element_surfaces)
-
-    # assemble all surfaces and paint them onto the screen
-    def compose_image(self, surfaces):
-        # iterate all surfaces and paint them
-        for surface in surfaces:
-            image = surface[0]
-            image_pos_x = surface[1][0]
-            image_pos_y = surface[1][1]
-            self.display_surface.blit(image, (image_pos_x, image_pos_y))
-        # flip the screen for a refreh
-        pygame.display.flip()
+            elements.append(("content", ("textbox", self._textbox_version, self.textbox_current_page),
+                             self.render_textbox))
+
+        dirty_rects = []
+        for name, key, render in elements:
+            element = self._elements.get(name)
+            if element is not None and element["key"] == key:
+                continue
+            # the area of the old content has to be repainted as well
+            if element is not None:
+                dirty_rects.append(element["rect"])
+            surface, position = render()
+            # only the visible part of the surface needs to be painted
+            bounds = surface.get_bounding_rect()
+            rect = bounds.move(int(position[0]), int(position[1]))
+            self._elements[name] = {
+                "key": key,
+                "surface": surface.subsurface(bounds),
+                "rect": rect,
+            }
+            dirty_rects.append(rect)
+
+        if self._full_redraw:
+            dirty_rects = [self.display_surface.get_rect()]
+        dirty_rects = [rect for rect in dirty_rects if rect.width > 0 and rect.height > 0]
+        if len(dirty_rects) == 0:
+            return
+        # paint the background and all elements in the dirty areas
+        self.compose_image([(element["surface"], element["rect"].topleft) for element in
+                            [self._elements[name] for name, _, _ in elements]], dirty_rects)
+
+    # assemble all surfaces and paint them onto the screen inside the given areas
+    def compose_image(self, surfaces, rects):
+        for rect in rects:
+            self.display_surface.set_clip(rect)
+            # paint the background color
+            self.display_surface.fill(self.bg_color)
+            # iterate all surfaces and paint them
+            for surface in surfaces:
+                image = surface[0]
+                image_pos_x = surface[1][0]
+                image_pos_y = surface[1][1]
+                self.display_surface.blit(image, (image_pos_x, image_pos_y))
+        self.display_surface.set_clip(None)
+        # send the changed areas to the screen
+        if self._full_redraw:
+            pygame.display.flip()
+            self._full_redraw = False
+        else:
+            pygame.display.update(rects)
 
     # end
     def quit():
         # cleanly deactivate the pygame instance
         pygame.quit()
 
-    def set_text(self, text):
-            # update the textbox contents and reset the page so that a refresh will paint the first page
-        self._textbox_text = text
-        self.textbox_current_page = 0
+    def set_text(self, text, keep_page=False):
+            # update the textbox contents and reset the page so that a refresh will paint the first page,
+        # unless the text is an update of the shown one
+        store = text_store(text)
+        # the layout and the rendered pages stay valid as long as the text doesn't change
+        if store.digest != self._textbox_text.digest:
+            self._textbox_text.close()
+            self._textbox_text = store
+            self._textbox_layout = None
+            self._page_cache.clear()
+            self._textbox_version += 1
+        else:
+            store.close()
+        if not keep_page:
+            self.textbox_current_page = 0
+
+    # return the layout of the text for the current size of the textbox. it is only wrapped again when the
+    # text or the size has changed
+    def textbox_layout(self):
+        # calculate the available space in characters horizontally and vertically
+        char_count_v = math.floor((self.textbox_size[0]) / self.text_em_width)
+        char_count_h = math.floor((self.textbox_size[1]) / self.text_line_height)
+        if self._textbox_layout is None or self._textbox_layout.size != (char_count_v, char_count_h):
+            self._textbox_layout = text_layout(self._textbox_text, char_count_v, char_count_h)
+        return self._textbox_layout
+
+    # show rows of values as a table with aligned columns. the first column is left aligned and
+    # shortened if the table would be wider than the textbox, all others are right aligned.
+    # rows with less columns than the header (e.g. error messages) don't influence the column widths
+    def set_table(self, header, rows):
+        self.set_text(self.format_table(header, rows))
+
+    def format_table(self, header, rows):
+        rows = [header] + rows
+        column_count = len(header)
+        widths = [0] * column_count
+        for row in rows:
+            for column, value in enumerate(row):
+                if column == 0 or len(row) == column_count:
+                    widths[column] = max(widths[column], len(str(value)))
+        # shorten the first column so the table fits the width of the textbox
+        available = math.floor(self.textbox_size[0] / self.text_em_width) - 1
+        widths[0] = max(4, min(widths[0], available - sum(width + 1 for width in widths[1:])))
+        text = []
+        for row in rows:
+            line = str(row[0])[:widths[0]].ljust(widths[0])
+            if len(row) == column_count:
+                for column, value in enumerate(row[1:], 1):
+                    line += " " + str(value).rjust(widths[column])
+            else:
+                line += " " + " ".join(str(value) for value in row[1:])
+            text.append(line.rstrip())
+        return text
 
     # render the textbox contents as surfaces. split lines if they are too long
     def render_textbox(self):
-        # create a surface for the textbox
-        surface = pygame.Surface(self.textbox_size, pygame.SRCALPHA, 32)
-        # render an M as a measurement for the width of the characters. only works for monospaced fonts
-        em_width = self.text_font.size("M")[0]
-        # get the line height
-        line_height = self.text_font.get_linesize()
-
-        # calculate the available space in characters horizontally and vertically
-        char_count_v = math.floor((self.textbox_size[0]) / em_width)
-        char_count_h = math.floor((self.textbox_size[1]) / line_height)
+        layout = self.textbox_layout()
         # how many pages do we need to display the entire text
-        self.pages = math.floor(len(self._textbox_text) / char_count_h)
+        self.pages = layout.pages
+        # an updated text can be shorter than the page that was shown
+        if self.textbox_current_page > self.pages:
+            self.textbox_current_page = self.pages
+
+        # reuse the page if it has been rendered before
+        if self.textbox_current_page in self._page_cache:
+            return self._page_cache[self.textbox_current_page], self.textbox_position
 
-        # calculate at which line the text should start
-        start_line = char_count_h * self.textbox_current_page
+        # create a surface for the textbox
+        surface = pygame.Surface(self.textbox_size, pygame.SRCALPHA, 32)
+        em_width = self.text_em_width
+        line_height = self.text_line_height
 
         # this stores the y-coordinates of the current line
         current_text_pos = 0
-        # relative lines inside the page
-        line_count = 0
-        for line_num, line in enumerate(self._textbox_text):
-            # skip all lines that don't need to be rendered
-            if(line_num < start_line):
-                continue
-            # start wrapping the line if it's too long for the display
-            if len(line) >= char_count_v:
-                # this stores the x-coordinates of the character to be drawn and char_counter stores the amount of characters already drawn
-                char_pos = char_counter = 0
-                # walk all characters
-                for char in line:
-                    # create an emptpy surface for this character.
-                    char_surf = self.text_font.render(
-                        char, self.font_antialiased, self.fg_color)
-                    # paint the character onto the surface
-                    surface.blit(char_surf, (char_pos, current_text_pos))
-                    # move the position one char right
+        for text, continued, wrapped in layout.page(self.textbox_current_page):
+            if continued or wrapped:
+                # this stores the x-coordinates of the character to be drawn
+                char_pos = 0
+                # paint the flipped wrap sign at x-pos 0 of a continued line
+                if continued:
+                    surface.blit(self.wrap_sign_flipped, (0, current_text_pos))
+                    char_pos = em_width
+                # paint the characters from the atlas onto the surface
+                for char in text:
+                    self.blit_glyph(surface, char, (char_pos, current_text_pos))
                     char_pos = char_pos + em_width
-                    # increment the amount of written characters
-                    char_counter += 1
-                    # if the line is full add a wrapping sign
-                    if char_counter == (char_count_v - 1):
-                        # create a surface for the wrapping char
-                        char_surf = self.text_font.render(
-                            "⏎", self.font_antialiased, self.fg_color)
-                        # paint the character onto the surface
-                        surface.blit(char_surf, (char_pos, current_text_pos))
-                        # increment the line position one line
-                        current_text_pos += line_height
-                        # flip the wrap sign for the next line
-                        char_surf = pygame.transform.flip(char_surf, 1, 0)
-                        # paint the character onto the surface at x-pos 0
-                        surface.blit(char_surf, (0, current_text_pos))
-                        # set the character position and counter to 1 char
-                        char_pos = 1
-                        char_pos = em_width
-                        # increase the line counter
-                        line_count += 1
+                # if more characters follow add a wrapping sign
+                if wrapped:
+                    self.blit_glyph(surface, "⏎", (char_pos, current_text_pos))
             # if the line fits just paint it as a surface
             else:
-                # create an emptpy surface for this line.
-                text_surf = self.text_font.render(
-                    line, self.font_antialiased, self.fg_color)
-                # paint the line onto the surface
-                surface.blit(text_surf, (0, current_text_pos))
-            # increase the line position and counter because we painted at least one line
+                # paint the cached line onto the surface
+                surface.blit(self.render_line(text), (0, current_text_pos))
             current_text_pos = current_text_pos + line_height
-            line_count += 1
-            # break out of the for loop when the screen is full
-            if line_count == char_count_h:
-                break
+        self._page_cache[self.textbox_current_page] = surface
         # return the painted surface and it's position
         return surface, self.textbox_position
 
+    # is the last page of the text shown?
+    def is_last_page(self):
+        return self.textbox_current_page >= self.textbox_layout().pages
+
+    # show the last page of the text, e.g. to follow output that is still growing
+    def show_last_page(self):
+        self.pages = self.textbox_layout().pages
+        self.textbox_current_page = self.pages
+
     # trigger a page scroll inside the textbox
     def scroll_textbox(self, direction=False):
         # True equals up, False equals down
@@ -448,6 +677,7 @@ class gui:
         if self.textbox_current_page < 0:
             self.textbox_current_page = 0
         # There is a limit to the pages
+        self.pages = self.textbox_layout().pages
         if self.textbox_current_page > self.pages:
             self.textbox_current_page = self.pages
 
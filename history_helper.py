@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import sqlite3,threading,queue,time,os
+
+# the rollups by their bucket size in seconds and the raw samples, which have a resolution of a second
+ROLLUPS = (60, 3600)
+# the resolutions a range query can use, see history_store.query
+RESOLUTIONS = (1,) + ROLLUPS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    time REAL NOT NULL, kind TEXT NOT NULL, interface TEXT NOT NULL, target TEXT NOT NULL,
+    rtt REAL, loss REAL, value REAL);
+CREATE INDEX IF NOT EXISTS samples_target ON samples (kind, target, time);
+CREATE INDEX IF NOT EXISTS samples_time ON samples (time);
+"""
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{size} (
+    bucket INTEGER NOT NULL, kind TEXT NOT NULL, interface TEXT NOT NULL, target TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rtt_count INTEGER NOT NULL, rtt_sum REAL NOT NULL, rtt_min REAL, rtt_max REAL,
+    loss_count INTEGER NOT NULL, loss_sum REAL NOT NULL,
+    value_count INTEGER NOT NULL, value_sum REAL NOT NULL, value_min REAL, value_max REAL,
+    PRIMARY KEY (kind, target, interface, bucket)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollup_{size}_bucket ON rollup_{size} (bucket);
+"""
+# add a sample to the bucket it falls into, min and max ignore missing values
+ROLLUP_UPSERT = """
+INSERT INTO rollup_{size} VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (kind, target, interface, bucket) DO UPDATE SET
+    count = count + 1,
+    rtt_count = rtt_count + excluded.rtt_count, rtt_sum = rtt_sum + excluded.rtt_sum,
+    rtt_min = min(coalesce(rtt_min, excluded.rtt_min), coalesce(excluded.rtt_min, rtt_min)),
+    rtt_max = max(coalesce(rtt_max, excluded.rtt_max), coalesce(excluded.rtt_max, rtt_max)),
+    loss_count = loss_count + excluded.loss_count, loss_sum = loss_sum + excluded.loss_sum,
+    value_count = value_count + excluded.value_count, value_sum = value_sum + excluded.value_sum,
+    value_min = min(coalesce(value_min, excluded.value_min), coalesce(excluded.value_min, value_min)),
+    value_max = max(coalesce(value_max, excluded.value_max), coalesce(excluded.value_max, value_max))
+"""
+
+# a persistent history of the probe results in sqlite. every sample has a kind (e.g. latency), the
+# interface, a target and optionally an rtt in ms, a loss between 0 and 1 and a value (e.g. a signal).
+# the samples are written in batches by a thread of their own and rolled up into buckets of a minute
+# and an hour at the same time. old samples and rollups are deleted after their retention in seconds,
+# so the file doesn't grow without bounds
+class history_store:
+    def __init__(self, path, retention=(86400, 14 * 86400, 365 * 86400), batch_interval=5.0,
+                 batch_size=1000):
+        self.path = path
+        # retention of the raw samples, the minute and the hour rollups
+        self.retention = dict(zip(RESOLUTIONS, retention))
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        # create the tables before anybody reads them
+        connection = self._connect()
+        # the space of deleted rows is given back to the file system by prune
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.executescript(SCHEMA + "".join(ROLLUP_SCHEMA.format(size=size) for size in ROLLUPS))
+        connection.execute("PRAGMA journal_mode = WAL")
+        self._writer = threading.Thread(target=self._write, name="history", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        # with the write ahead log an fsync on every batch isn't needed for a consistent file
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    # a connection for the reading thread. sqlite connections can't be shared between threads
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # add a sample. it is written with the next batch
+    def add(self, kind, interface, target, rtt=None, loss=None, value=None, timestamp=None):
+        self._queue.put((time.time() if timestamp is None else timestamp, kind, interface or "", str(target),
+                         rtt, loss, value))
+
+    # write all samples that have been added and stop the writer
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write(self):
+        connection = self._connect()
+        last_prune = 0
+        running = True
+        while running:
+            # wait for the first sample and collect everything that arrives until the batch is due
+            samples = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.batch_interval
+            while item is not None:
+                samples.append(item)
+                if len(samples) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            running = item is not None
+            # a failed batch (e.g. a full disk or a database locked for too long) is dropped, so the
+            # writer keeps going and the queue doesn't grow without limit
+            try:
+                if len(samples) > 0:
+                    self._insert(connection, samples)
+                if time.monotonic() - last_prune > 60 or not running:
+                    last_prune = time.monotonic()
+                    self.prune(connection)
+            except sqlite3.Error as exc:
+                print("Writing the history failed, " + str(len(samples)) + " samples dropped")
+                print(exc)
+        connection.close()
+
+    def _insert(self, connection, samples):
+        with connection:
+            connection.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)", samples)
+            for size in ROLLUPS:
+                connection.executemany(ROLLUP_UPSERT.format(size=size), [
+                    (int(timestamp // size) * size, kind, interface, target,
+                     0 if rtt is None else 1, rtt or 0.0, rtt, rtt,
+                     0 if loss is None else 1, loss or 0.0,
+                     0 if value is None else 1, value or 0.0, value, value)
+                    for timestamp, kind, interface, target, rtt, loss, value in samples])
+
+    # delete the samples and rollups that are older than their retention
+    def prune(self, connection=None):
+        connection = connection or self._reader()
+        now = time.time()
+        with connection:
+            connection.execute("DELETE FROM samples WHERE time < ?", (now - self.retention[1],))
+            for size in ROLLUPS:
+                connection.execute("DELETE FROM rollup_%d WHERE bucket < ?" % size, (now - self.retention[size],))
+        # the pragma frees one page per step. execute only steps statements without result columns once,
+        # executescript runs them to the end
+        connection.executescript("PRAGMA incremental_vacuum;")
+
+    # return the resolution to use for a time range, so a chart gets at most about max_points points
+    @staticmethod
+    def resolution_for(start, end, max_points=500):
+        for resolution in RESOLUTIONS:
+            if (end - start) / resolution <= max_points:
+                return resolution
+        return RESOLUTIONS[-1]
+
+    # return the samples of a target between start and end as a list of (time, count, average rtt,
+    # minimum rtt, maximum rtt, average loss, average value), averaged into buckets of resolution
+    # seconds. the resolution defaults to one that gives a reasonable number of points for a chart
+    def query(self, kind, target, start, end=None, resolution=None):
+        end = time.time() if end is None else end
+        resolution = resolution or self.resolution_for(start, end)
+        connection = self._reader()
+        if resolution == 1:
+            return connection.execute(
+                "SELECT time, 1, rtt, rtt, rtt, loss, value FROM samples "
+                "WHERE kind = ? AND target = ? AND time >= ? AND time < ? ORDER BY time",
+                (kind, str(target), start, end)).fetchall()
+        return connection.execute(
+            "SELECT bucket, sum(count), sum(rtt_sum) / nullif(sum(rtt_count), 0), min(rtt_min), max(rtt_max), "
+            "sum(loss_sum) / nullif(sum(loss_count), 0), sum(value_sum) / nullif(sum(value_count), 0) "
+            "FROM rollup_%d WHERE kind = ? AND target = ? AND bucket >= ? AND bucket < ? "
+            "GROUP BY bucket ORDER BY bucket" % resolution,
+            (kind, str(target), int(start // resolution) * resolution, end)).fetchall()
+
+    # return a summary of every kind and target since the given time from the minute rollups as a list
+    # of (kind, target, count, average rtt, maximum rtt, average loss, average value)
+    def summary(self, since):
+        return self._reader().execute(
+            "SELECT kind, target, sum(count), sum(rtt_sum) / nullif(sum(rtt_count), 0), max(rtt_max), "
+            "sum(loss_sum) / nullif(sum(loss_count), 0), sum(value_sum) / nullif(sum(value_count), 0) "
+            "FROM rollup_60 WHERE bucket >= ? GROUP BY kind, target ORDER BY kind, target",
+            (int(since // 60) * 60,)).fetchall()
+
+# the directory for the files kept between runs. the headless daemon uses the system wide directory if
+# it runs as root, everything else the state directory of the user
+def state_directory(system=False):
+    if system and os.geteuid() == 0:
+        return "/var/lib/ct-net-tester"
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(base, "ct-net-tester")
+
+# open the history store configured in the nettester segment of the config file or return None if the
+# history is disabled. a relative path is relative to the state directory, not to the working directory
+def open_history(settings, system=False):
+    path = settings.get("history_file", "history.db")
+    if path == "":
+        return None
+    path = os.path.join(state_directory(system), os.path.expanduser(path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return history_store(path, (float(settings.get("history_raw_hours", "24")) * 3600,
+                                float(settings.get("history_minute_days", "14")) * 86400,
+                                float(settings.get("history_hour_days", "365")) * 86400))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,ssl,time
+
+# the largest response body we read to keep a connection reusable. bigger bodies close the connection
+MAX_BODY_SIZE = 1024 * 1024
+
+# connect to a tcp port and return the duration of the handshake in seconds. a refused connection
+# raises ConnectionRefusedError, which still proves the host is reachable
+def tcp_connect(ip, port, timeout=3.0):
+    start = time.monotonic()
+    sock = socket.create_connection((ip, port), timeout=timeout)
+    elapsed = time.monotonic() - start
+    sock.close()
+    return elapsed
+
+# read from the socket until the buffer contains the given separator
+def _read_until(sock, buffer, separator, limit=65536):
+    while separator not in buffer:
+        if len(buffer) > limit:
+            raise ValueError("response header too long")
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError("connection closed by remote")
+        buffer += data
+    return buffer
+
+# read a complete http response. returns the status code and whether the connection can be reused
+def _read_response(sock, buffer):
+    buffer = _read_until(sock, buffer, b"\r\n\r\n")
+    header, buffer = buffer.split(b"\r\n\r\n", 1)
+    lines = header.decode("iso-8859-1").split("\r\n")
+    status_line = lines[0].split(" ", 2)
+    if len(status_line) < 2 or not status_line[0].startswith("HTTP/"):
+        raise ValueError("no http response")
+    status = int(status_line[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    reusable = headers.get("connection") != "close" and status_line[0] != "HTTP/1.0"
+
+    # read the body, so the next request can be sent over the same connection
+    if "chunked" in headers.get("transfer-encoding", ""):
+        size = 0
+        while True:
+            buffer = _read_until(sock, buffer, b"\r\n")
+            line, buffer = buffer.split(b"\r\n", 1)
+            chunk_size = int(line.split(b";")[0], 16)
+            size += chunk_size
+            if size > MAX_BODY_SIZE:
+                return status, False
+            # the chunk is followed by a line break
+            while len(buffer) < chunk_size + 2:
+                data = sock.recv(65536)
+                if not data:
+                    raise ConnectionError("connection closed by remote")
+                buffer += data
+            buffer = buffer[chunk_size + 2:]
+            if chunk_size == 0:
+                # we don't expect trailers, the last chunk ends the body
+                return status, reusable
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > MAX_BODY_SIZE:
+            return status, False
+        while len(buffer) < length:
+            data = sock.recv(65536)
+            if not data:
+                raise ConnectionError("connection closed by remote")
+            buffer += data
+        return status, reusable
+    # without a length the body ends when the connection is closed
+    return status, False
+
+# request a url several times and measure the single steps. the first sample opens a new connection
+# (cold), the following ones reuse it as long as the server keeps it alive (warm). returns a dict for
+# every sample with the tcp handshake, tls handshake and time to first byte in seconds (None if the step
+# wasn't necessary), the http status, whether the connection was reused and an error message
+def http_probe(host, ip, port, use_tls, path="/", samples=1, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    context = ssl.create_default_context() if use_tls else None
+    request = ("GET " + path + " HTTP/1.1\r\n"
+               "Host: " + (host if ":" not in host else "[" + host + "]") + "\r\n"
+               "User-Agent: ct-net-tester\r\n"
+               "Accept: */*\r\n"
+               "Connection: keep-alive\r\n\r\n").encode("iso-8859-1")
+    results = []
+    sock = None
+    try:
+        for _ in range(samples):
+            result = {"tcp": None, "tls": None, "ttfb": None, "status": None, "reused": False, "error": None}
+            results.append(result)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                result["error"] = "Zeitüberschreitung"
+                break
+            try:
+                if sock is not None:
+                    result["reused"] = True
+                else:
+                    # open a new connection and measure the handshakes
+                    start = time.monotonic()
+                    sock = socket.create_connection((ip, port), timeout=remaining)
+                    result["tcp"] = time.monotonic() - start
+                    if use_tls:
+                        start = time.monotonic()
+                        sock = context.wrap_socket(sock, server_hostname=host)
+                        result["tls"] = time.monotonic() - start
+                sock.settimeout(max(0.001, deadline - time.monotonic()))
+                start = time.monotonic()
+                sock.sendall(request)
+                first = sock.recv(65536)
+                if not first:
+                    raise ConnectionError("connection closed by remote")
+                result["ttfb"] = time.monotonic() - start
+                result["status"], reusable = _read_response(sock, first)
+                if not reusable:
+                    sock.close()
+                    sock = None
+            except (OSError, ValueError) as exc:
+                result["error"] = str(exc) if not isinstance(exc, socket.timeout) else "Zeitüberschreitung"
+                if sock is not None:
+                    sock.close()
+                    sock = None
+    finally:
+        if sock is not None:
+            sock.close()
+    return results
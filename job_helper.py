@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading,time
+from concurrent.futures import ThreadPoolExecutor
+
+# raised inside a job when it has been cancelled. jobs check for it at convenient points, e.g. between
+# probes, and the job manager ends them quietly
+class job_cancelled(Exception):
+    pass
+
+# the handle of a background job. the job publishes its results while it is running, so they can be
+# shown before it is finished
+class job:
+    def __init__(self, key, notify=None):
+        self.key = key
+        self.future = None
+        # the share of the work that is done between 0 and 1, None if unknown
+        self.progress = None
+        self._results = []
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._notify = notify
+
+    def _changed(self):
+        if self._notify is not None:
+            self._notify()
+
+    # add results to the ones published so far
+    def append(self, *results):
+        with self._lock:
+            self._results.extend(results)
+        self._changed()
+
+    # replace the results published so far
+    def publish(self, results):
+        with self._lock:
+            self._results = list(results)
+        self._changed()
+
+    # return a copy of the results published so far
+    def get_results(self):
+        with self._lock:
+            return list(self._results)
+
+    # set the share of the work that is done and tell the gui about it
+    def set_progress(self, progress):
+        self.progress = min(1.0, max(0.0, progress))
+        self._changed()
+
+    # ask the job to stop. it ends at the next check
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    # end the job if it has been cancelled
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise job_cancelled()
+
+    # sleep for the given seconds, but end the job as soon as it is cancelled
+    def sleep(self, seconds):
+        if self._cancelled.wait(max(0.0, seconds)):
+            raise job_cancelled()
+
+    # has the job finished, failed or been cancelled?
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    # the exception that ended the job or None
+    def error(self):
+        if not self.done() or self.future.cancelled():
+            return None
+        return self.future.exception()
+
+# runs the background jobs in a bounded pool. a job that is submitted again while an identical one is
+# still running gets the handle of the running one, so pressing a button repeatedly doesn't pile up probes
+class job_manager:
+    def __init__(self, max_workers=4, notify=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        # called whenever a job has published results, made progress or finished
+        self.notify = notify
+        # the running jobs by their key
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def _changed(self):
+        if self.notify is not None:
+            self.notify()
+
+    # run function(job, *args) as a job. the key identifies identical jobs, e.g. the name of the
+    # operation and its arguments
+    def submit(self, key, function, *args):
+        with self.lock:
+            running = self.jobs.get(key)
+            if running is not None and not running.done() and not running.is_cancelled():
+                return running
+            new_job = job(key, self._changed)
+            self.jobs[key] = new_job
+            new_job.future = self.executor.submit(self._run, new_job, function, args)
+        # the callback runs after the future is done, so the listener sees the job as finished
+        new_job.future.add_done_callback(lambda future: self._finished(new_job))
+        return new_job
+
+    def _run(self, current_job, function, args):
+        try:
+            return function(current_job, *args)
+        except job_cancelled:
+            return None
+
+    def _finished(self, finished_job):
+        with self.lock:
+            if self.jobs.get(finished_job.key) is finished_job:
+                del self.jobs[finished_job.key]
+        self._changed()
+
+    # cancel all running jobs
+    def cancel_all(self):
+        with self.lock:
+            for running in self.jobs.values():
+                running.cancel()
+
+    # cancel all jobs and don't accept new ones
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+# hands out the last job of an operation for ttl seconds after it has been started, so many readers of
+# the same results, e.g. several scrapers, don't start the operation again. a job that is still running
+# is always handed out
+class result_cache:
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        # key -> (start time, job)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    # return the cached job of the key or the one started by calling start if there is none, it is
+    # older than ttl seconds or it has failed
+    def get(self, key, start, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            now = time.monotonic()
+            cached = self._jobs.get(key)
+            if cached is not None:
+                started, cached_job = cached
+                if not cached_job.done():
+                    return cached_job
+                if now - started < ttl and cached_job.error() is None and not cached_job.is_cancelled():
+                    return cached_job
+            new_job = start()
+            self._jobs[key] = (now, new_job)
+            return new_job
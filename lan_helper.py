@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,struct,select,time,ipaddress,re,os,threading
+from netlink_helper import get_neighbours
+from net_helper import open_icmp_socket, build_icmp_echo, parse_icmp_echo_reply
+
+ETH_P_ARP = 0x0806
+ETH_P_IP = 0x0800
+ARP_REQUEST = 1
+ARP_REPLY = 2
+# ethernet header followed by an arp packet for ipv4 over ethernet
+ARP_FRAME = struct.Struct("!6s6sHHHBBH6s4s6s4s")
+BROADCAST_MAC = b"\xff" * 6
+
+# the largest number of addresses we sweep, bigger networks are reduced to the part around our address
+MAX_SWEEP_PREFIX = 22
+
+# places where distributions install the ieee oui list
+OUI_FILES = [
+    "/usr/share/ieee-data/oui.txt",
+    "/var/lib/ieee-data/oui.txt",
+    "/usr/share/arp-scan/ieee-oui.txt",
+    "/usr/share/nmap/nmap-mac-prefixes",
+    "/usr/share/misc/oui.txt",
+]
+# matches the lines of all those formats: "00-00-0C   (hex)  Cisco", "00000C<tab>Cisco" and "00000C Cisco"
+OUI_LINE = re.compile(r"^([0-9A-Fa-f]{2})[-:]?([0-9A-Fa-f]{2})[-:]?([0-9A-Fa-f]{2})\s+(?:\(hex\)\s+)?(\S.*?)\s*$")
+
+def mac_to_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(":"))
+
+def bytes_to_mac(data):
+    return ":".join("%02x" % byte for byte in data)
+
+# vendor names by the first three bytes of a mac address. the list is read on the first lookup and
+# indexed by the prefix as integer
+class oui_table:
+    def __init__(self, paths=None):
+        self.paths = paths if paths is not None else OUI_FILES
+        self._vendors = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        vendors = {}
+        for path in self.paths:
+            try:
+                with open(path, encoding="utf-8", errors="replace") as oui_file:
+                    for line in oui_file:
+                        match = OUI_LINE.match(line)
+                        # the ieee list repeats every entry with the prefix in base 16
+                        if match is None or "(base 16)" in line:
+                            continue
+                        prefix = int(match.group(1) + match.group(2) + match.group(3), 16)
+                        vendors.setdefault(prefix, match.group(4))
+            except OSError:
+                continue
+            # the first list found is enough
+            if len(vendors) > 0:
+                break
+        return vendors
+
+    # return the vendor of a mac address or None if it is unknown
+    def lookup(self, mac):
+        with self._lock:
+            if self._vendors is None:
+                self._vendors = self._load()
+        data = mac_to_bytes(mac)
+        # locally administered addresses are made up, e.g. by the mac randomization of phones
+        if data[0] & 0x02:
+            return "(lokal verwaltet)"
+        return self._vendors.get((data[0] << 16) | (data[1] << 8) | data[2])
+
+# return the network to be swept for an address and netmask
+def sweep_network(address, netmask):
+    network = ipaddress.ip_network(address + "/" + netmask, strict=False)
+    if network.prefixlen < MAX_SWEEP_PREFIX:
+        network = ipaddress.ip_network(address + "/" + str(MAX_SWEEP_PREFIX), strict=False)
+    return network
+
+# send arp requests for every host of the network from a raw packet socket at the given rate in packets
+# per second and collect the replies. returns a dict ip -> mac. raises OSError without raw access
+def arp_sweep(interface, own_mac, own_ip, network, rate=2000, timeout=0.3):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+    hosts = {}
+    try:
+        sock.bind((interface, ETH_P_ARP))
+        sock.setblocking(False)
+        source_mac = mac_to_bytes(own_mac)
+        source_ip = socket.inet_aton(own_ip)
+        targets = [str(host) for host in network.hosts() if str(host) != own_ip]
+
+        # read all replies that have arrived so far
+        def receive():
+            while True:
+                try:
+                    frame = sock.recv(128)
+                except (BlockingIOError, InterruptedError):
+                    return
+                if len(frame) < ARP_FRAME.size:
+                    continue
+                fields = ARP_FRAME.unpack_from(frame)
+                if fields[2] != ETH_P_ARP or fields[7] != ARP_REPLY:
+                    continue
+                sender_ip = socket.inet_ntoa(fields[9])
+                if ipaddress.ip_address(sender_ip) in network:
+                    hosts[sender_ip] = bytes_to_mac(fields[8])
+
+        start = time.monotonic()
+        for index, target in enumerate(targets):
+            frame = ARP_FRAME.pack(BROADCAST_MAC, source_mac, ETH_P_ARP, 1, ETH_P_IP, 6, 4, ARP_REQUEST,
+                                   source_mac, source_ip, b"\x00" * 6, socket.inet_aton(target))
+            # the device queue may be full, wait until it takes the frame and read the replies meanwhile.
+            # a queue that doesn't drain within a second costs the target, not the whole sweep
+            give_up = time.monotonic() + 1.0
+            while True:
+                try:
+                    sock.send(frame)
+                    break
+                except (BlockingIOError, InterruptedError):
+                    if time.monotonic() >= give_up:
+                        break
+                    select.select([sock], [sock], [], 0.01)
+                    receive()
+            # stay within the rate and use the pause to read replies
+            ahead = start + (index + 1) / rate - time.monotonic()
+            if ahead > 0:
+                select.select([sock], [], [], ahead)
+            receive()
+        # wait for the late replies
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            select.select([sock], [], [], max(0.0, deadline - time.monotonic()))
+            receive()
+    finally:
+        sock.close()
+    return hosts
+
+# send an icmp echo request to every host of the network from one socket and return the addresses that
+# answered. this works without raw access if unprivileged icmp sockets are allowed
+def icmp_sweep(own_ip, network, rate=2000, timeout=0.5):
+    sock, raw = open_icmp_socket(socket.AF_INET)
+    alive = set()
+    try:
+        sock.setblocking(False)
+        identifier = os.getpid() & 0xffff
+        targets = [str(host) for host in network.hosts() if str(host) != own_ip]
+
+        def receive():
+            while True:
+                try:
+                    packet, address = sock.recvfrom(1024)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError:
+                    continue
+                reply = parse_icmp_echo_reply(socket.AF_INET, packet, raw)
+                # raw sockets see the echo replies of all processes, the kernel sets the identifier of
+                # unprivileged sockets on its own
+                if reply is not None and (not raw or reply[0] == identifier):
+                    alive.add(address[0])
+
+        start = time.monotonic()
+        for index, target in enumerate(targets):
+            try:
+                sock.sendto(build_icmp_echo(socket.AF_INET, identifier, index & 0xffff, b"ct-net-tester"),
+                            (target, 0))
+            except OSError:
+                pass
+            ahead = start + (index + 1) / rate - time.monotonic()
+            if ahead > 0:
+                select.select([sock], [], [], ahead)
+            receive()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            select.select([sock], [], [], max(0.0, deadline - time.monotonic()))
+            receive()
+    finally:
+        sock.close()
+    return alive
+
+# the neighbours the kernel already knows on an interface, ip -> mac
+def known_neighbours(interface, network):
+    hosts = {}
+    try:
+        ifindex = socket.if_nametoindex(interface)
+        for neighbour_ifindex, ip, mac in get_neighbours(socket.AF_INET):
+            if neighbour_ifindex == ifindex and ipaddress.ip_address(ip) in network:
+                hosts[ip] = mac
+        return hosts
+    except OSError:
+        pass
+    # without netlink read the arp table of the proc filesystem
+    try:
+        with open("/proc/net/arp") as arp_table:
+            next(arp_table)
+            for line in arp_table:
+                fields = line.split()
+                # flag 0x2 marks complete entries
+                if len(fields) >= 6 and fields[5] == interface and int(fields[2], 16) & 0x2 \
+                        and ipaddress.ip_address(fields[0]) in network:
+                    hosts[fields[0]] = fields[3]
+    except (OSError, ValueError):
+        pass
+    return hosts
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import array,hashlib,math,tempfile
+
+# the lines of a text in one buffer. the lines are stored utf-8 encoded one after the other and found by
+# their offsets, so large outputs don't need a python object for every line. texts larger than
+# spool_size bytes are moved into a temporary file
+class text_store:
+    def __init__(self, lines=(), spool_size=1 << 20):
+        self.offsets = array.array("Q", [0])
+        # the length of every line in characters, which is all the layout needs
+        self.lengths = array.array("L")
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=spool_size)
+        digest = hashlib.blake2b(digest_size=16)
+        for line in lines:
+            line = str(line)
+            data = line.encode("utf-8", errors="surrogatepass")
+            self._buffer.write(data)
+            digest.update(data + b"\x00")
+            self.offsets.append(self.offsets[-1] + len(data))
+            self.lengths.append(len(line))
+        # identifies the text, so an unchanged text can be recognized without comparing it
+        self.digest = digest.digest()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def line(self, index):
+        self._buffer.seek(self.offsets[index])
+        data = self._buffer.read(self.offsets[index + 1] - self.offsets[index])
+        return data.decode("utf-8", errors="surrogatepass")
+
+    def close(self):
+        self._buffer.close()
+
+# the lines of a text store wrapped for a textbox of the given columns and rows. lines that don't fit are
+# continued in the next line with a wrap sign at the end and a flipped one at the start, so the first
+# part holds columns - 1 characters and the following parts columns - 2. the display lines are indexed by
+# their source line and start, so every page is found without walking the text before it
+class text_layout:
+    def __init__(self, store, columns, rows):
+        self.store = store
+        self.size = columns, rows
+        # wrapping needs room for a character between the wrap signs
+        self.columns = max(3, columns)
+        self.rows = max(1, rows)
+        self.line_numbers = array.array("L")
+        self.line_starts = array.array("L")
+        for number, length in enumerate(store.lengths):
+            self.line_numbers.append(number)
+            self.line_starts.append(0)
+            if length >= self.columns:
+                for start in range(self.columns - 1, length, self.columns - 2):
+                    self.line_numbers.append(number)
+                    self.line_starts.append(start)
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+    # the number of the last page
+    @property
+    def pages(self):
+        return max(0, math.ceil(len(self) / self.rows) - 1)
+
+    # return the display lines of a page as (text, continued, wrapped). continued lines start with the
+    # flipped wrap sign, wrapped ones end with the wrap sign
+    def page(self, page):
+        lines = []
+        source_number, source = None, None
+        for display_line in range(page * self.rows, min(len(self), (page + 1) * self.rows)):
+            number = self.line_numbers[display_line]
+            if number != source_number:
+                source_number, source = number, self.store.line(number)
+            start = self.line_starts[display_line]
+            if len(source) < self.columns:
+                lines.append((source, False, False))
+                continue
+            end = start + (self.columns - 1 if start == 0 else self.columns - 2)
+            lines.append((source[start:end], start > 0, end < len(source)))
+        return lines
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading,time,random
+from concurrent.futures import ThreadPoolExecutor
+
+# the types of probes and the metrics their results can have
+PROBE_TYPES = ("ping", "tcp", "http", "dns")
+METRICS = ("loss", "rtt", "dns")
+
+# a hashed timer wheel. the time is divided into ticks and every tick has a slot of the wheel, so
+# scheduling is a list append and a tick only looks at the timers of its slot, no matter how many
+# timers there are. timers that are more than a turn of the wheel away wait in their slot for the
+# right turn. all methods must be called from the same thread
+class timer_wheel:
+    def __init__(self, tick=0.25, slots=256, now=None):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        # the last tick that has been processed
+        self.current = int((time.monotonic() if now is None else now) / tick)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # schedule an item for the given monotonic time. times in the past are due with the next tick
+    def schedule(self, when, item):
+        due = max(int(when / self.tick), self.current + 1)
+        self.slots[due % len(self.slots)].append((due, item))
+        self.size += 1
+
+    # return the items that are due at the given time, the earliest first
+    def advance(self, now):
+        target = int(now / self.tick)
+        due_items = []
+        # after a long pause every slot is visited once
+        for tick in range(self.current + 1, min(target, self.current + len(self.slots)) + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if len(slot) == 0:
+                continue
+            waiting = []
+            for entry in slot:
+                (due_items if entry[0] <= target else waiting).append(entry)
+            slot[:] = waiting
+        self.current = max(self.current, target)
+        self.size -= len(due_items)
+        due_items.sort(key=lambda entry: entry[0])
+        return [item for due, item in due_items]
+
+# a threshold with hysteresis. the rule fires after alert_after results above the threshold in a row
+# and clears after clear_after results at or below clear_ratio times the threshold in a row, so a value
+# close to the threshold doesn't switch the alert on and off all the time
+class threshold_rule:
+    def __init__(self, metric, threshold, alert_after=3, clear_after=3, clear_ratio=0.8):
+        self.metric = metric
+        self.threshold = threshold
+        self.alert_after = max(1, alert_after)
+        self.clear_after = max(1, clear_after)
+        self.clear_ratio = clear_ratio
+        self.firing = False
+        self.value = None
+        self._streak = 0
+
+    # evaluate a new value and return whether the rule has started or stopped firing. missing values,
+    # e.g. the rtt of a lost probe, don't count in either direction
+    def update(self, value):
+        if value is None:
+            return False
+        self.value = value
+        if self.firing:
+            passed = value <= self.threshold * self.clear_ratio
+        else:
+            passed = value > self.threshold
+        self._streak = self._streak + 1 if passed else 0
+        if self._streak >= (self.clear_after if self.firing else self.alert_after):
+            self.firing = not self.firing
+            self._streak = 0
+            return True
+        return False
+
+# parse a probe of the probes segment of the config file. the definition is the type, the target and
+# optionally the interval in seconds and the thresholds, e.g. "ping 192.168.1.1 interval=10 loss=20
+# rtt=50". the loss is given in percent, rtt and dns times in ms
+def parse_probe(name, definition, interval=30.0):
+    parts = definition.split()
+    if len(parts) < 2 or parts[0].lower() not in PROBE_TYPES:
+        raise ValueError("invalid probe " + name + ": " + definition)
+    probe = {"name": name, "type": parts[0].lower(), "target": parts[1], "interval": interval,
+             "thresholds": {}}
+    for option in parts[2:]:
+        key, _, value = option.partition("=")
+        key = key.lower()
+        if key == "interval":
+            probe["interval"] = max(1.0, float(value))
+        elif key in METRICS:
+            value = float(value.rstrip("%"))
+            probe["thresholds"][key] = value / 100 if key == "loss" else value
+        else:
+            raise ValueError("invalid option of probe " + name + ": " + option)
+    return probe
+
+# parse all probes of the probes segment. returns the probes and the error messages of the invalid ones
+def parse_probes(definitions, interval=30.0):
+    probes = []
+    errors = []
+    for name, definition in definitions.items():
+        try:
+            probes.append(parse_probe(name, definition, interval))
+        except ValueError as exc:
+            errors.append(str(exc))
+    return probes, errors
+
+# runs the probes at their intervals. a single scheduler thread keeps all probes in a timer wheel and
+# hands the due ones to a small pool of workers, so hundreds of probes don't need hundreds of threads.
+# the runs are spread with a random jitter, so probes with the same interval don't run all at once.
+# a probe whose last run hasn't finished yet skips its turn
+class probe_monitor:
+    def __init__(self, probes, workers=16, jitter=0.1, alert_after=3, clear_after=3, clear_ratio=0.8,
+                 on_alert=None):
+        self.workers = workers
+        self.jitter = jitter
+        # called with the probe and the rule whenever a rule starts or stops firing
+        self.on_alert = on_alert
+        self.probes = []
+        for probe in probes:
+            self.probes.append(dict(probe, rules=[
+                threshold_rule(metric, threshold, alert_after, clear_after, clear_ratio)
+                for metric, threshold in sorted(probe["thresholds"].items())],
+                running=False, runs=0, result=None, last_run=None))
+        self.wheel = timer_wheel()
+        # the number of rules that are firing
+        self.alerts = 0
+        self._lock = threading.Lock()
+
+    # the time of the next run of a probe, starting at the given time
+    def _next_run(self, probe, start):
+        return start + probe["interval"] * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # run the probes until the job is cancelled. execute(probe) runs a probe and returns its result as a
+    # dict with the metrics
+    def run(self, job, execute):
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="probe")
+        now = time.monotonic()
+        # the first runs are spread over the whole interval
+        for probe in self.probes:
+            self.wheel.schedule(now + random.uniform(0, probe["interval"]), probe)
+        try:
+            while True:
+                now = time.monotonic()
+                for probe in self.wheel.advance(now):
+                    self.wheel.schedule(self._next_run(probe, now), probe)
+                    with self._lock:
+                        if probe["running"]:
+                            continue
+                        probe["running"] = True
+                    future = executor.submit(execute, probe)
+                    future.add_done_callback(lambda future, probe=probe: self._finished(probe, future))
+                job.sleep(self.wheel.tick)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # evaluate the result of a probe run
+    def _finished(self, probe, future):
+        if future.cancelled():
+            result = None
+        else:
+            try:
+                result = future.result()
+            except Exception as exc:
+                # a failed probe counts as lost
+                result = {"loss": 1.0, "error": str(exc)}
+        changed = []
+        with self._lock:
+            probe["running"] = False
+            if result is None:
+                return
+            probe["result"] = result
+            probe["runs"] += 1
+            probe["last_run"] = time.time()
+            for rule in probe["rules"]:
+                if rule.update(result.get(rule.metric)):
+                    self.alerts += 1 if rule.firing else -1
+                    changed.append(rule)
+        if self.on_alert is not None:
+            for rule in changed:
+                self.on_alert(probe, rule)
+
+    # return the state of every probe as (name, type, target, runs, result, firing metrics)
+    def status(self):
+        with self._lock:
+            return [(probe["name"], probe["type"], probe["target"], probe["runs"],
+                     dict(probe["result"]) if probe["result"] is not None else None,
+                     [rule.metric for rule in probe["rules"] if rule.firing]) for probe in self.probes]
@@ -5,13 +5,42 @@ import pyric
 import pyric.pyw as pyw
 import netifaces
 from getmac import get_mac_address
-from access_points import get_scanner
+from access_points import get_scanner, IwlistWifiScanner
 import threading
+import socket
 import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 from net_helper import *
+from dns_helper import default_resolver, read_system_resolvers, dns_exchange, \
+    DNS_TYPE_A, DNS_RCODE_NOERROR, DNS_RCODE_NXDOMAIN
+from probe_stats import latency_stats, format_ms, format_rate, bufferbloat_grade
+from http_helper import tcp_connect, http_probe
+from throughput_helper import throughput_tcp, throughput_udp
+from traceroute_helper import traceroute
+from lan_helper import oui_table, sweep_network, arp_sweep, icmp_sweep, known_neighbours, OUI_FILES
+from job_helper import job_manager, job_cancelled
+from command_helper import run_command
+from wifi_helper import survey_table, channel_analysis, CHANNELS_24, CHANNELS_5, CHANNELS_24_SEPARATE
+from nl80211_helper import scan as nl80211_scan
+from netlink_helper import interface_monitor, IFF_LOOPBACK, IFF_UP
+from monitor_helper import probe_monitor
+import ipaddress
 
 class net:
     def __init__(self):
+        # called by the background jobs whenever new results are available, e.g. to wake up the gui
+        self.notify = None
+        # all operations run as jobs in a shared pool. the wifi survey, the interface monitor and the
+        # monitoring keep running, so there are workers for them in addition to the tests
+        self.jobs = job_manager(7, self._notify)
+        # the interfaces and their addresses are kept up to date by the announcements of the kernel. if
+        # netlink isn't available they are read with netifaces on every request
+        self.interface_monitor = interface_monitor(self._interfaces_changed)
+        try:
+            self.interface_monitor.start()
+        except OSError:
+            self.interface_monitor = None
         # placeholders for the list of interfaces
         self.wireless_interfaces = []
         self.wired_interfaces = []
@@ -21,34 +50,125 @@ class net:
         self.current_interface = self.wired_interfaces[0]
         self.last_wired_interface= self.wired_interfaces[0]
         self.last_wireless_interface= self.wireless_interfaces[0]
-        # start the automatic wifi scan as a thread
-        self.wifi_scanner()
-        # has the first wifi scan been completed?
-        self.first_scan_complete = False
+        # the last jobs of the net check and the custom command
+        self.net_check_job = None
+        self.custom_command_job = None
+        # the history store the probe results are recorded in, see record
+        self.history = None
+        # the monitoring of the probes of the config file, which is started by monitor
+        self.probe_monitor = None
+        self.monitor_job = None
+        # the vendor list, which is only read on the first lan scan
+        self.oui_table = None
+        # the access points found by the wifi survey, which is started by wifi_scanner
+        self.wifi_survey = survey_table()
+        self.wifi_scan_job = None
+        self.wifi_scan_interval = None
+        self.wifi_scan_errors = []
+        self._wifi_scan_now = threading.Event()
+        # the channel analysis of both bands and the survey version it has been made for
+        self.channel_analyses = [("2,4 GHz", channel_analysis(CHANNELS_24, 2), CHANNELS_24_SEPARATE),
+                                 ("5 GHz", channel_analysis(CHANNELS_5), None)]
+        self._channel_results = None
+        self._channel_results_version = None
+        # the formatted text of every access point and the survey version it has been formatted for
+        self._wifi_rows = {}
+        self._wifi_rows_version = 0
+        self._wifi_text = []
+        # upper limit for parallel probes
+        self.max_probe_workers = 8
+        # the dns resolver caches the answers for the duration of their ttl. disable the cache to
+        # measure the cold resolution on every check
+        self.resolver = default_resolver()
+        self.dns_cache_enabled = True
+        # follow the changes of the interfaces in the background
+        if self.interface_monitor is not None:
+            self.jobs.submit("interface_monitor", self._monitor_interfaces)
+
+    # tell the listener that new results are available
+    def _notify(self):
+        if self.notify is not None:
+            self.notify()
 
     # get all system interfaces
     def get_interfaces(self):
-        # request list of interfaces from pyric
-        all_interfaces = pyw.interfaces()
-        
+        wireless_interfaces = []
+        wired_interfaces = []
+        if self.interface_monitor is not None:
+            # the monitor already knows the interfaces and their macs
+            all_interfaces = [name for name, link in self.interface_monitor.interfaces().items()
+                              if not link["flags"] & IFF_LOOPBACK and link["mac"] is not None and
+                              link["mac"] != "00:00:00:00:00:00"]
+        else:
+            # request list of interfaces from pyric
+            all_interfaces = [interface for interface in pyw.interfaces()
+                              if get_mac_address(interface) != "00:00:00:00:00" and interface != "lo"]
+
         #walk all interfaces
         for interface in all_interfaces:
-            # check if the interface is loopback or virtual
-            if get_mac_address(interface) != "00:00:00:00:00" and interface != "lo":
-                # check if it's wireless or not
-                if pyw.iswireless(interface):
-                    self.wireless_interfaces.append(interface)
-                else:
-                    self.wired_interfaces.append(interface)
+            # check if it's wireless or not
+            if pyw.iswireless(interface):
+                wireless_interfaces.append(interface)
+            else:
+                wired_interfaces.append(interface)
 
         # append a placeholder interaface for the empty lists
-        if len(self.wireless_interfaces) == 0:
-                    self.wireless_interfaces.append("None")
-        if len(self.wired_interfaces) == 0:
-                    self.wired_interfaces.append("None")
-    
+        if len(wireless_interfaces) == 0:
+                    wireless_interfaces.append("None")
+        if len(wired_interfaces) == 0:
+                    wired_interfaces.append("None")
+        self.wireless_interfaces = wireless_interfaces
+        self.wired_interfaces = wired_interfaces
+
+    # the interface monitor that runs as a job
+    def _monitor_interfaces(self, job):
+        try:
+            self.interface_monitor.run(job.is_cancelled)
+        finally:
+            self.interface_monitor.close()
+
+    # called by the interface monitor with the names of the changed interfaces
+    def _interfaces_changed(self, names):
+        # an interface may have been added or removed
+        self.get_interfaces()
+        # record the state of the changed interfaces: the loss is 1 while the link is down and the value
+        # is the number of ipv4 addresses, so lost leases show up
+        if self.history is not None:
+            links = self.interface_monitor.interfaces()
+            for name in names:
+                link = links.get(name)
+                try:
+                    addresses = len(self.interface_monitor.ifaddresses(name).get(socket.AF_INET, []))
+                except ValueError:
+                    addresses = 0
+                self.record("interface", name, loss=0 if link is not None and link["flags"] & IFF_UP else 1,
+                            value=addresses, interface=name)
+        # only the shown interface needs to be shown again
+        if self.current_interface in names:
+            self._notify()
+
+    # add a sample to the history if there is one. the interface defaults to the current one
+    def record(self, kind, target, rtt=None, loss=None, value=None, interface=None):
+        if self.history is not None:
+            self.history.add(kind, interface or self.current_interface, target, rtt, loss, value)
+
+    # return the number of changes of the current interface, so the gui can tell when to show it again
+    def get_interface_version(self):
+        if self.interface_monitor is None:
+            return 0
+        return self.interface_monitor.version(self.current_interface)
+
+    # return the addresses of an interface like netifaces does
+    def ifaddresses(self, interface):
+        if self.interface_monitor is not None:
+            return self.interface_monitor.ifaddresses(interface)
+        return netifaces.ifaddresses(interface)
+
     # switch to next interface
     def iterate_interface(self, current_interface, interfaces, last_interface):
+        # the last interface may have been removed
+        if last_interface not in interfaces:
+            return interfaces[0]
         # get index of last selected interface
         interface_index = interfaces.index(last_interface)
         # if the current interface is equal to the last interface increment it, so the next one will be selected
@@ -87,8 +207,8 @@ class net:
     def get_interface_info(self):
         # try to get the information from the interface. it might fail, if the device disappears for some reason
         try:
-            # get all the addresses from netifaces
-            if_info = netifaces.ifaddresses(self.current_interface)
+            # get all the addresses from the interface monitor or netifaces
+            if_info = self.ifaddresses(self.current_interface)
             
             # the first line will be the devices MAC
             text = ["MAC:  " + if_info[netifaces.AF_LINK][0]['addr']]
@@ -122,125 +242,727 @@ class net:
         # return the text to be displayed
         return text
 
-    # convert the wifi scan result into text
-    def get_wifi_scan(self):
+    # format the data of an access point as text
+    def _format_access_point(self, entry):
         text = []
-        # check if the first scan has been completed
-        if self.first_scan_complete:
-            # format every access points data into text
-            for access_point in self.access_points:
-                text.append("SSID:     " + access_point['ssid'])
-                text.append("BSSID:    " + access_point['bssid'])
-                text.append("Signal:   " + str(access_point['quality']))
-                # the access point library returns diffrent data types for
-                # security. so we must check the type and fix it
-                if type(access_point['security']) is list:
-                    security = " ".join(str(e) for e in access_point['security'])
-                else:
-                    security = str(access_point['security'])
-                if security.replace(" ", "") == "":
-                    security = "-"
-                
-                text.append("Security: " + security)
-                text.append(" ")
+        text.append("SSID:     " + (entry['ssid'] or "(versteckt)"))
+        text.append("BSSID:    " + entry['bssid'])
+        if entry['signal'] is not None:
+            text.append("Signal:   %d dBm (%d bis %d)" % (round(entry['signal']), entry['signal_min'],
+                                                          entry['signal_max']))
         else:
-            # when the scan is incomplete return None
-            text = None
+            text.append("Signal:   -")
+        if entry['channel'] is not None:
+            text.append("Kanal:    %d (%d MHz, %d MHz breit)" % (entry['channel'], entry['frequency'], entry['width']))
+        text.append("Security: " + entry['security'])
+        text.append(" ")
+        return text
 
+    # convert the wifi survey into text. only the access points that changed since the last call are
+    # formatted again
+    def get_wifi_scan(self):
+        # when the first scan is incomplete return None
+        if self.wifi_survey.scans == 0:
+            return None
+        version, changed, removed, reset = self.wifi_survey.changes(self._wifi_rows_version)
+        if version != self._wifi_rows_version or reset:
+            if reset:
+                self._wifi_rows.clear()
+            for bssid in removed:
+                self._wifi_rows.pop(bssid, None)
+            for entry in changed:
+                self._wifi_rows[entry['bssid']] = (entry['signal'], self._format_access_point(entry))
+            self._wifi_rows_version = version
+            # the strongest access points first
+            rows = sorted(self._wifi_rows.values(), key=lambda row: (row[0] is None, -(row[0] or 0)))
+            self._wifi_text = [line for signal, lines in rows for line in lines]
+        text = ["%d Netze, Scan alle %g s" % (len(self._wifi_rows), self.wifi_scan_interval or 0), " "]
+        text.extend(self._wifi_text)
+        for error in self.wifi_scan_errors:
+            text.append("Fehler: " + error)
         return text
-    
-    # start the wifi scanning thread
-    def wifi_scanner(self):
-        self.wifi_scanner_thread = threading.Thread(target=self._wifi_scanner)
-        self.wifi_scanner_thread.start()
-
-    # function for the wifi scannin that is in another thread. 
-    # this is needed since the wifi scanner blocks the code execution and the programm will seemingly hang
-    def _wifi_scanner(self):
-        # reset the known access points
-        self.access_points = []
+
+    # analyse the congestion of the channels of both bands with the access points of the survey. returns
+    # None before the first scan, otherwise a list of (band, rows, recommended channels). every row
+    # holds the channel, the number of access points on it and its congestion score
+    def get_channel_analysis(self):
+        if self.wifi_survey.scans == 0:
+            return None
+        # only analyse again if the survey has changed
+        if self._channel_results_version != self.wifi_survey.version:
+            self._channel_results_version = self.wifi_survey.version
+            entries = self.wifi_survey.snapshot()
+            self._channel_results = []
+            for band, analysis, candidates in self.channel_analyses:
+                counts, scores = analysis.analyse(entries)
+                rows = [[channel, counts[index], "%.1f" % scores[index]]
+                        for index, (channel, center) in enumerate(analysis.channels)]
+                self._channel_results.append((band, rows, analysis.recommend(scores, 3, candidates)))
+        return self._channel_results
+
+    # start the wifi survey as a job, unless it is already running. it scans all wireless interfaces
+    # every interval seconds. while nothing changes the interval doubles up to max_interval. access
+    # points that haven't been seen for max_age seconds are dropped
+    def wifi_scanner(self, interval=10, max_interval=60, max_age=120):
+        self.wifi_survey.max_age = max_age
+        self.wifi_scan_job = self.jobs.submit("wifi_survey", self._wifi_survey, interval, max_interval)
+        return self.wifi_scan_job
+
+    # start the next scan of the survey right away, e.g. because its results are shown
+    def request_wifi_scan(self):
+        self._wifi_scan_now.set()
+
+    # the wifi survey that runs as a job until it is cancelled
+    def _wifi_survey(self, job, interval, max_interval):
+        self.wifi_scan_interval = interval
+        while True:
+            self._wifi_scan_now.clear()
+            access_points, self.wifi_scan_errors = self._scan_access_points(job)
+            for access_point in access_points:
+                self.record("wifi", str(access_point["bssid"]).lower(), value=access_point["signal"],
+                            interface=access_point["interface"])
+            if self.wifi_survey.update(access_points):
+                self.wifi_scan_interval = interval
+            else:
+                self.wifi_scan_interval = min(max_interval, self.wifi_scan_interval * 2)
+            self._notify()
+            # wait for the next scan in short steps, so a requested scan starts soon
+            deadline = time.monotonic() + self.wifi_scan_interval
+            while time.monotonic() < deadline:
+                if self._wifi_scan_now.is_set():
+                    self.wifi_scan_interval = interval
+                    break
+                job.sleep(min(0.5, deadline - time.monotonic()))
+
+    # scan all wireless interfaces once. this blocks until the scans are done, so it must run in a job.
+    # returns the access points and the errors of the interfaces that couldn't be scanned
+    def _scan_access_points(self, job):
+        access_points = []
+        errors = []
         # walk through all known wireless interfaces to get complete coverage
         for interface in self.wireless_interfaces:
-            # create a card instance to work with
-            card = pyw.getcard(interface)
-            # check if the card is still valid
-            if pyw.validcard(card):
+            job.check_cancelled()
+            # skip the placeholder if there is no wireless interface
+            if interface == "None":
+                continue
+            try:
+                # create a card instance to work with
+                card = pyw.getcard(interface)
+                # check if the card is still valid
+                if not pyw.validcard(card):
+                    continue
                 # skip the card if it is hard blocked
                 if pyw.isblocked(card)[1]:
                     continue
-                else:
-                    # try to unblock a softblock, put the card up and disable the powersave mode
+                # try to unblock a softblock, put the card up and disable the powersave mode
+                try:
+                    pyw.unblock(card)
+                    pyw.up(card)
+                    pyw.pwrsaveset(card, False)
+                except:
+                    # ignore failures
+                    pass
+                # scan over nl80211 and decode the results directly
+                try:
+                    for access_point in nl80211_scan(interface, should_stop=job.is_cancelled):
+                        access_point["interface"] = interface
+                        access_points.append(access_point)
+                    continue
+                except OSError:
+                    # e.g. a driver without nl80211, fall back to the scanner of the access point library
+                    pass
+                scanner = get_scanner(interface)
+                for access_point in scanner.get_access_points():
                     try:
-                        pyw.unblock(card)
-                        pyw.up(card)
-                        pyw.pwrsaveset(card, False)
-                    except:
-                        # ignore failures
-                        pass
-                    # start scanning 
-                    wifi_scanner = get_scanner(interface)
-                    # extend the access point list
-                    self.access_points.extend(wifi_scanner.get_access_points())
-
-        # the first scan has been completed 
-        self.first_scan_complete = True
-
-    # return the status
+                        if isinstance(scanner, IwlistWifiScanner):
+                            # iwlist reports the raw "Quality=x/70" of the wireless extensions, which
+                            # the kernel derives from the signal in dBm plus 110
+                            signal = float(access_point['quality']) - 110
+                        else:
+                            # the other backends give a quality in percent, i.e. 2 * (dBm + 100)
+                            signal = float(access_point['quality']) / 2 - 100
+                    except (TypeError, ValueError):
+                        signal = None
+                    access_points.append({
+                        "ssid": access_point['ssid'],
+                        "bssid": access_point['bssid'],
+                        "signal": signal,
+                        "security": access_point['security'],
+                        "interface": interface,
+                    })
+            except Exception as exc:
+                errors.append(interface + ": " + str(exc))
+        return access_points, errors
+
+    # return the results gathered so far
     def get_net_status(self):
-        return self.net_status_results
+        return self.net_check_job.get_results() if self.net_check_job is not None else []
+
+    # has every remote been checked?
+    def is_net_check_complete(self):
+        return self.net_check_job is not None and self.net_check_job.done()
 
-    # start net status thread
-    def net_checker(self, remotes):
-        self.net_status_results = None
-        self.check_net_thread = threading.Thread(target=self._net_checker, args=[remotes])
-        self.check_net_thread.start()
+    # start the net check job. samples is the number of tcp connects or http requests per remote
+    def net_checker(self, remotes, deadline=3, samples=3):
+        remotes = [remote.strip() for remote in remotes if remote.strip() != ""]
+        self.net_check_job = self.jobs.submit(("net_check", tuple(remotes), deadline, samples),
+                                              self._net_checker, remotes, deadline, samples)
+        return self.net_check_job
     
-    # check the network connection by resolving dns data and pinging hosts
-    def _net_checker(self, remotes):
+    # check the network connection by resolving dns data and pinging all hosts at the same time.
+    # the check takes as long as the slowest remote instead of the sum of all of them
+    def _net_checker(self, job, remotes, deadline, samples):
+        if len(remotes) == 0:
+            return
+        # one worker per remote, but don't flood a small device with threads
+        executor = ThreadPoolExecutor(max_workers=min(len(remotes), self.max_probe_workers))
+        futures = {}
+        for remote in remotes:
+            futures[executor.submit(self._check_remote, remote, deadline, samples)] = remote
+        try:
+            # publish the results of every remote as soon as it is finished
+            for count, future in enumerate(as_completed(futures, timeout=deadline + 1), 1):
+                job.check_cancelled()
+                try:
+                    text = future.result()
+                except Exception as exc:
+                    text = [str(futures[future]) + ": Prüfung fehlgeschlagen (" + str(exc) + ")"]
+                job.set_progress(count / len(futures))
+                job.append(*text)
+        except TimeoutError:
+            # every remote that is still running has missed its deadline
+            job.append(*[str(remote) + ": Zeitüberschreitung" for future, remote in futures.items()
+                         if not future.done()])
+        finally:
+            # don't wait for stuck workers, they will end on their own
+            executor.shutdown(wait=False)
+
+    # resolve and probe a single remote within the given deadline and return the lines to be displayed
+    def _check_remote(self, remote, deadline, samples=3):
         text = []
-        # walk all given remotes
+        start = time.monotonic()
+        # try to check if it is a valid ipv4- or ipv6-address or a domainname
+        try:
+            target = parse_remote(remote)
+            hostip, resolution = self._resolve_remote(target["host"])
+            if resolution is not None:
+                if resolution["cached"]:
+                    text.append(str(remote) + ": " + hostip + " (DNS-Cache)")
+                else:
+                    text.append(str(remote) + ": " + hostip + " (DNS " + format_ms(resolution["time"] * 1000) + " ms)")
+                    self.record("dns", remote, resolution["time"] * 1000)
+        except:
+            # if it's neither fail and skip this remote
+            text.append(str(remote) + ": Gegenstelle ungültig")
+            return text
+        # the resolution already used a part of the deadline
+        remaining = deadline - (time.monotonic() - start)
+        # tcp and http remotes are checked without icmp, which is often filtered
+        if target["scheme"] == "tcp":
+            text.extend(self._check_tcp(remote, hostip, target["port"], remaining, samples))
+            return text
+        elif target["scheme"] in ("http", "https"):
+            text.extend(self._check_http(remote, hostip, target, remaining, samples))
+            return text
+        # ping the ip and evaluate the result
+        rtt = None
+        if remaining <= 0:
+            reachable = False
+        else:
+            try:
+                echo = icmp_echo(hostip, 1, timeout=remaining)
+                reachable = echo["received"] > 0
+                rtt = echo["avg"]
+            except OSError:
+                # without an icmp socket fall back to the ping binary, which can't tell us the rtt
+                reachable = ping_host_binary(hostip, remaining)
+        self.record("netcheck", remote, rtt, 0 if reachable else 1)
+        if reachable and rtt is not None:
+            text.append(str(remote) + ": erreichbar (" + "%.1f" % rtt + " ms)")
+        elif reachable:
+            text.append(str(remote) + ": erreichbar")
+        else:
+            text.append(str(remote) + ": NICHT erreichbar")
+        return text
+
+    # connect to a tcp port several times. the first connect is shown separately, since it may include
+    # arp and route lookups, the others are summarized by their median
+    def _check_tcp(self, remote, hostip, port, timeout, samples):
+        deadline = time.monotonic() + timeout
+        connects = []
+        for _ in range(max(1, samples)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                connects.append(tcp_connect(hostip, port, remaining) * 1000)
+            except ConnectionRefusedError:
+                # the host answered with a reset, so it is reachable
+                self.record("netcheck", remote, None, 0)
+                return [str(remote) + ": Port geschlossen (Host erreichbar)"]
+            except OSError:
+                break
+        self.record("netcheck", remote, connects[0] if len(connects) > 0 else None, 0 if len(connects) > 0 else 1)
+        if len(connects) == 0:
+            return [str(remote) + ": NICHT erreichbar"]
+        line = str(remote) + ": erreichbar (TCP " + format_ms(connects[0])
+        if len(connects) > 1:
+            line += ", warm " + format_ms(statistics.median(connects[1:]))
+        return [line + " ms)"]
+
+    # request an url several times over one connection to show the cold and warm costs separately
+    def _check_http(self, remote, hostip, target, timeout, samples):
+        results = http_probe(target["host"], hostip, target["port"], target["scheme"] == "https",
+                             target["path"], max(1, samples), timeout)
+        cold = results[0]
+        self.record("netcheck", remote, cold["ttfb"] * 1000 if cold["ttfb"] is not None else None,
+                    0 if cold["status"] is not None else 1)
+        if cold["status"] is None:
+            return [str(remote) + ": NICHT erreichbar (" + str(cold["error"]) + ")"]
+        text = [str(remote) + ": HTTP " + str(cold["status"])]
+        line = "  TCP " + format_ms(cold["tcp"] * 1000)
+        if cold["tls"] is not None:
+            line += " TLS " + format_ms(cold["tls"] * 1000)
+        text.append(line + " TTFB " + format_ms(cold["ttfb"] * 1000) + " ms")
+        # requests over the reused connection only cost the time to first byte
+        warm = [result["ttfb"] * 1000 for result in results[1:] if result["reused"] and result["ttfb"] is not None]
+        if len(warm) > 0:
+            text.append("  warm TTFB " + format_ms(statistics.median(warm)) + " ms")
+        elif len(results) > 1:
+            text.append("  keine Wiederverwendung")
+        return text
+
+    # return the ip of a remote that is either an ipv4- or ipv6-address or a domainname together with
+    # the result of the dns resolution, which is None for addresses
+    def _resolve_remote(self, remote):
+        if is_valid_ipv4_address(remote) or is_valid_ipv6_address(remote):
+            return remote, None
+        resolution = self.resolver.resolve(remote, self.dns_cache_enabled)
+        return pick_address(resolution), resolution
+
+    # start the latency measurement job, its results are table rows
+    def latency_checker(self, remotes, count=50, interval=0.02, timeout=1.0):
+        remotes = [remote.strip() for remote in remotes if remote.strip() != ""]
+        return self.jobs.submit(("latency", tuple(remotes), count, interval, timeout),
+                                self._latency_checker, remotes, count, interval, timeout)
+
+    # send a burst of echo requests to every remote at the same time and collect the latency statistics.
+    # the table rows are published, the statistics of every remote are returned as dicts
+    def _latency_checker(self, job, remotes, count, interval, timeout):
+        summaries = []
+        if len(remotes) == 0:
+            return summaries
+        executor = ThreadPoolExecutor(max_workers=min(len(remotes), self.max_probe_workers))
+        futures = {}
         for remote in remotes:
-            # try to check if it is a valid ipv4- or ipv6-address or a domainname
+            futures[executor.submit(self._measure_latency, job, remote, count, interval, timeout)] = remote
+        try:
+            # publish every row as soon as its burst has finished
+            for finished, future in enumerate(as_completed(futures), 1):
+                job.check_cancelled()
+                try:
+                    row, summary = future.result()
+                except Exception as exc:
+                    row, summary = [futures[future], "Fehler"], {"target": futures[future], "error": str(exc)}
+                job.set_progress(finished / len(futures))
+                summaries.append(summary)
+                job.append(row)
+        finally:
+            executor.shutdown(wait=False)
+        return summaries
+
+    # measure a single remote and return its table row and its statistics
+    def _measure_latency(self, job, remote, count, interval, timeout):
+        try:
+            hostip, _ = self._resolve_remote(parse_remote(remote)["host"])
+        except Exception:
+            return [remote, "ungültig"], {"target": remote, "error": "ungültig"}
+        stats = latency_stats()
+        # the statistics are updated with every probe. a cancelled job ends the burst
+        def add(sequence, rtt):
+            job.check_cancelled()
+            stats.add(rtt)
+        try:
+            icmp_echo(hostip, count, interval, timeout, callback=add)
+        except OSError:
+            return [remote, "kein ICMP"], {"target": remote, "address": hostip, "error": "kein ICMP"}
+        summary = stats.summary()
+        summary.update(target=remote, address=hostip)
+        self.record("latency", remote, summary["median"], summary["loss"])
+        return [remote,
+                "%d%%" % round(stats.loss() * 100),
+                format_ms(stats.min),
+                format_ms(stats.median()),
+                format_ms(stats.p95()),
+                format_ms(stats.max),
+                format_ms(summary["jitter"])], summary
+
+    # start the monitoring of the given probes as a job, unless it is already running. see probe_monitor
+    # for the arguments
+    def monitor(self, probes, workers=16, jitter=0.1, alert_after=3, clear_after=3, clear_ratio=0.8):
+        if self.monitor_job is None or self.monitor_job.done():
+            self.probe_monitor = probe_monitor(probes, workers, jitter, alert_after, clear_after, clear_ratio,
+                                               lambda probe, rule: self._notify())
+            self.monitor_job = self.jobs.submit("monitor", self.probe_monitor.run, self._run_probe)
+        return self.monitor_job
+
+    # is a rule of the monitoring firing?
+    def is_alerting(self):
+        return self.probe_monitor is not None and self.probe_monitor.alerts > 0
+
+    # return the table rows of the monitoring, the alerting probes first
+    def get_monitor_status(self):
+        if self.probe_monitor is None:
+            return []
+        rows = []
+        for name, kind, target, runs, result, firing in self.probe_monitor.status():
+            if result is None:
+                rows.append((False, [name, "-", "-", "-", "wartet"]))
+                continue
+            if len(firing) > 0:
+                state = "ALARM " + ",".join(firing)
+            elif "error" in result:
+                state = result["error"]
+            else:
+                state = "ok"
+            rows.append((len(firing) == 0, [name,
+                                            "%d%%" % round(result["loss"] * 100) if "loss" in result else "-",
+                                            format_ms(result.get("rtt")), format_ms(result.get("dns")), state]))
+        # the sort is stable, so the probes keep the order of the config file
+        return [row for ok, row in sorted(rows, key=lambda row: row[0])]
+
+    # run a probe of the monitoring once and return its loss, rtt and dns time in ms. the results are
+    # recorded in the history under the name of the probe
+    def _run_probe(self, probe):
+        result = {}
+        target = probe["target"]
+        try:
+            if probe["type"] == "dns":
+                # the resolution itself is measured, so the cache is bypassed
+                resolution = self.resolver.resolve(target, False)
+                result["dns"] = resolution["time"] * 1000
+                result["loss"] = 0.0 if len(resolution["ipv4"]) + len(resolution["ipv6"]) > 0 else 1.0
+                return result
+            # tcp and http targets can be given without their scheme
+            if probe["type"] != "ping" and "://" not in target:
+                target = probe["type"] + "://" + target
+            host = parse_remote(target)
+            hostip, resolution = self._resolve_remote(host["host"])
+            if resolution is not None and not resolution["cached"]:
+                result["dns"] = resolution["time"] * 1000
+            if probe["type"] == "ping":
+                echo = icmp_echo(hostip, 3, 0.2, 1.0)
+                result["loss"] = echo["loss"]
+                result["rtt"] = echo["avg"]
+            elif probe["type"] == "tcp":
+                try:
+                    result["rtt"] = tcp_connect(hostip, host["port"], 3.0) * 1000
+                    result["loss"] = 0.0
+                except OSError:
+                    result["loss"] = 1.0
+            else:
+                response = http_probe(host["host"], hostip, host["port"], host["scheme"] == "https",
+                                      host["path"], 1, 5.0)[0]
+                result["loss"] = 0.0 if response["status"] is not None else 1.0
+                if response["ttfb"] is not None:
+                    result["rtt"] = response["ttfb"] * 1000
+        except (OSError, ValueError) as exc:
+            result = {"loss": 1.0, "error": str(exc)}
+        finally:
+            self.record("monitor", probe["name"], result.get("rtt"), result.get("loss"), result.get("dns"))
+        return result
+
+    # start the dns benchmark job. its results are table rows, the best resolver first
+    def dns_benchmark(self, resolvers, names, rounds=3, timeout=2.0):
+        return self.jobs.submit(("dns_benchmark", tuple(resolvers), tuple(names), rounds, timeout),
+                                self._dns_benchmark, resolvers, names, rounds, timeout)
+
+    # ask every resolver for all names at the same time and rank them by their latency and failure rate
+    def _dns_benchmark(self, job, resolvers, names, rounds, timeout):
+        if len(resolvers) == 0 or len(names) == 0:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(len(resolvers), self.max_probe_workers))
+        futures = {}
+        for label, server in resolvers:
+            futures[executor.submit(self._benchmark_resolver, job, server, names, rounds, timeout)] = label
+        # the rows together with their score
+        results = []
+        try:
+            for finished, future in enumerate(as_completed(futures), 1):
+                job.check_cancelled()
+                label = futures[future]
+                try:
+                    stats, failures = future.result()
+                except Exception:
+                    stats, failures = None, None
+                if stats is None or stats.received == 0:
+                    # a resolver that never answered is ranked last
+                    results.append(((2, 0, 0), [label, "100%", "-", "-"]))
+                else:
+                    failure_rate = failures / stats.sent
+                    # every failed query costs the client the full timeout, so the expected latency
+                    # weighs the median with the failure rate. the p95 breaks ties
+                    score = (1 - failure_rate) * stats.median() + failure_rate * timeout * 1000
+                    results.append(((1, score, stats.p95()), [
+                        label,
+                        "%d%%" % round(failure_rate * 100),
+                        format_ms(stats.median()),
+                        format_ms(stats.p95()),
+                    ]))
+                job.set_progress(finished / len(futures))
+                job.publish([row for score, row in sorted(results, key=lambda result: result[0])])
+        finally:
+            executor.shutdown(wait=False)
+
+    # send all names to one resolver in a batch per round. returns the latency statistics of the answered
+    # queries and the number of failed ones. timeouts and server errors are failures, nxdomain is not
+    def _benchmark_resolver(self, job, server, names, rounds, timeout):
+        stats = latency_stats()
+        failures = 0
+        queries = [(name, DNS_TYPE_A) for name in names]
+        for _ in range(rounds):
+            job.check_cancelled()
             try:
-                if is_valid_ipv4_address(remote):
-                    hostip = remote
-                    pass
-                elif is_valid_ipv6_address(remote):
-                    hostip = remote
-                    pass
+                results = dns_exchange(server, queries, timeout)
+            except (OSError, ValueError):
+                results = [(None, None)] * len(queries)
+            for response, elapsed in results:
+                if response is None or response["rcode"] not in (DNS_RCODE_NOERROR, DNS_RCODE_NXDOMAIN):
+                    failures += 1
+                    stats.add(None)
                 else:
-                    hostip = get_ip_from_hostname(remote)
-                    text.append(str(remote) + ": " + hostip)
-            except:
-                # if it's neither fail and skip this remote
-                text.append(str(remote) + ": Gegenstelle ungültig")
+                    stats.add(elapsed * 1000)
+        return stats, failures
+
+    # start the throughput test job, its results are text lines
+    def throughput_test(self, server, port, streams=4, duration=5, udp_rate=10e6):
+        return self.jobs.submit(("throughput", server, port, streams, duration, udp_rate),
+                                self._throughput_test, server, port, streams, duration, udp_rate)
+
+    # measure tcp download and upload and udp at the target rate against the companion server
+    def _throughput_test(self, job, server, port, streams, duration, udp_rate):
+        # the three phases take the same time
+        phase = 0
+        def report(second, bps):
+            job.check_cancelled()
+            job.set_progress((phase + second / duration) / 3)
+            job.append("  %2ds %s" % (second, format_rate(bps)))
+        for download, name in ((True, "Download"), (False, "Upload")):
+            job.append(name + " (" + str(streams) + " Streams)")
+            try:
+                result = throughput_tcp(server, port, download, streams, duration, report)
+            except (OSError, ValueError) as exc:
+                job.append(name + " fehlgeschlagen: " + str(exc))
                 continue
-            # ping the ip and evaluate the result
-            if ping_host(hostip):
-                text.append(str(remote) + ": erreichbar")
-            else:
-                text.append(str(remote) + ": NICHT erreichbar")
-        self.net_status_results = text
+            finally:
+                phase += 1
+            line = name + ": " + format_rate(result["bits_per_second"])
+            if result["retransmits"] is not None:
+                line += ", Retr. " + str(result["retransmits"])
+            job.append(line)
+        job.append("UDP (" + format_rate(udp_rate) + ")")
+        try:
+            result = throughput_udp(server, port, udp_rate, duration, callback=report)
+            job.append("UDP: " + format_rate(result["bits_per_second"]) +
+                       ", Verl. " + "%.1f%%" % (result["loss"] * 100) +
+                       ", Jitter " + format_ms(result["jitter"]) + " ms")
+        except (OSError, ValueError) as exc:
+            job.append("UDP fehlgeschlagen: " + str(exc))
 
+    # start the bufferbloat test job, its results are table rows
+    def bufferbloat_test(self, remote, server, port, streams=4, duration=5, interval=0.1):
+        return self.jobs.submit(("bufferbloat", remote, server, port, streams, duration, interval),
+                                self._bufferbloat_test, remote, server, port, streams, duration, interval)
+
+    # measure the latency to the remote while the link is idle and while it is saturated by downloads and
+    # uploads from the companion server
+    def _bufferbloat_test(self, job, remote, server, port, streams, duration, interval):
+        try:
+            target = parse_remote(remote)
+            hostip, _ = self._resolve_remote(target["host"])
+        except Exception:
+            job.append([remote, "ungültig"])
+            return
+        idle = self._probe_latency(job, target, hostip, duration, interval)
+        job.append(["Leerlauf", "%d%%" % round(idle.loss() * 100),
+                    format_ms(idle.median()), format_ms(idle.p95()), ""])
+        job.set_progress(1 / 3)
+        # the largest increase of a load phase, None as long as no phase has measured one
+        worst = None
+        for phase, (download, name) in enumerate(((True, "Download"), (False, "Upload")), 2):
+            # the load runs a second longer than the probes, so they don't see the ramp down
+            load_result = []
+            load = threading.Thread(target=lambda: load_result.append(
+                self._run_load(job, server, port, download, streams, duration + 2)))
+            load.start()
+            try:
+                # give tcp a second to fill the queues before measuring
+                job.sleep(1)
+                loaded = self._probe_latency(job, target, hostip, duration, interval)
+            finally:
+                # a cancelled job stops the load as well
+                load.join()
+            if len(load_result) > 0 and load_result[0] is not None:
+                job.append([name, load_result[0]])
+                job.set_progress(phase / 3)
+                continue
+            increase = None
+            if loaded.median() is not None and idle.median() is not None:
+                increase = max(0.0, loaded.median() - idle.median())
+                worst = increase if worst is None else max(worst, increase)
+            job.append([name, "%d%%" % round(loaded.loss() * 100),
+                        format_ms(loaded.median()), format_ms(loaded.p95()), format_ms(increase)])
+            job.set_progress(phase / 3)
+        # without a measured load phase there is nothing to grade
+        job.append(["Bewertung", bufferbloat_grade(worst) if worst is not None else "-", "", "",
+                    format_ms(worst)])
+
+    # run a throughput test with low priority as load generator. returns an error message or None
+    def _run_load(self, job, server, port, download, streams, duration):
+        try:
+            # the test checks every second whether the job has been cancelled
+            throughput_tcp(server, port, download, streams, duration,
+                           lambda second, bps: job.check_cancelled(), nice=10)
+        except job_cancelled:
+            return None
+        except (OSError, ValueError) as exc:
+            return "Last fehlgeschlagen: " + str(exc)
+        return None
+
+    # probe the latency of a target for the given duration. tcp and http remotes are probed with tcp
+    # connects, all others with icmp echoes
+    def _probe_latency(self, job, target, hostip, duration, interval):
+        stats = latency_stats()
+        count = max(1, int(duration / interval))
+        if target["scheme"] == "icmp":
+            def add(sequence, rtt):
+                job.check_cancelled()
+                stats.add(rtt)
+            try:
+                icmp_echo(hostip, count, interval, timeout=1.0, callback=add)
+                return stats
+            except OSError:
+                # without an icmp socket there is nothing to measure, the statistics stay empty
+                return stats
+        next_probe = time.monotonic()
+        for _ in range(count):
+            try:
+                stats.add(tcp_connect(hostip, target["port"], 1.0) * 1000)
+            except ConnectionRefusedError:
+                # a reset is an answer as well, but its time isn't measured by tcp_connect
+                stats.add(None)
+            except OSError:
+                stats.add(None)
+            next_probe += interval
+            job.sleep(next_probe - time.monotonic())
+        return stats
+
+    # start the traceroute job, its results are the rows of the hop table
+    def traceroute(self, remote, rounds=10, interval=1.0, max_hops=30):
+        return self.jobs.submit(("traceroute", remote, rounds, interval, max_hops),
+                                self._traceroute, remote, rounds, interval, max_hops)
+
+    # trace the route to a remote and publish the hop table whenever new results arrived
+    def _traceroute(self, job, remote, rounds, interval, max_hops):
+        try:
+            hostip, _ = self._resolve_remote(parse_remote(remote)["host"])
+        except Exception:
+            job.publish([[remote, "ungültig"]])
+            return
+
+        started = time.monotonic()
+        def publish(trace):
+            job.check_cancelled()
+            job.set_progress((time.monotonic() - started) / (rounds * interval))
+            job.publish([[row[0], row[1]] + [format_ms(value) for value in row[2:]] for row in trace.rows()])
+
+        trace = traceroute(hostip, max_hops, resolver=self.resolver)
+        try:
+            trace.run(rounds, interval, publish)
+        except PermissionError as exc:
+            job.publish([["Traceroute", "benötigt Root-Rechte (" + str(exc) + ")"]])
+        except OSError as exc:
+            job.publish([["Traceroute", "fehlgeschlagen (" + str(exc) + ")"]])
+
+    # start the lan scan job, its results are table rows
+    def lan_scan(self, rate=2000, oui_file=""):
+        if self.oui_table is None:
+            self.oui_table = oui_table([oui_file] + OUI_FILES if oui_file != "" else None)
+        return self.jobs.submit(("lan_scan", self.current_interface, rate), self._lan_scan,
+                                self.current_interface, rate)
+
+    # publish the hosts found so far sorted by address, every host with its vendor in the following line.
+    # hosts without a known mac have None
+    def _publish_hosts(self, job, hosts, own_ip):
+        rows = []
+        for ip in sorted(hosts, key=ipaddress.ip_address):
+            rows.append([ip + (" (ich)" if ip == own_ip else ""), hosts[ip] or "MAC unbekannt"])
+            if hosts[ip] is None:
+                continue
+            vendor = self.oui_table.lookup(hosts[ip])
+            if vendor is not None:
+                rows.append(["  " + vendor])
+        job.publish(rows)
+
+    # find all hosts in the network of an interface. an arp request is sent to every address, without
+    # raw access an icmp echo request and the neighbour table of the kernel provides the mac
+    def _lan_scan(self, job, interface, rate):
+        try:
+            addresses = self.ifaddresses(interface)
+            own = addresses[netifaces.AF_INET][0]
+            own_ip = own["addr"]
+            own_mac = addresses[netifaces.AF_LINK][0]["addr"]
+            network = sweep_network(own_ip, own["netmask"])
+        except (KeyError, IndexError, ValueError):
+            job.publish([[interface, "keine IPv4-Adresse"]])
+            return
+        # the neighbours the kernel already knows are shown right away
+        hosts = known_neighbours(interface, network)
+        hosts[own_ip] = own_mac
+        self._publish_hosts(job, hosts, own_ip)
+        job.check_cancelled()
+        try:
+            hosts.update(arp_sweep(interface, own_mac, own_ip, network, rate))
+        except OSError:
+            # the icmp sweep fills the neighbour table of the kernel with the hosts that answered
+            try:
+                alive = icmp_sweep(own_ip, network, rate)
+            except OSError:
+                alive = set()
+            hosts.update(known_neighbours(interface, network))
+            # hosts that answered without a neighbour entry, e.g. because it has already expired
+            for ip in alive:
+                hosts.setdefault(ip, None)
+        job.check_cancelled()
+        self._publish_hosts(job, hosts, own_ip)
+
+    # return the output of the custom command or None while it is running
     def get_custom_command_status(self):
-        return self.custom_command_result
+        if self.custom_command_job is None or not self.custom_command_job.done():
+            return None
+        return self.custom_command_job.get_results()
 
-    # start custom command thread
-    def custom_command(self, command):
-        self.custom_command_result = None
-        self.custom_command_thread = threading.Thread(target=self._custom_command, args=[command])
-        self.custom_command_thread.start()
+    # start custom command job. the command is stopped after timeout seconds, only the last max_lines
+    # lines of its output are kept
+    def custom_command(self, command, timeout=10.0, max_lines=1000):
+        self.custom_command_job = self.jobs.submit(("custom_command", command, timeout, max_lines),
+                                                   self._custom_command, command, timeout, max_lines)
+        return self.custom_command_job
     
-    # execute a given custom command and store its stdout
-    def _custom_command(self, command):
-        command = command.split(' ')
-        text = []
+    # execute a given custom command and publish its output while it is running
+    def _custom_command(self, job, command, timeout, max_lines):
+        def publish(lines, dropped):
+            if dropped > 0:
+                lines.insert(0, "... " + str(dropped) + " Zeilen ausgelassen")
+            job.publish(lines)
         try:
-            result = subprocess.run(command, stdout=subprocess.PIPE)
-            print(result)
-            if result.returncode != 0: raise Exception('Programmausführung fehlgeschlagen')
-            output = result.stdout.decode('utf-8').splitlines()
-            text.extend(output)
-        except:
-            text.append("Programmausführung fehlgeschlagen")
-        self.custom_command_result = text
+            result = run_command(command, timeout, max_lines, publish, job.is_cancelled)
+        except (OSError, ValueError):
+            job.publish(["Programmausführung fehlgeschlagen"])
+            return
+        job.check_cancelled()
+        if result["timed_out"]:
+            job.append("Zeitüberschreitung nach %g s, Programm beendet" % timeout)
+        elif result["returncode"] != 0:
+            job.append("Programmausführung fehlgeschlagen (Code " + str(result["returncode"]) + ")")
+        return result
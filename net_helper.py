@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
-import socket,os,subprocess
+import socket,os,subprocess,math,struct,select,time,itertools,urllib.parse
+from dns_helper import default_resolver
 
 # check if its a valid ipv4 address by using socket
 def is_valid_ipv4_address(address):
@@ -25,14 +26,203 @@ def is_valid_ipv6_address(address):
         return False
     return True
 
-# get an ip from a given hostname by using dns
-def get_ip_from_hostname(hostname):
-    return socket.gethostbyname(hostname)
+# split a remote into its parts. plain hosts and addresses are pinged, tcp://host:port is checked with a
+# tcp connect and http://host or https://host with a request. raises ValueError for invalid remotes
+def parse_remote(remote):
+    if "://" not in remote:
+        return {"scheme": "icmp", "host": remote, "port": None, "path": None}
+    parts = urllib.parse.urlsplit(remote)
+    scheme = parts.scheme.lower()
+    if scheme not in ("tcp", "http", "https") or not parts.hostname:
+        raise ValueError("invalid remote: " + remote)
+    port = parts.port if parts.port is not None else {"http": 80, "https": 443}.get(scheme)
+    if port is None:
+        raise ValueError("tcp remote without port: " + remote)
+    path = parts.path if parts.path != "" else "/"
+    if parts.query != "":
+        path += "?" + parts.query
+    return {"scheme": scheme, "host": parts.hostname, "port": port, "path": path}
 
-# ping a host
-def ping_host(ip):
-    if os.system("ping -c 1 " + str(ip)) == 0:
-       return True
-    else:
-       return False
+# get an ip from a given hostname by using dns. ipv4 addresses are preferred, but names that only
+# have ipv6 addresses can be resolved as well
+def get_ip_from_hostname(hostname, use_cache=True):
+    return pick_address(default_resolver().resolve(hostname, use_cache))
 
+# pick the address to be used from a resolution result
+def pick_address(resolution):
+    addresses = resolution["ipv4"] + resolution["ipv6"]
+    if len(addresses) == 0:
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    return addresses[0]
+
+# ping a host. the timeout in seconds limits how long we wait for the answer
+def ping_host(ip, timeout=None):
+    try:
+        # use our own icmp implementation, so we don't have to fork a ping process
+        return icmp_echo(ip, 1, timeout=1.0 if timeout is None else timeout)["received"] > 0
+    except OSError:
+        # we may neither open a datagram nor a raw icmp socket, let ping do the job
+        return ping_host_binary(ip, timeout)
+
+# ping a host by using the ping binary
+def ping_host_binary(ip, timeout=None):
+    command = ["ping", "-c", "1"]
+    if timeout is not None:
+        # ping only accepts whole seconds, so round up and never go below one second
+        command.extend(["-W", str(max(1, int(math.ceil(timeout))))])
+    command.append(str(ip))
+    try:
+        # don't let a hanging ping block the caller longer than the given timeout
+        result = subprocess.run(command, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL,
+                                timeout=None if timeout is None else timeout + 1)
+    except (subprocess.TimeoutExpired, OSError):
+        # a missing ping binary is treated like an unreachable host
+        return False
+    return result.returncode == 0
+
+# icmp message types for echo request and reply
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# every socket gets its own identifier, so parallel probes over raw sockets don't steal each others replies
+_icmp_identifiers = itertools.count(os.getpid() & 0xffff)
+
+# calculate the internet checksum of the given data
+def icmp_checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    # fold the carry bits back into the sum
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+# open an icmp socket for the given address family. unprivileged datagram sockets are used where
+# net.ipv4.ping_group_range allows them, otherwise we need a raw socket and the according privileges.
+# returns the socket and whether it is a raw socket
+def open_icmp_socket(family):
+    protocol = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+    try:
+        return socket.socket(family, socket.SOCK_DGRAM, protocol), False
+    except OSError:
+        return socket.socket(family, socket.SOCK_RAW, protocol), True
+
+# build an echo request packet
+def build_icmp_echo(family, identifier, sequence, payload):
+    message_type = ICMPV6_ECHO_REQUEST if family == socket.AF_INET6 else ICMP_ECHO_REQUEST
+    header = struct.pack("!BBHHH", message_type, 0, 0, identifier, sequence)
+    # the kernel calculates the icmpv6 checksum on its own, because it covers the ip pseudo header
+    if family == socket.AF_INET6:
+        return header + payload
+    checksum = icmp_checksum(header + payload)
+    return struct.pack("!BBHHH", message_type, 0, checksum, identifier, sequence) + payload
+
+# parse a received packet and return identifier and sequence of an echo reply or None for anything else
+def parse_icmp_echo_reply(family, packet, raw):
+    # raw ipv4 sockets deliver the ip header as well, skip it
+    if raw and family == socket.AF_INET:
+        if len(packet) < 20:
+            return None
+        packet = packet[(packet[0] & 0x0f) * 4:]
+    if len(packet) < 8:
+        return None
+    message_type, code, checksum, identifier, sequence = struct.unpack("!BBHHH", packet[:8])
+    if message_type != (ICMPV6_ECHO_REPLY if family == socket.AF_INET6 else ICMP_ECHO_REPLY):
+        return None
+    return identifier, sequence
+
+# summarize a list of round trip times the way ping does. rtts are in milliseconds, lost probes are None
+def icmp_statistics(rtts):
+    received = [rtt for rtt in rtts if rtt is not None]
+    result = {
+        "sent": len(rtts),
+        "received": len(received),
+        "loss": (1 - len(received) / len(rtts)) if len(rtts) > 0 else 0.0,
+        "rtts": rtts,
+        "min": None,
+        "avg": None,
+        "max": None,
+        "mdev": None,
+    }
+    if len(received) > 0:
+        average = sum(received) / len(received)
+        result["min"] = min(received)
+        result["avg"] = average
+        result["max"] = max(received)
+        # mean deviation as ping calculates it
+        result["mdev"] = math.sqrt(max(0.0, sum(rtt * rtt for rtt in received) / len(received) - average * average))
+    return result
+
+# send count echo requests from a single socket to the given ip address. a request is sent every interval
+# seconds and each one is given timeout seconds for its reply. the optional callback is called with the
+# sequence number and the rtt (or None if lost) of every probe as soon as it is known.
+# raises OSError if no icmp socket can be opened
+def icmp_echo(ip, count=1, interval=1.0, timeout=1.0, payload_size=56, callback=None):
+    family = socket.AF_INET6 if is_valid_ipv6_address(ip) else socket.AF_INET
+    sock, raw = open_icmp_socket(family)
+    try:
+        sock.setblocking(False)
+        sock.connect((ip, 0))
+        if raw:
+            identifier = next(_icmp_identifiers) & 0xffff
+        else:
+            # the kernel replaces the identifier of datagram sockets with the local port
+            identifier = sock.getsockname()[1]
+        payload = (b"ct-net-tester" * (payload_size // 13 + 1))[:payload_size]
+        # round trip time in ms for every sequence number, None until the reply arrived
+        rtts = [None] * count
+        # send timestamps of the outstanding requests
+        pending = {}
+        sequence = 0
+        next_send = time.monotonic()
+        while True:
+            now = time.monotonic()
+            # send the next request if it's due
+            if sequence < count and now >= next_send:
+                try:
+                    sock.send(build_icmp_echo(family, identifier, sequence, payload))
+                    pending[sequence] = time.monotonic()
+                except OSError:
+                    # a send error (e.g. no route) simply counts as a lost probe
+                    if callback is not None:
+                        callback(sequence, None)
+                sequence += 1
+                next_send += interval
+            # forget all requests whose timeout has passed
+            for pending_sequence, sent in list(pending.items()):
+                if now - sent > timeout:
+                    del pending[pending_sequence]
+                    if callback is not None:
+                        callback(pending_sequence, None)
+            # we are done once all requests are sent and nothing is outstanding
+            if sequence >= count and len(pending) == 0:
+                break
+            # sleep until the next send or the next timeout, whatever happens first
+            wakeup = min([sent + timeout for sent in pending.values()] +
+                         ([next_send] if sequence < count else []))
+            readable, _, _ = select.select([sock], [], [], max(0.0, wakeup - time.monotonic()))
+            if not readable:
+                continue
+            # read everything that arrived
+            while True:
+                try:
+                    packet = sock.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    # icmp errors reported by the kernel, e.g. host unreachable
+                    break
+                received = time.monotonic()
+                reply = parse_icmp_echo_reply(family, packet, raw)
+                if reply is None or reply[0] != identifier or reply[1] not in pending:
+                    continue
+                rtts[reply[1]] = (received - pending.pop(reply[1])) * 1000
+                if callback is not None:
+                    callback(reply[1], rtts[reply[1]])
+    finally:
+        sock.close()
+
+    return icmp_statistics(rtts)
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,struct,os,itertools,select,threading,errno,ipaddress
+
+# netlink message header: length, type, flags, sequence, port id
+NLMSG_HEADER = struct.Struct("=LHHLL")
+# routing attribute header: length, type
+RTATTR_HEADER = struct.Struct("=HH")
+
+# message types and flags
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+
+# rtnetlink link messages
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+IFINFOMSG = struct.Struct("=BxHiII")
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+
+# rtnetlink address messages
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+IFADDRMSG = struct.Struct("=BBBBi")
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_BROADCAST = 4
+RT_SCOPE_LINK = 253
+
+# multicast groups of the link and address changes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+# rtnetlink neighbour messages
+RTM_GETNEIGH = 30
+NDMSG = struct.Struct("=BxxxiHBB")
+NDA_DST = 1
+NDA_LLADDR = 2
+# neighbour states that carry a valid link layer address
+NUD_VALID = 0x02 | 0x04 | 0x08 | 0x10 | 0x80
+
+_sequence_numbers = itertools.count(1)
+
+# netlink attributes are aligned to four bytes
+def nl_align(length):
+    return (length + 3) & ~3
+
+# split a buffer into (type, flags, payload) tuples of the contained netlink messages
+def parse_messages(data):
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, message_type, flags, sequence, port = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size or offset + length > len(data):
+            break
+        yield message_type, flags, data[offset + NLMSG_HEADER.size:offset + length]
+        offset += nl_align(length)
+
+# parse the attributes in a buffer into a dict type -> raw value. the nested flag is masked out
+def parse_attributes(data, offset=0):
+    attributes = {}
+    while offset + RTATTR_HEADER.size <= len(data):
+        length, attribute_type = RTATTR_HEADER.unpack_from(data, offset)
+        if length < RTATTR_HEADER.size:
+            break
+        attributes[attribute_type & 0x3fff] = data[offset + RTATTR_HEADER.size:offset + length]
+        offset += nl_align(length)
+    return attributes
+
+# build an attribute
+def pack_attribute(attribute_type, value):
+    length = RTATTR_HEADER.size + len(value)
+    return RTATTR_HEADER.pack(length, attribute_type) + value + b"\x00" * (nl_align(length) - length)
+
+# send a request on a netlink socket and return the payloads of all answers. the received data is
+# appended to record if given, e.g. to decode it again later. raises OSError with the errno of an error
+# answer
+def nl_request(sock, message_type, flags, payload, record=None):
+    sequence = next(_sequence_numbers) & 0xffffffff
+    sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), message_type,
+                                NLM_F_REQUEST | flags, sequence, 0) + payload)
+    answers = []
+    while True:
+        data = sock.recv(65536)
+        if record is not None:
+            record.append(data)
+        for answer_type, answer_flags, answer in parse_messages(data):
+            if answer_type == NLMSG_DONE:
+                return answers
+            if answer_type == NLMSG_ERROR:
+                error = struct.unpack_from("=i", answer)[0]
+                if error != 0:
+                    raise OSError(-error, os.strerror(-error))
+                # an acknowledgement
+                return answers
+            answers.append((answer_type, answer))
+            # a single answer without the multi flag ends the request
+            if not answer_flags & NLM_F_MULTI and not flags & NLM_F_ACK:
+                return answers
+
+# return the neighbour table of the kernel (arp and ndp) as a list of (ifindex, ip, mac)
+def get_neighbours(family=socket.AF_UNSPEC):
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        answers = nl_request(sock, RTM_GETNEIGH, NLM_F_DUMP, NDMSG.pack(family, 0, 0, 0, 0))
+    finally:
+        sock.close()
+    neighbours = []
+    for _, payload in answers:
+        if len(payload) < NDMSG.size:
+            continue
+        neighbour_family, ifindex, state, flags, neighbour_type = NDMSG.unpack_from(payload)
+        if not state & NUD_VALID:
+            continue
+        attributes = parse_attributes(payload, NDMSG.size)
+        if NDA_DST not in attributes or NDA_LLADDR not in attributes:
+            continue
+        if neighbour_family == socket.AF_INET and len(attributes[NDA_DST]) == 4:
+            ip = socket.inet_ntop(socket.AF_INET, attributes[NDA_DST])
+        elif neighbour_family == socket.AF_INET6 and len(attributes[NDA_DST]) == 16:
+            ip = socket.inet_ntop(socket.AF_INET6, attributes[NDA_DST])
+        else:
+            continue
+        mac = ":".join("%02x" % byte for byte in attributes[NDA_LLADDR])
+        neighbours.append((ifindex, ip, mac))
+    return neighbours
+
+def format_mac(data):
+    return ":".join("%02x" % byte for byte in data)
+
+# keeps a model of the interfaces and their addresses up to date with the changes the kernel announces.
+# start reads the current state, run processes the announcements until should_stop returns True.
+# on_change is called with the names of the changed interfaces
+class interface_monitor:
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        # ifindex -> dict with name, mac, broadcast, flags and operstate
+        self.links = {}
+        # ifindex -> dict (family, address, prefix length) -> dict with addr, netmask, broadcast
+        self.addresses = {}
+        # name -> number of changes, so readers can tell whether an interface has changed
+        self.versions = {}
+        self._events = None
+        self._lock = threading.Lock()
+
+    # subscribe to the announcements and read the current interfaces. raises OSError without netlink
+    def start(self):
+        self._events = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        # subscribe before reading the state, so no change is missed in between
+        self._events.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        self._synchronize()
+
+    # read all interfaces and addresses again
+    def _synchronize(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            sock.bind((0, 0))
+            links = nl_request(sock, RTM_GETLINK, NLM_F_DUMP, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+            addresses = nl_request(sock, RTM_GETADDR, NLM_F_DUMP, IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0))
+        finally:
+            sock.close()
+        with self._lock:
+            old_names = {link["name"] for link in self.links.values()}
+            self.links.clear()
+            self.addresses.clear()
+            changed = set(old_names)
+            for message_type, payload in links + addresses:
+                changed.update(self._apply(message_type, payload))
+        return changed
+
+    # update the model with a message and return the names of the changed interfaces
+    def _apply(self, message_type, payload):
+        if message_type in (RTM_NEWLINK, RTM_DELLINK) and len(payload) >= IFINFOMSG.size:
+            family, link_type, ifindex, flags, change = IFINFOMSG.unpack_from(payload)
+            attributes = parse_attributes(payload, IFINFOMSG.size)
+            old = self.links.get(ifindex)
+            if message_type == RTM_DELLINK:
+                self.links.pop(ifindex, None)
+                self.addresses.pop(ifindex, None)
+                return [old["name"]] if old is not None else []
+            name = attributes[IFLA_IFNAME].rstrip(b"\x00").decode() if IFLA_IFNAME in attributes else None
+            link = {
+                "name": name or (old["name"] if old is not None else str(ifindex)),
+                "mac": format_mac(attributes[IFLA_ADDRESS]) if IFLA_ADDRESS in attributes else None,
+                "broadcast": format_mac(attributes[IFLA_BROADCAST]) if IFLA_BROADCAST in attributes else None,
+                "flags": flags,
+                "operstate": attributes[IFLA_OPERSTATE][0] if IFLA_OPERSTATE in attributes else None,
+            }
+            if link == old:
+                return []
+            self.links[ifindex] = link
+            # a renamed interface changes under both names
+            return [link["name"]] + ([old["name"]] if old is not None and old["name"] != link["name"] else [])
+        if message_type in (RTM_NEWADDR, RTM_DELADDR) and len(payload) >= IFADDRMSG.size:
+            family, prefixlen, flags, scope, ifindex = IFADDRMSG.unpack_from(payload)
+            if family not in (socket.AF_INET, socket.AF_INET6):
+                return []
+            attributes = parse_attributes(payload, IFADDRMSG.size)
+            # IFA_ADDRESS is the peer of point to point links, IFA_LOCAL the own address
+            raw = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+            if raw is None:
+                return []
+            address = socket.inet_ntop(family, raw)
+            key = (family, address, prefixlen)
+            addresses = self.addresses.setdefault(ifindex, {})
+            if message_type == RTM_DELADDR:
+                if addresses.pop(key, None) is None:
+                    return []
+            else:
+                entry = {"addr": address}
+                if family == socket.AF_INET:
+                    entry["netmask"] = str(ipaddress.ip_network("0.0.0.0/%d" % prefixlen).netmask)
+                    if IFA_BROADCAST in attributes:
+                        entry["broadcast"] = socket.inet_ntop(family, attributes[IFA_BROADCAST])
+                else:
+                    entry["netmask"] = str(ipaddress.ip_network("::/%d" % prefixlen).netmask) + "/%d" % prefixlen
+                    entry["scope"] = scope
+                if addresses.get(key) == entry:
+                    return []
+                addresses[key] = entry
+            link = self.links.get(ifindex)
+            return [link["name"]] if link is not None else []
+        return []
+
+    # process the announcements until should_stop returns True
+    def run(self, should_stop=None):
+        while should_stop is None or not should_stop():
+            readable, _, _ = select.select([self._events], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = self._events.recv(65536)
+            except OSError as exc:
+                # announcements have been lost, so read everything again
+                if exc.errno == errno.ENOBUFS:
+                    self._changed(self._synchronize())
+                    continue
+                raise
+            changed = set()
+            with self._lock:
+                for message_type, flags, payload in parse_messages(data):
+                    changed.update(self._apply(message_type, payload))
+            self._changed(changed)
+
+    def _changed(self, names):
+        if len(names) == 0:
+            return
+        with self._lock:
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+        if self.on_change is not None:
+            self.on_change(names)
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+    # return the names of all interfaces with their link dict
+    def interfaces(self):
+        with self._lock:
+            return {link["name"]: dict(link) for link in self.links.values()}
+
+    def version(self, name):
+        with self._lock:
+            return self.versions.get(name, 0)
+
+    # return the addresses of an interface like netifaces.ifaddresses does. raises ValueError for unknown
+    # interfaces
+    def ifaddresses(self, name):
+        with self._lock:
+            for ifindex, link in self.links.items():
+                if link["name"] == name:
+                    break
+            else:
+                raise ValueError("You must specify a valid interface name.")
+            result = {}
+            if link["mac"] is not None:
+                result[socket.AF_PACKET] = [{"addr": link["mac"]}]
+                if link["broadcast"] is not None:
+                    result[socket.AF_PACKET][0]["broadcast"] = link["broadcast"]
+            for (family, address, prefixlen), entry in self.addresses.get(ifindex, {}).items():
+                entry = dict(entry)
+                # netifaces names the interface of link local ipv6 addresses
+                if entry.pop("scope", None) == RT_SCOPE_LINK:
+                    entry["addr"] += "%" + name
+                result.setdefault(family, []).append(entry)
+            return result
@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,struct,select,time,sys,errno
+from netlink_helper import nl_request, parse_messages, parse_attributes, pack_attribute, NLM_F_ACK, \
+    NLM_F_DUMP, NLMSG_ERROR, NLMSG_DONE
+
+# generic netlink header: command, version
+GENL_HEADER = struct.Struct("=BBxx")
+NETLINK_GENERIC = 16
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+# the controller, which knows the ids of the generic netlink families
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+# nl80211 commands and attributes
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_TRIGGER_SCAN = 33
+NL80211_CMD_NEW_SCAN_RESULTS = 34
+NL80211_CMD_SCAN_ABORTED = 35
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_SCAN_SSIDS = 45
+NL80211_ATTR_BSS = 47
+
+# attributes of a bss
+NL80211_BSS_BSSID = 1
+NL80211_BSS_FREQUENCY = 2
+NL80211_BSS_CAPABILITY = 5
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_SIGNAL_MBM = 7
+NL80211_BSS_SIGNAL_UNSPEC = 8
+NL80211_BSS_SEEN_MS_AGO = 10
+NL80211_BSS_BEACON_IES = 11
+
+# information elements
+IE_SSID = 0
+IE_HT_OPERATION = 61
+IE_RSN = 48
+IE_VHT_OPERATION = 192
+IE_VENDOR = 221
+WPA_OUI_TYPE = b"\x00\x50\xf2\x01"
+RSN_OUI = b"\x00\x0f\xac"
+# the privacy bit of the capabilities, set by wep networks
+CAPABILITY_PRIVACY = 0x0010
+# names of the key management suites of the rsn element
+AKM_SUITES = {1: "EAP", 2: "PSK", 3: "FT-EAP", 4: "FT-PSK", 5: "EAP", 6: "PSK", 8: "SAE", 9: "FT-SAE",
+              11: "EAP", 12: "EAP", 18: "OWE", 24: "SAE"}
+
+# return the channel number of a frequency in MHz or None
+def frequency_to_channel(frequency):
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency <= 2472:
+        return (frequency - 2407) // 5
+    if 5955 <= frequency <= 7115:
+        return (frequency - 5950) // 5
+    if 5000 <= frequency <= 5900:
+        return (frequency - 5000) // 5
+    return None
+
+# split the information elements into a list of (id, data)
+def parse_information_elements(data):
+    elements = []
+    offset = 0
+    while offset + 2 <= len(data):
+        element_id, length = data[offset], data[offset + 1]
+        if offset + 2 + length > len(data):
+            break
+        elements.append((element_id, data[offset + 2:offset + 2 + length]))
+        offset += 2 + length
+    return elements
+
+# return the key management suites of an rsn or wpa element
+def parse_key_management(data, oui):
+    try:
+        # version and group cipher
+        offset = 6
+        pairwise_count = struct.unpack_from("<H", data, offset)[0]
+        offset += 2 + 4 * pairwise_count
+        akm_count = struct.unpack_from("<H", data, offset)[0]
+        offset += 2
+        suites = []
+        for index in range(akm_count):
+            suite = data[offset + 4 * index:offset + 4 * index + 4]
+            if len(suite) == 4 and suite[:3] == oui:
+                name = AKM_SUITES.get(suite[3])
+                if name is not None and name not in suites:
+                    suites.append(name)
+        return suites
+    except struct.error:
+        return []
+
+# describe the security of a bss, e.g. "WPA2-PSK WPA3-SAE"
+def describe_security(elements, capability):
+    security = []
+    for element_id, data in elements:
+        if element_id == IE_RSN:
+            for suite in parse_key_management(data, RSN_OUI) or ["?"]:
+                security.append(("WPA3-" if suite in ("SAE", "FT-SAE", "OWE") else "WPA2-") + suite)
+        elif element_id == IE_VENDOR and data[:4] == WPA_OUI_TYPE:
+            for suite in parse_key_management(data[4:], WPA_OUI_TYPE[:3]) or ["?"]:
+                security.append("WPA-" + suite)
+    if len(security) == 0 and capability & CAPABILITY_PRIVACY:
+        security.append("WEP")
+    return security
+
+# the channel width and the center frequency in MHz from the ht and vht operation elements
+def channel_layout(elements, frequency):
+    width, center = 20, frequency
+    for element_id, data in elements:
+        # a secondary channel and the permission to use it mean 40 MHz, above or below the primary one
+        if element_id == IE_HT_OPERATION and len(data) >= 2 and data[1] & 0x03 in (1, 3) and data[1] & 0x04:
+            if width < 40:
+                width = 40
+                center = frequency + 10 if data[1] & 0x03 == 1 else frequency - 10
+        elif element_id == IE_VHT_OPERATION and len(data) >= 3 and data[0] >= 1 and data[1] != 0:
+            # 80 MHz, or 160 MHz if the second center frequency is set. the old format has the center of
+            # 160 MHz in the first segment
+            if data[0] == 2 or (data[0] == 1 and data[2] != 0 and abs(data[2] - data[1]) == 8):
+                width = 160
+                center = 5000 + 5 * (data[2] if data[0] == 1 else data[1])
+            else:
+                width = 80
+                center = 5000 + 5 * data[1]
+    return width, center
+
+# decode the attributes of a bss into a dict with bssid, ssid, frequency and channel of the primary
+# channel, width and center frequency of all channels used, signal in dBm, security and the age in ms
+def parse_bss(data):
+    attributes = parse_attributes(data)
+    if NL80211_BSS_BSSID not in attributes:
+        return None
+    elements = parse_information_elements(attributes.get(NL80211_BSS_INFORMATION_ELEMENTS) or
+                                          attributes.get(NL80211_BSS_BEACON_IES, b""))
+    ssid = next((data for element_id, data in elements if element_id == IE_SSID), b"")
+    frequency = struct.unpack("=I", attributes[NL80211_BSS_FREQUENCY])[0] \
+        if NL80211_BSS_FREQUENCY in attributes else None
+    if NL80211_BSS_SIGNAL_MBM in attributes:
+        signal = struct.unpack("=i", attributes[NL80211_BSS_SIGNAL_MBM])[0] / 100
+    elif NL80211_BSS_SIGNAL_UNSPEC in attributes:
+        # a quality between 0 and 100, converted like the access point library does
+        signal = attributes[NL80211_BSS_SIGNAL_UNSPEC][0] / 2 - 100
+    else:
+        signal = None
+    capability = struct.unpack("=H", attributes[NL80211_BSS_CAPABILITY])[0] \
+        if NL80211_BSS_CAPABILITY in attributes else 0
+    width, center = channel_layout(elements, frequency) if frequency is not None else (20, None)
+    return {
+        "bssid": ":".join("%02x" % byte for byte in attributes[NL80211_BSS_BSSID]),
+        "ssid": ssid.decode("utf-8", errors="replace"),
+        "frequency": frequency,
+        "channel": frequency_to_channel(frequency) if frequency is not None else None,
+        "width": width,
+        "center": center,
+        "signal": signal,
+        "security": describe_security(elements, capability),
+        "age": struct.unpack("=I", attributes[NL80211_BSS_SEEN_MS_AGO])[0]
+            if NL80211_BSS_SEEN_MS_AGO in attributes else None,
+    }
+
+# decode the messages of a scan dump, e.g. a recorded one. messages of other types are skipped
+def parse_scan_dump(data):
+    access_points = []
+    for message_type, flags, payload in parse_messages(data):
+        if message_type in (NLMSG_ERROR, NLMSG_DONE) or len(payload) < GENL_HEADER.size:
+            continue
+        attributes = parse_attributes(payload, GENL_HEADER.size)
+        if NL80211_ATTR_BSS in attributes:
+            access_point = parse_bss(attributes[NL80211_ATTR_BSS])
+            if access_point is not None:
+                access_points.append(access_point)
+    return access_points
+
+def open_generic_socket():
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+    sock.bind((0, 0))
+    return sock
+
+# return the id and the multicast groups (name -> id) of a generic netlink family
+def get_family(sock, name):
+    answers = nl_request(sock, GENL_ID_CTRL, 0, GENL_HEADER.pack(CTRL_CMD_GETFAMILY, 1) +
+                         pack_attribute(CTRL_ATTR_FAMILY_NAME, name.encode() + b"\x00"))
+    for _, payload in answers:
+        attributes = parse_attributes(payload, GENL_HEADER.size)
+        if CTRL_ATTR_FAMILY_ID not in attributes:
+            continue
+        groups = {}
+        for group in parse_attributes(attributes.get(CTRL_ATTR_MCAST_GROUPS, b"")).values():
+            group_attributes = parse_attributes(group)
+            if CTRL_ATTR_MCAST_GRP_NAME in group_attributes and CTRL_ATTR_MCAST_GRP_ID in group_attributes:
+                groups[group_attributes[CTRL_ATTR_MCAST_GRP_NAME].rstrip(b"\x00").decode()] = \
+                    struct.unpack("=I", group_attributes[CTRL_ATTR_MCAST_GRP_ID])[0]
+        return struct.unpack("=H", attributes[CTRL_ATTR_FAMILY_ID])[0], groups
+    raise OSError("generic netlink family %s not found" % name)
+
+# wait until the scan of the interface has ended. returns False on timeout or when should_stop
+# returns True
+def wait_for_scan(sock, family, ifindex, timeout, should_stop=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if should_stop is not None and should_stop():
+            return False
+        readable, _, _ = select.select([sock], [], [], min(0.25, max(0.0, deadline - time.monotonic())))
+        if not readable:
+            continue
+        for message_type, flags, payload in parse_messages(sock.recv(65536)):
+            if message_type != family or len(payload) < GENL_HEADER.size:
+                continue
+            command = GENL_HEADER.unpack_from(payload)[0]
+            attributes = parse_attributes(payload, GENL_HEADER.size)
+            if command in (NL80211_CMD_NEW_SCAN_RESULTS, NL80211_CMD_SCAN_ABORTED) and \
+                    attributes.get(NL80211_ATTR_IFINDEX) == struct.pack("=I", ifindex):
+                return True
+    return False
+
+# return the raw messages of the scan results the kernel knows for an interface
+def dump_scan(sock, family, ifindex):
+    record = []
+    nl_request(sock, family, NLM_F_DUMP, GENL_HEADER.pack(NL80211_CMD_GET_SCAN, 0) +
+               pack_attribute(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex)), record)
+    return b"".join(record)
+
+# scan for access points on an interface over nl80211 and return them as dicts, see parse_bss.
+# triggering a scan needs CAP_NET_ADMIN, without it the results of the last scan of the system are
+# returned. raises OSError if nl80211 isn't available
+def scan(interface, timeout=10.0, should_stop=None, trigger=True):
+    return parse_scan_dump(scan_raw(interface, timeout, should_stop, trigger))
+
+# like scan, but return the raw messages, e.g. to record them
+def scan_raw(interface, timeout=10.0, should_stop=None, trigger=True):
+    ifindex = socket.if_nametoindex(interface)
+    sock = open_generic_socket()
+    events = None
+    try:
+        family, groups = get_family(sock, "nl80211")
+        if trigger and "scan" in groups:
+            # listen for the end of the scan before it is started, so it can't be missed
+            events = open_generic_socket()
+            events.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, groups["scan"])
+            try:
+                # a zero length ssid makes the scan active, so hidden networks answer as well
+                nl_request(sock, family, NLM_F_ACK, GENL_HEADER.pack(NL80211_CMD_TRIGGER_SCAN, 0) +
+                           pack_attribute(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex)) +
+                           pack_attribute(NL80211_ATTR_SCAN_SSIDS, pack_attribute(1, b"")))
+                wait_for_scan(events, family, ifindex, timeout, should_stop)
+            except OSError as exc:
+                # without permission use the results the kernel already has, a running scan (EBUSY)
+                # ends soon
+                if exc.errno == errno.EBUSY:
+                    wait_for_scan(events, family, ifindex, timeout, should_stop)
+                elif exc.errno not in (errno.EPERM, errno.EACCES):
+                    raise
+        return dump_scan(sock, family, ifindex)
+    finally:
+        sock.close()
+        if events is not None:
+            events.close()
+
+# record the scan results of an interface into a file or decode a recorded file:
+#   nl80211_helper.py record wlan0 scan.bin
+#   nl80211_helper.py decode scan.bin
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "record":
+        data = scan_raw(sys.argv[2])
+        with open(sys.argv[3], "wb") as recording:
+            recording.write(data)
+    elif len(sys.argv) == 3 and sys.argv[1] == "decode":
+        with open(sys.argv[2], "rb") as recording:
+            for access_point in parse_scan_dump(recording.read()):
+                print(access_point)
+    else:
+        print("usage: %s record <interface> <file> | decode <file>" % sys.argv[0])
+        sys.exit(1)
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import math
+
+# estimate a quantile of a stream of values with the P² algorithm of Jain and Chlamtac.
+# only five markers are stored, no matter how many values are added
+class p2_quantile:
+    def __init__(self, quantile):
+        self.quantile = quantile
+        # the first five values are collected to initialize the markers
+        self.heights = []
+        # marker positions, desired positions and their increments
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        # collect the first values and sort them, they are the initial marker heights
+        if len(self.heights) < 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        heights = self.heights
+        positions = self.positions
+        # find the cell the value falls into and adjust the extreme markers if needed
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        # all markers above the cell move one position up
+        for marker in range(cell + 1, 5):
+            positions[marker] += 1
+        for marker in range(5):
+            self.desired[marker] += self.increments[marker]
+
+        # adjust the heights of the three middle markers if they are off their desired position
+        for marker in range(1, 4):
+            offset = self.desired[marker] - positions[marker]
+            if (offset >= 1 and positions[marker + 1] - positions[marker] > 1) or \
+               (offset <= -1 and positions[marker - 1] - positions[marker] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(marker, step)
+                # fall back to a linear prediction if the parabola leaves the neighbouring markers
+                if not heights[marker - 1] < height < heights[marker + 1]:
+                    height = self._linear(marker, step)
+                heights[marker] = height
+                positions[marker] += step
+
+    # piecewise parabolic prediction of a marker height
+    def _parabolic(self, marker, step):
+        heights = self.heights
+        positions = self.positions
+        return heights[marker] + step / (positions[marker + 1] - positions[marker - 1]) * (
+            (positions[marker] - positions[marker - 1] + step) *
+            (heights[marker + 1] - heights[marker]) / (positions[marker + 1] - positions[marker]) +
+            (positions[marker + 1] - positions[marker] - step) *
+            (heights[marker] - heights[marker - 1]) / (positions[marker] - positions[marker - 1]))
+
+    # linear prediction of a marker height
+    def _linear(self, marker, step):
+        return self.heights[marker] + step * (self.heights[marker + step] - self.heights[marker]) / \
+            (self.positions[marker + step] - self.positions[marker])
+
+    # return the current estimate or None if there are no values yet
+    def value(self):
+        if len(self.heights) == 0:
+            return None
+        # with less than five values the exact quantile can be returned
+        if len(self.heights) < 5:
+            index = min(len(self.heights) - 1, int(round(self.quantile * (len(self.heights) - 1))))
+            return self.heights[index]
+        return self.heights[2]
+
+# the exact quantile of a sorted list, interpolated linearly between the neighbouring values
+def exact_quantile(values, quantile):
+    if len(values) == 0:
+        return None
+    position = quantile * (len(values) - 1)
+    index = int(position)
+    if index + 1 >= len(values):
+        return values[-1]
+    return values[index] + (position - index) * (values[index + 1] - values[index])
+
+# incremental latency statistics. rtts are added one by one. the first exact_limit rtts are kept for
+# exact quantiles, since P² is far off with a few dozen values. longer streams drop them and rely on
+# the estimators, so a burst of any length uses a bounded amount of memory
+class latency_stats:
+    def __init__(self, quantiles=(0.5, 0.95), exact_limit=1000):
+        self.sent = 0
+        self.received = 0
+        self.min = None
+        self.max = None
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        # interarrival jitter as described in rfc 3550, based on the difference of consecutive rtts
+        self.jitter = 0.0
+        self._last_rtt = None
+        self._samples = []
+        self._sorted = True
+        self.exact_limit = exact_limit
+        self._quantiles = {}
+        for quantile in quantiles:
+            self._quantiles[quantile] = p2_quantile(quantile)
+
+    # add the result of a single probe. a lost probe is added as None
+    def add(self, rtt):
+        self.sent += 1
+        if rtt is None:
+            return
+        self.received += 1
+        self.min = rtt if self.min is None else min(self.min, rtt)
+        self.max = rtt if self.max is None else max(self.max, rtt)
+        self._sum += rtt
+        self._sum_squares += rtt * rtt
+        if self._last_rtt is not None:
+            self.jitter += (abs(rtt - self._last_rtt) - self.jitter) / 16
+        self._last_rtt = rtt
+        if self._samples is not None:
+            if len(self._samples) < self.exact_limit:
+                self._samples.append(rtt)
+                self._sorted = False
+            else:
+                self._samples = None
+        for estimator in self._quantiles.values():
+            estimator.add(rtt)
+
+    # fraction of the lost probes
+    def loss(self):
+        if self.sent == 0:
+            return 0.0
+        return 1 - self.received / self.sent
+
+    def average(self):
+        if self.received == 0:
+            return None
+        return self._sum / self.received
+
+    # mean deviation as ping calculates it
+    def mdev(self):
+        if self.received == 0:
+            return None
+        average = self.average()
+        return math.sqrt(max(0.0, self._sum_squares / self.received - average * average))
+
+    # the given quantile, exact as long as the rtts are kept and estimated afterwards. it must have been
+    # requested in the constructor
+    def quantile(self, quantile):
+        estimator = self._quantiles[quantile]
+        if self._samples is None:
+            return estimator.value()
+        if not self._sorted:
+            self._samples.sort()
+            self._sorted = True
+        return exact_quantile(self._samples, quantile)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def p95(self):
+        return self.quantile(0.95)
+
+    # all statistics as a dict, rtts in milliseconds and None without an answer
+    def summary(self):
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "loss": self.loss(),
+            "min": self.min,
+            "median": self.median(),
+            "p95": self.p95(),
+            "max": self.max,
+            "average": self.average(),
+            "jitter": self.jitter if self.received > 1 else None,
+        }
+
+# grade the latency increase under load in milliseconds, the limits follow the common bufferbloat tests
+def bufferbloat_grade(increase):
+    for limit, grade in ((5, "A+"), (30, "A"), (60, "B"), (200, "C"), (400, "D")):
+        if increase < limit:
+            return grade
+    return "F"
+
+# format a time in milliseconds for a narrow table column
+def format_ms(value):
+    if value is None:
+        return "-"
+    if value < 10:
+        return "%.2f" % value
+    if value < 100:
+        return "%.1f" % value
+    return "%.0f" % value
+
+# format a data rate in bit/s with a fitting unit
+def format_rate(value):
+    if value is None:
+        return "-"
+    for factor, unit in ((1e9, "Gbit/s"), (1e6, "Mbit/s"), (1e3, "kbit/s")):
+        if value >= factor:
+            return "%.1f %s" % (value / factor, unit)
+    return "%.0f bit/s" % value
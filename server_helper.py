@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import asyncio,json,math
+from urllib.parse import urlsplit, parse_qs, unquote
+
+STATUS_TEXTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                500: "Internal Server Error"}
+# the content type of the prometheus text format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# a json response with the given status
+def json_response(data, status=200):
+    return status, "application/json; charset=utf-8", \
+        json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+
+def text_response(text, status=200, content_type="text/plain; charset=utf-8"):
+    return status, content_type, text.encode("utf-8")
+
+# a line of the prometheus text format. None values are left out
+def format_metric(name, labels, value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if len(labels) > 0:
+        escaped = ",".join('%s="%s"' % (label, str(label_value).replace("\\", "\\\\").replace('"', '\\"')
+                                        .replace("\n", "\\n")) for label, label_value in labels.items())
+        return "%s{%s} %s" % (name, escaped, repr(float(value)))
+    return "%s %s" % (name, repr(float(value)))
+
+# read a request, let the handler answer it and close the connection. the handler is a coroutine that
+# gets the method, the path and the query parameters and returns status, content type and body
+async def handle_connection(reader, writer, handler, timeout=10.0):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout)
+        # the headers are not needed, but have to be read
+        while True:
+            header = await asyncio.wait_for(reader.readline(), timeout)
+            if header in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            status, content_type, body = text_response("bad request\n", 400)
+            method = None
+        else:
+            method, target = parts[0], urlsplit(parts[1])
+            if method not in ("GET", "HEAD"):
+                status, content_type, body = text_response("method not allowed\n", 405)
+            else:
+                try:
+                    status, content_type, body = await handler(method, unquote(target.path),
+                                                               parse_qs(target.query))
+                except Exception as exc:
+                    status, content_type, body = text_response("error: %s\n" % exc, 500)
+        writer.write(("HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n"
+                      "Cache-Control: no-store\r\nConnection: close\r\n\r\n" %
+                      (status, STATUS_TEXTS.get(status, ""), content_type, len(body))).encode("latin-1"))
+        if method != "HEAD":
+            writer.write(body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+# start the http server, see handle_connection for the handler
+async def start_http_server(handler, host="127.0.0.1", port=8080):
+    return await asyncio.start_server(lambda reader, writer: handle_connection(reader, writer, handler),
+                                      host, port)
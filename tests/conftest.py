@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+import os,sys
+
+# the modules of the net-tester are found in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
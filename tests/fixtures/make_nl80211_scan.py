@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# builds nl80211_scan.bin, a scan dump in the format of "nl80211_helper.py record" with four access
+# points that cover the decoded fields: wpa2 with ht40 on 2.4 GHz, wpa3 transition mode with vht80,
+# wep with an unspecified signal and an open hidden network with vht160 in the old format
+import os,struct,sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from netlink_helper import pack_attribute, NLMSG_HEADER, NLMSG_DONE, NLM_F_MULTI
+from nl80211_helper import GENL_HEADER, NL80211_CMD_NEW_SCAN_RESULTS, NL80211_ATTR_IFINDEX, \
+    NL80211_ATTR_BSS, NL80211_BSS_BSSID, NL80211_BSS_FREQUENCY, NL80211_BSS_CAPABILITY, \
+    NL80211_BSS_INFORMATION_ELEMENTS, NL80211_BSS_SIGNAL_MBM, NL80211_BSS_SIGNAL_UNSPEC, \
+    NL80211_BSS_SEEN_MS_AGO, IE_SSID, IE_RSN, IE_HT_OPERATION, IE_VHT_OPERATION
+
+# the family id of nl80211 differs between systems, the parser doesn't look at it
+FAMILY_ID = 0x1c
+
+def element(element_id, data):
+    return bytes([element_id, len(data)]) + data
+
+# an rsn element with ccmp and the given key management suites
+def rsn(*suites):
+    return element(IE_RSN, struct.pack("<H", 1) + b"\x00\x0f\xac\x04" + struct.pack("<H", 1) +
+                   b"\x00\x0f\xac\x04" + struct.pack("<H", len(suites)) +
+                   b"".join(b"\x00\x0f\xac" + bytes([suite]) for suite in suites))
+
+def bss(bssid, frequency, capability, elements, signal_mbm=None, signal_unspec=None, age=100):
+    attributes = pack_attribute(NL80211_BSS_BSSID, bytes.fromhex(bssid.replace(":", ""))) + \
+        pack_attribute(NL80211_BSS_FREQUENCY, struct.pack("=I", frequency)) + \
+        pack_attribute(NL80211_BSS_CAPABILITY, struct.pack("=H", capability)) + \
+        pack_attribute(NL80211_BSS_INFORMATION_ELEMENTS, elements) + \
+        pack_attribute(NL80211_BSS_SEEN_MS_AGO, struct.pack("=I", age))
+    if signal_mbm is not None:
+        attributes += pack_attribute(NL80211_BSS_SIGNAL_MBM, struct.pack("=i", signal_mbm))
+    if signal_unspec is not None:
+        attributes += pack_attribute(NL80211_BSS_SIGNAL_UNSPEC, bytes([signal_unspec]))
+    return attributes
+
+def message(message_type, payload):
+    length = NLMSG_HEADER.size + len(payload)
+    return NLMSG_HEADER.pack(length, message_type, NLM_F_MULTI, 1, 0) + payload + b"\x00" * (-length % 4)
+
+def build():
+    access_points = [
+        # secondary channel above and the permission to use it
+        bss("00:11:22:33:44:01", 2437, 0x0011, element(IE_SSID, b"ct-test") + rsn(2) +
+            element(IE_HT_OPERATION, bytes([6, 0x05]) + bytes(20)), signal_mbm=-5300),
+        bss("00:11:22:33:44:02", 5180, 0x0011, element(IE_SSID, b"ct-test-5g") + rsn(2, 8) +
+            element(IE_VHT_OPERATION, bytes([1, 42, 0, 0, 0])), signal_mbm=-6750, age=2500),
+        bss("00:11:22:33:44:03", 2412, 0x0011, element(IE_SSID, b"alt"), signal_unspec=60),
+        bss("00:11:22:33:44:04", 5500, 0x0001, element(IE_SSID, b"") +
+            element(IE_VHT_OPERATION, bytes([1, 106, 114, 0, 0])), signal_mbm=-8100),
+    ]
+    data = b""
+    for attributes in access_points:
+        data += message(FAMILY_ID, GENL_HEADER.pack(NL80211_CMD_NEW_SCAN_RESULTS, 1) +
+                        pack_attribute(NL80211_ATTR_IFINDEX, struct.pack("=I", 3)) +
+                        pack_attribute(0x8000 | NL80211_ATTR_BSS, attributes))
+    return data + message(NLMSG_DONE, struct.pack("=i", 0))
+
+if __name__ == "__main__":
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "nl80211_scan.bin"), "wb") as dump:
+        dump.write(build())
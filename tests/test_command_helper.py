@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import sys
+from command_helper import run_command
+
+def test_lines_are_kept_in_a_ring_buffer():
+    result = run_command([sys.executable, "-c", "for i in range(50): print(i)"], max_lines=10)
+    assert result["lines"] == [str(i) for i in range(40, 50)]
+    assert (result["dropped"], result["returncode"], result["timed_out"]) == (40, 0, False)
+
+def test_output_without_line_breaks_is_split():
+    script = "import sys\nfor _ in range(100): sys.stdout.write('x' * 1000); sys.stdout.flush()\nprint('y')"
+    result = run_command([sys.executable, "-c", script], max_lines=5, max_line_length=4096)
+    # 100000 bytes are 24 full lines, the rest ends with the line break
+    assert result["dropped"] + len(result["lines"]) == 25
+    assert all(len(line) <= 4096 for line in result["lines"])
+    assert result["lines"][-1] == "x" * (100000 % 4096) + "y"
+
+def test_last_line_without_line_break_and_timeout():
+    result = run_command([sys.executable, "-c", "import sys; sys.stdout.write('a\\r\\nb')"])
+    assert result["lines"] == ["a", "b"]
+    result = run_command([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.5, grace=0.5)
+    assert result["timed_out"] and result["returncode"] is None
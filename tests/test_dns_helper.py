@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import socket,struct,threading,time
+import pytest
+from dns_helper import dns_resolver, dns_exchange, decode_name, DNS_TYPE_A, DNS_TYPE_AAAA, DNS_CLASS_IN, \
+    MISSING_ANSWER_TTL
+
+# a name server on the loopback interface that answers every a and aaaa query after the delay of its
+# type. a delay of None drops the query
+class dns_stub:
+    def __init__(self, delays):
+        self.delays = delays
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(512)
+            except OSError:
+                return
+            self.queries += 1
+            _, offset = decode_name(packet, 12)
+            qtype = struct.unpack("!H", packet[offset:offset + 2])[0]
+            if self.delays.get(qtype) is None:
+                continue
+            if qtype == DNS_TYPE_A:
+                rdata = socket.inet_pton(socket.AF_INET, "192.0.2.1")
+            else:
+                rdata = socket.inet_pton(socket.AF_INET6, "2001:db8::1")
+            answer = struct.pack("!HHHIH", 0xc00c, qtype, DNS_CLASS_IN, 300, len(rdata)) + rdata
+            header = struct.pack("!HHHHHH", struct.unpack("!H", packet[:2])[0], 0x8180, 1, 1, 0, 0)
+            threading.Timer(self.delays[qtype], self._send,
+                            (header + packet[12:offset + 4] + answer, address)).start()
+
+    def _send(self, packet, address):
+        try:
+            self.sock.sendto(packet, address)
+        except OSError:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def stub(request):
+    server = dns_stub(request.param)
+    yield server
+    server.close()
+
+def exchange(stub, resolution_delay):
+    return dns_exchange("127.0.0.1", [("example.org", DNS_TYPE_A), ("example.org", DNS_TYPE_AAAA)],
+                        timeout=2.0, resolution_delay=resolution_delay, port=stub.port)
+
+@pytest.mark.parametrize("stub", [{DNS_TYPE_A: 0.3, DNS_TYPE_AAAA: 0}], indirect=True)
+def test_answer_within_the_resolution_delay_is_awaited(stub):
+    # the resolution delay starts with the first answer and gives the other family its grace period
+    ipv4, ipv6 = exchange(stub, 1.0)
+    assert ipv4[0]["answers"][0][3] == "192.0.2.1"
+    assert ipv6[0]["answers"][0][3] == "2001:db8::1"
+    assert ipv4[1] > 0.25
+
+@pytest.mark.parametrize("stub", [{DNS_TYPE_A: None, DNS_TYPE_AAAA: 0}], indirect=True)
+def test_missing_a_answer_is_awaited_for_the_resolution_delay(stub):
+    start = time.monotonic()
+    ipv4, ipv6 = exchange(stub, 0.1)
+    assert time.monotonic() - start < 1.0
+    assert ipv4 == (None, None)
+    assert ipv6[0] is not None
+
+@pytest.mark.parametrize("stub", [{DNS_TYPE_A: 0, DNS_TYPE_AAAA: None}], indirect=True)
+def test_dropped_aaaa_query_doesnt_stall_the_resolution(stub):
+    start = time.monotonic()
+    ipv4, ipv6 = exchange(stub, 0.1)
+    assert time.monotonic() - start < 1.0
+    assert ipv4[0]["answers"][0][3] == "192.0.2.1"
+    assert ipv6 == (None, None)
+
+@pytest.mark.parametrize("stub", [{DNS_TYPE_A: 0, DNS_TYPE_AAAA: None}], indirect=True)
+def test_incomplete_result_is_cached_for_a_short_time(stub):
+    resolver = dns_resolver(["127.0.0.1"], port=stub.port)
+    result = resolver.resolve("example.org")
+    assert (result["ipv4"], result["ipv6"]) == (["192.0.2.1"], [])
+    assert resolver.resolve("example.org")["cached"]
+    assert stub.queries == 2
+    assert resolver._cache["example.org"][0] - time.monotonic() <= MISSING_ANSWER_TTL
+
+@pytest.mark.parametrize("stub", [{DNS_TYPE_A: 0, DNS_TYPE_AAAA: 0}], indirect=True)
+def test_resolver_caches_the_answers(stub):
+    resolver = dns_resolver(["127.0.0.1"], port=stub.port)
+    result = resolver.resolve("example.org")
+    assert (result["ipv4"], result["ipv6"], result["cached"]) == (["192.0.2.1"], ["2001:db8::1"], False)
+    assert resolver.resolve("Example.org.")["cached"]
+    assert stub.queries == 2
+    # a cold resolution bypasses the cache
+    assert not resolver.resolve("example.org", use_cache=False)["cached"]
+    assert stub.queries == 4
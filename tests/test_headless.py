@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import asyncio,json,os,importlib.util
+from concurrent.futures import Future
+from job_helper import job
+from server_helper import start_http_server
+
+spec = importlib.util.spec_from_file_location(
+    "headless", os.path.join(os.path.dirname(os.path.dirname(__file__)), "ct-net-tester-headless.py"))
+headless = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(headless)
+
+# a job whose future has been cancelled before it ran, like the jobs left at the shutdown of the manager
+def cancelled_job():
+    cancelled = job("net_check")
+    cancelled.future = Future()
+    cancelled.future.cancel()
+    return cancelled
+
+def test_cancelled_job_is_answered_with_an_error():
+    tester = headless.nettester_headless.__new__(headless.nettester_headless)
+    tester.cache = type("cache", (), {"get": lambda self, key, start: cancelled_job()})()
+    tester.nettester_config = type("config", (), {"config": {"online_test_remote": "example.org"}})()
+
+    async def request():
+        server = await start_http_server(lambda method, path, query: tester.net_check(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /net HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response
+
+    header, body = asyncio.run(request()).split(b"\r\n\r\n", 1)
+    assert header.startswith(b"HTTP/1.1 200")
+    assert json.loads(body) == {"lines": [], "error": "cancelled"}
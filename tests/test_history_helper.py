@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import sqlite3,time,os
+from history_helper import history_store, open_history
+
+def fill(path, count, age):
+    history = history_store(path, retention=(10 * 86400, 10 * 86400, 10 * 86400), batch_interval=0.1)
+    now = time.time()
+    for index in range(count):
+        history.add("latency", "eth0", "target%d" % (index % 10), rtt=index % 20, loss=0, timestamp=now - age)
+    history.close()
+
+def test_query_and_summary(tmp_path):
+    path = str(tmp_path / "history.db")
+    fill(path, 100, 30)
+    history = history_store(path)
+    rows = history.summary(time.time() - 3600)
+    assert len(rows) == 10
+    kind, target, count, rtt, rtt_max, loss, value = rows[0]
+    assert (kind, target, count, loss, value) == ("latency", "target0", 10, 0.0, None)
+    assert len(history.query("latency", "target0", time.time() - 60, resolution=1)) == 10
+    history.close()
+
+def test_prune_gives_the_space_back(tmp_path):
+    path = str(tmp_path / "history.db")
+    fill(path, 20000, 3600)
+    connection = sqlite3.connect(path)
+    pages = connection.execute("PRAGMA page_count").fetchone()[0]
+    history = history_store(path, retention=(60, 60, 60))
+    history.prune()
+    history.close()
+    assert connection.execute("SELECT count(*) FROM samples").fetchone()[0] == 0
+    assert connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert connection.execute("PRAGMA page_count").fetchone()[0] < pages / 10
+
+def test_relative_path_is_in_the_state_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path))
+    history = open_history({"history_file": "history.db"})
+    history.close()
+    assert history.path == str(tmp_path / "ct-net-tester" / "history.db")
+    assert os.path.exists(history.path)
+    assert open_history({"history_file": ""}) is None
+
+def test_writer_survives_failed_batches(tmp_path, monkeypatch):
+    history = history_store(str(tmp_path / "history.db"), batch_interval=0.05)
+    insert = history._insert
+    calls = []
+    def failing_insert(connection, samples):
+        calls.append(len(samples))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database or disk is full")
+        insert(connection, samples)
+    monkeypatch.setattr(history, "_insert", failing_insert)
+    history.add("latency", "eth0", "lost", rtt=1)
+    time.sleep(0.3)
+    history.add("latency", "eth0", "kept", rtt=1)
+    history.close()
+    assert len(calls) == 2
+    assert [row[1] for row in history.summary(time.time() - 60)] == ["kept"]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import threading
+import http.server
+import pytest
+from http_helper import http_probe, tcp_connect
+from net_helper import parse_remote
+
+# answers every request with a short body. http/1.1 keeps the connections alive unless the path asks
+# to close them, a chunked body is sent for /chunked
+class handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200 if self.path != "/missing" else 404)
+        if self.path == "/chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"5\r\nhello\r\n0\r\n\r\n")
+            return
+        if self.path == "/close":
+            self.send_header("Connection", "close")
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"hello")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def probe(server, path="/", samples=3):
+    return http_probe("localhost", "127.0.0.1", server.server_address[1], False, path, samples)
+
+@pytest.mark.parametrize("path", ["/", "/chunked"])
+def test_samples_reuse_the_connection(server, path):
+    results = probe(server, path)
+    assert [result["status"] for result in results] == [200, 200, 200]
+    assert [result["reused"] for result in results] == [False, True, True]
+    # only the cold sample has a handshake
+    assert results[0]["tcp"] is not None and results[0]["ttfb"] is not None
+    assert results[1]["tcp"] is None and results[1]["ttfb"] is not None
+    assert all(result["tls"] is None and result["error"] is None for result in results)
+
+def test_closed_connection_is_opened_again(server):
+    results = probe(server, "/close", samples=2)
+    assert [result["reused"] for result in results] == [False, False]
+    assert results[1]["tcp"] is not None
+
+def test_status_and_errors(server):
+    assert probe(server, "/missing", samples=1)[0]["status"] == 404
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    result = probe(server, samples=1)[0]
+    assert result["status"] is None and result["error"] is not None
+    with pytest.raises(ConnectionRefusedError):
+        tcp_connect("127.0.0.1", port)
+
+def test_parse_remote():
+    assert parse_remote("example.org")["scheme"] == "icmp"
+    assert parse_remote("tcp://example.org:22") == {"scheme": "tcp", "host": "example.org", "port": 22,
+                                                    "path": "/"}
+    assert parse_remote("https://[2001:db8::1]/status?full") == {
+        "scheme": "https", "host": "2001:db8::1", "port": 443, "path": "/status?full"}
+    with pytest.raises(ValueError):
+        parse_remote("tcp://example.org")
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import socket,struct
+import pytest
+from net_helper import icmp_echo, open_icmp_socket, build_icmp_echo, parse_icmp_echo_reply, icmp_checksum, \
+    ICMP_ECHO_REPLY, ICMPV6_ECHO_REPLY
+
+# skip the test if neither a datagram nor a raw icmp socket is allowed
+def require_icmp(family):
+    try:
+        sock, _ = open_icmp_socket(family)
+    except OSError as exc:
+        pytest.skip("no icmp socket: " + str(exc))
+    sock.close()
+
+@pytest.mark.parametrize("ip", ["127.0.0.1", "::1"])
+def test_echo_over_loopback(ip):
+    family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+    require_icmp(family)
+    replies = []
+    try:
+        result = icmp_echo(ip, count=3, interval=0.05, timeout=1.0,
+                           callback=lambda sequence, rtt: replies.append((sequence, rtt)))
+    except OSError as exc:
+        # e.g. a host without ipv6
+        pytest.skip(str(exc))
+    assert (result["sent"], result["received"], result["loss"]) == (3, 3, 0.0)
+    assert sorted(sequence for sequence, rtt in replies) == [0, 1, 2]
+    assert all(rtt is not None and rtt < 1000 for sequence, rtt in replies)
+    assert result["min"] <= result["avg"] <= result["max"]
+
+def test_echo_request_has_a_valid_checksum():
+    packet = build_icmp_echo(socket.AF_INET, 0x1234, 7, b"payload")
+    assert icmp_checksum(packet) == 0
+    assert struct.unpack("!BBHHH", packet[:8])[3:] == (0x1234, 7)
+
+def test_reply_matching():
+    reply = struct.pack("!BBHHH", ICMP_ECHO_REPLY, 0, 0, 0x1234, 7) + b"payload"
+    assert parse_icmp_echo_reply(socket.AF_INET, reply, False) == (0x1234, 7)
+    # raw ipv4 sockets deliver the ip header in front of the reply
+    ip_header = bytes([0x45]) + bytes(19)
+    assert parse_icmp_echo_reply(socket.AF_INET, ip_header + reply, True) == (0x1234, 7)
+    # our own requests and replies of the other family are no answers
+    assert parse_icmp_echo_reply(socket.AF_INET, build_icmp_echo(socket.AF_INET, 0x1234, 7, b""), False) is None
+    assert parse_icmp_echo_reply(socket.AF_INET6, reply, False) is None
+    reply6 = struct.pack("!BBHHH", ICMPV6_ECHO_REPLY, 0, 0, 1, 2)
+    assert parse_icmp_echo_reply(socket.AF_INET6, reply6, True) == (1, 2)
+    assert parse_icmp_echo_reply(socket.AF_INET, reply[:6], False) is None
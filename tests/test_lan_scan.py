@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import netifaces
+import net
+from job_helper import job
+from lan_helper import oui_table
+
+def test_icmp_sweep_adds_hosts_without_neighbour_entry(monkeypatch):
+    def no_raw_access(*args):
+        raise PermissionError("no raw access")
+    monkeypatch.setattr(net, "arp_sweep", no_raw_access)
+    monkeypatch.setattr(net, "icmp_sweep", lambda own_ip, network, rate: {"192.168.1.2", "192.168.1.3"})
+    monkeypatch.setattr(net, "known_neighbours",
+                        lambda interface, network: {"192.168.1.2": "00:00:00:00:00:02"})
+    tester = net.net.__new__(net.net)
+    tester.interface_monitor = None
+    tester.oui_table = oui_table([])
+    tester.ifaddresses = lambda interface: {
+        netifaces.AF_INET: [{"addr": "192.168.1.1", "netmask": "255.255.255.0"}],
+        netifaces.AF_LINK: [{"addr": "00:00:00:00:00:01"}]}
+    scan = job("lan_scan")
+    tester._lan_scan(scan, "eth0", 2000)
+    assert scan.get_results() == [["192.168.1.1 (ich)", "00:00:00:00:00:01"],
+                                  ["192.168.1.2", "00:00:00:00:00:02"],
+                                  ["192.168.1.3", "MAC unbekannt"]]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+from nl80211_helper import parse_scan_dump, frequency_to_channel
+
+# built by fixtures/make_nl80211_scan.py in the format of "nl80211_helper.py record"
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "nl80211_scan.bin")
+
+def load():
+    with open(FIXTURE, "rb") as dump:
+        return {access_point["bssid"]: access_point for access_point in parse_scan_dump(dump.read())}
+
+def test_all_access_points_are_decoded():
+    assert sorted(load()) == ["00:11:22:33:44:0%d" % index for index in range(1, 5)]
+
+def test_wpa2_with_ht40():
+    access_point = load()["00:11:22:33:44:01"]
+    assert access_point["ssid"] == "ct-test"
+    assert (access_point["frequency"], access_point["channel"]) == (2437, 6)
+    assert (access_point["width"], access_point["center"]) == (40, 2447)
+    assert access_point["signal"] == -53.0
+    assert access_point["security"] == ["WPA2-PSK"]
+    assert access_point["age"] == 100
+
+def test_wpa3_transition_mode_with_vht80():
+    access_point = load()["00:11:22:33:44:02"]
+    assert access_point["ssid"] == "ct-test-5g"
+    assert (access_point["frequency"], access_point["channel"]) == (5180, 36)
+    assert (access_point["width"], access_point["center"]) == (80, 5210)
+    assert access_point["signal"] == -67.5
+    assert access_point["security"] == ["WPA2-PSK", "WPA3-SAE"]
+
+def test_wep_with_unspecified_signal():
+    access_point = load()["00:11:22:33:44:03"]
+    assert (access_point["frequency"], access_point["channel"]) == (2412, 1)
+    assert (access_point["width"], access_point["center"]) == (20, 2412)
+    # a quality of 60 out of 100
+    assert access_point["signal"] == -70.0
+    assert access_point["security"] == ["WEP"]
+
+def test_open_hidden_network_with_vht160():
+    access_point = load()["00:11:22:33:44:04"]
+    assert access_point["ssid"] == ""
+    assert (access_point["frequency"], access_point["channel"]) == (5500, 100)
+    assert (access_point["width"], access_point["center"]) == (160, 5570)
+    assert access_point["signal"] == -81.0
+    assert access_point["security"] == []
+
+def test_truncated_dump():
+    with open(FIXTURE, "rb") as dump:
+        data = dump.read()
+    # a message cut off in the middle ends the dump
+    assert len(parse_scan_dump(data[:-30])) == 3
+
+def test_frequency_to_channel():
+    assert frequency_to_channel(2484) == 14
+    assert frequency_to_channel(5745) == 149
+    assert frequency_to_channel(5955) == 1
+    assert frequency_to_channel(900) is None
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import random,statistics
+from probe_stats import latency_stats, p2_quantile, exact_quantile, bufferbloat_grade
+
+def test_short_bursts_have_exact_quantiles():
+    # a dns benchmark with two names and three rounds has six values per resolver
+    values = [12.0, 3.0, 40.0, 7.0, 5.0, 90.0]
+    stats = latency_stats()
+    for value in values:
+        stats.add(value)
+    stats.add(None)
+    assert stats.median() == statistics.median(values)
+    assert stats.p95() == 77.5
+    assert (stats.sent, stats.received, stats.min, stats.max) == (7, 6, 3.0, 90.0)
+
+def test_long_streams_fall_back_to_the_estimators():
+    randomness = random.Random(1)
+    values = [randomness.expovariate(1 / 20) for _ in range(5000)]
+    stats = latency_stats(exact_limit=100)
+    estimator = p2_quantile(0.95)
+    for value in values:
+        stats.add(value)
+        estimator.add(value)
+    assert stats.p95() == estimator.value()
+    assert abs(stats.p95() - exact_quantile(sorted(values), 0.95)) < 5
+
+def test_exact_quantile():
+    assert exact_quantile([], 0.5) is None
+    assert exact_quantile([4.0], 0.95) == 4.0
+    assert exact_quantile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert exact_quantile([1.0, 2.0, 3.0, 4.0], 1.0) == 4.0
+
+def test_bufferbloat_grade():
+    assert bufferbloat_grade(0) == "A+"
+    assert bufferbloat_grade(100) == "C"
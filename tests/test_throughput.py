@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import socket,socketserver,time
+import pytest
+import throughput_server
+from throughput_server import HEADER, MAGIC, VERSION, KIND_DOWNLOAD, TCP_INFO_TOTAL_RETRANS, \
+    TCP_INFO_BYTES_ACKED, tcp_info_field
+from throughput_helper import throughput_tcp, throughput_udp
+
+@pytest.fixture
+def server():
+    server = throughput_server.throughput_server("127.0.0.1", 0)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.mark.parametrize("download", [True, False])
+def test_tcp(server, download):
+    seconds = []
+    result = throughput_tcp("127.0.0.1", server.port, download, streams=2, duration=1.0,
+                            callback=lambda second, bps: seconds.append(second))
+    assert seconds == [1]
+    assert result["bits_per_second"] > 0 and len(result["intervals"]) == 1
+    if hasattr(socket, "TCP_INFO"):
+        assert result["retransmits"] is not None
+
+def test_udp(server):
+    result = throughput_udp("127.0.0.1", server.port, rate=1e6, duration=1.0)
+    assert result["sent"] > 50
+    assert result["loss"] < 0.5 and result["bits_per_second"] > 0
+
+def test_tcp_info(server):
+    sock = socket.create_connection(("127.0.0.1", server.port))
+    try:
+        if not hasattr(socket, "TCP_INFO"):
+            assert tcp_info_field(sock, TCP_INFO_TOTAL_RETRANS) is None
+            return
+        assert tcp_info_field(sock, TCP_INFO_TOTAL_RETRANS) == 0
+        sock.sendall(b"x" * 1000)
+        time.sleep(0.1)
+        assert tcp_info_field(sock, TCP_INFO_BYTES_ACKED) >= 1000
+    finally:
+        sock.close()
+
+def test_download_duration_is_limited(server, monkeypatch):
+    monkeypatch.setattr(throughput_server, "MAX_DURATION", 0.5)
+    sock = socket.create_connection(("127.0.0.1", server.port))
+    sock.settimeout(5)
+    try:
+        start = time.monotonic()
+        # the longest duration the header can carry
+        sock.sendall(HEADER.pack(MAGIC, VERSION, KIND_DOWNLOAD, 2 ** 32 - 1, 1))
+        while sock.recv(1024 * 1024):
+            pass
+        assert time.monotonic() - start < 3
+    finally:
+        sock.close()
+
+def test_server_class_settings_stay_local(server):
+    assert socketserver.ThreadingTCPServer.allow_reuse_address is False
+    assert socketserver.ThreadingTCPServer.daemon_threads is False
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,threading,random,time,json,math,os
+from throughput_server import HEADER, MAGIC, VERSION, KIND_CONTROL, KIND_UPLOAD, KIND_DOWNLOAD, \
+    UDP_HEADER, BUFFER_SIZE, DEFAULT_PORT, TCP_INFO_TOTAL_RETRANS, TCP_INFO_BYTES_ACKED, tcp_info_field
+
+# lower the priority of the calling thread. linux applies the nice value of a thread id to this thread only
+def lower_priority(nice):
+    if nice <= 0:
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except (AttributeError, OSError):
+        # not supported on this platform
+        pass
+
+# open a tcp connection to the companion server and introduce it with the header
+def _open_connection(host, port, kind, session_id, duration=0, timeout=5.0):
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(HEADER.pack(MAGIC, VERSION, kind, int(duration * 1000), session_id))
+    return sock
+
+# ask the server for the result of a session over its control connection
+def _request_result(control, timeout):
+    control.settimeout(timeout)
+    control.sendall(b"done\n")
+    response = b""
+    while not response.endswith(b"\n"):
+        chunk = control.recv(4096)
+        if not chunk:
+            raise ConnectionError("connection closed by remote")
+        response += chunk
+    return json.loads(response.decode("utf-8"))
+
+# run a tcp throughput test with several parallel streams against the companion server. download=True
+# lets the server send, otherwise the client sends. the optional callback is called with the number of
+# the second and the goodput of that second in bit/s. returns the goodput of every second, the total
+# goodput in bit/s and the number of retransmitted segments (None if unknown). a nice value above zero
+# lowers the scheduling priority of the stream threads, so they don't starve other threads when the test
+# is used as load generator
+def throughput_tcp(host, port=DEFAULT_PORT, download=True, streams=4, duration=5.0, callback=None, nice=0):
+    session_id = random.getrandbits(64)
+    control = _open_connection(host, port, KIND_CONTROL, session_id)
+    sockets = []
+    try:
+        for _ in range(streams):
+            sockets.append(_open_connection(host, port, KIND_DOWNLOAD if download else KIND_UPLOAD,
+                                            session_id, duration))
+        # bytes moved by every stream and retransmits of the upload streams
+        counters = [0] * streams
+        retransmits = [0] * streams
+        start = time.monotonic()
+        end = start + duration
+
+        # receive into one preallocated buffer per stream until the server closes the connection
+        def receive(index, sock):
+            lower_priority(nice)
+            view = memoryview(bytearray(BUFFER_SIZE))
+            sock.settimeout(duration + 10)
+            try:
+                while True:
+                    count = sock.recv_into(view)
+                    if count == 0:
+                        break
+                    counters[index] += count
+            except OSError:
+                pass
+
+        # send the same preallocated buffer until the test is over
+        def send(index, sock):
+            lower_priority(nice)
+            view = memoryview(bytearray(BUFFER_SIZE))
+            sock.settimeout(duration + 10)
+            try:
+                while time.monotonic() < end:
+                    counters[index] += sock.sendmsg([view])
+                retransmits[index] = tcp_info_field(sock, TCP_INFO_TOTAL_RETRANS)
+                sock.shutdown(socket.SHUT_WR)
+                # wait until the server has read everything
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+
+        threads = []
+        for index, sock in enumerate(sockets):
+            thread = threading.Thread(target=receive if download else send, args=[index, sock])
+            thread.start()
+            threads.append(thread)
+
+        # sample the goodput every second. for uploads the acknowledged bytes are counted, since the
+        # sent bytes may still wait in the socket buffers
+        def moved_bytes():
+            if download:
+                return sum(counters)
+            acked = [tcp_info_field(sock, TCP_INFO_BYTES_ACKED) for sock in sockets]
+            if None in acked:
+                return sum(counters)
+            return sum(acked)
+
+        intervals = []
+        last_bytes = 0
+        for second in range(1, int(math.ceil(duration)) + 1):
+            wakeup = start + second
+            for thread in threads:
+                thread.join(max(0.0, wakeup - time.monotonic()))
+            # all streams ended before the second was over
+            if time.monotonic() < wakeup:
+                break
+            current = moved_bytes()
+            intervals.append((current - last_bytes) * 8)
+            if callback is not None:
+                callback(second, intervals[-1])
+            last_bytes = current
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start if download else duration
+
+        result = _request_result(control, 10)
+        if download:
+            total_bytes = sum(counters)
+            retransmit_count = result["retransmits"]
+        else:
+            # the goodput of an upload is what arrived at the server
+            total_bytes = result["received_bytes"]
+            retransmit_count = None if None in retransmits else sum(retransmits)
+        return {
+            "intervals": intervals,
+            "bits_per_second": total_bytes * 8 / elapsed if elapsed > 0 else 0.0,
+            "retransmits": retransmit_count,
+        }
+    finally:
+        for sock in sockets:
+            sock.close()
+        control.close()
+
+# send udp datagrams at the given rate in bit/s to the companion server and let it count them.
+# returns the goodput of every second, the loss and the jitter measured by the server
+def throughput_udp(host, port=DEFAULT_PORT, rate=10e6, duration=5.0, packet_size=1400, callback=None):
+    session_id = random.getrandbits(64)
+    control = _open_connection(host, port, KIND_CONTROL, session_id)
+    family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
+        sock.connect(address)
+        packet_size = max(UDP_HEADER.size, packet_size)
+        buffer = bytearray(packet_size)
+        view = memoryview(buffer)
+        packets_per_second = rate / (packet_size * 8)
+        intervals = []
+        sent = 0
+        second_packets = 0
+        start = time.monotonic()
+        next_report = start + 1
+        while True:
+            now = time.monotonic()
+            if now >= next_report:
+                intervals.append(second_packets * packet_size * 8)
+                if callback is not None:
+                    callback(len(intervals), intervals[-1])
+                second_packets = 0
+                next_report += 1
+            if now - start >= duration:
+                break
+            # send every datagram that is due by now, then sleep until the next one
+            due = int((now - start) * packets_per_second) + 1
+            while sent < due:
+                UDP_HEADER.pack_into(buffer, 0, MAGIC, session_id, sent, time.time_ns())
+                try:
+                    sock.sendmsg([view])
+                except OSError:
+                    # the send buffer is full, try again later
+                    break
+                sent += 1
+                second_packets += 1
+            time.sleep(max(0.0, min(start + sent / packets_per_second, next_report) - time.monotonic()))
+        # give the last datagrams time to arrive
+        time.sleep(0.2)
+        result = _request_result(control, 10)
+        lost = max(0, sent - result["udp_packets"])
+        return {
+            "intervals": intervals,
+            "bits_per_second": result["udp_bytes"] * 8 / duration,
+            "sent": sent,
+            "loss": lost / sent if sent > 0 else 0.0,
+            "out_of_order": result["udp_out_of_order"],
+            "jitter": result["udp_jitter_ms"],
+        }
+    finally:
+        sock.close()
+        control.close()
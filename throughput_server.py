@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# companion server for the throughput test of the c't Net-Tester. it only needs python 3 and can run
+# on any laptop or server in the network:
+#
+#   python3 throughput_server.py [port]
+#
+# the test uses tcp and udp on the same port number (default 5201).
+import socket,socketserver,struct,threading,json,time,sys
+
+DEFAULT_PORT = 5201
+# every tcp connection starts with this header: magic, version, kind of connection, duration in ms
+# (download only) and the session id chosen by the client
+HEADER = struct.Struct("!4sBBIQ")
+MAGIC = b"CTNT"
+VERSION = 1
+KIND_CONTROL = 0
+KIND_UPLOAD = 1
+KIND_DOWNLOAD = 2
+# every udp datagram starts with magic, session id, sequence number and the send time in ns
+UDP_HEADER = struct.Struct("!4sQIQ")
+# size of the buffers used to send and receive data
+BUFFER_SIZE = 128 * 1024
+# the longest download a client can ask for in seconds
+MAX_DURATION = 60
+
+# offsets of the fields of the linux struct tcp_info we are interested in
+TCP_INFO_TOTAL_RETRANS = struct.Struct("I"), 100
+TCP_INFO_BYTES_ACKED = struct.Struct("Q"), 120
+
+# read a field from the tcp info of a socket, None if the kernel or platform doesn't provide it
+def tcp_info_field(sock, field):
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    field_struct, offset = field
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+    except OSError:
+        return None
+    if len(info) < offset + field_struct.size:
+        return None
+    return field_struct.unpack_from(info, offset)[0]
+
+# read exactly size bytes from a socket
+def recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by remote")
+        data += chunk
+    return data
+
+# the counters of a test run, filled by all connections and datagrams with the same session id
+class session:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received_bytes = 0
+        self.retransmits = 0
+        # number of data connections that are still running
+        self.active = 0
+        self.udp_packets = 0
+        self.udp_bytes = 0
+        self.udp_highest_sequence = -1
+        self.udp_out_of_order = 0
+        # rfc 3550 jitter in ns, based on the transit time of consecutive datagrams
+        self.udp_jitter = 0.0
+        self.udp_last_transit = None
+        self.last_used = time.monotonic()
+
+    def result(self):
+        with self.lock:
+            return {
+                "received_bytes": self.received_bytes,
+                "retransmits": self.retransmits,
+                "udp_packets": self.udp_packets,
+                "udp_bytes": self.udp_bytes,
+                "udp_expected": self.udp_highest_sequence + 1,
+                "udp_out_of_order": self.udp_out_of_order,
+                "udp_jitter_ms": self.udp_jitter / 1e6,
+            }
+
+# a threaded tcp server for the given address family. a subclass of its own, so the settings don't
+# change the ThreadingTCPServer of other users in the process
+class threading_tcp_server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, handler, family=socket.AF_INET):
+        # the family must be known before the socket is created
+        self.address_family = family
+        super().__init__(address, handler)
+
+class throughput_server:
+    def __init__(self, host="", port=DEFAULT_PORT):
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        server = self
+
+        # handles a single tcp connection
+        class handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server.handle_connection(self.request)
+
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.tcp_server = threading_tcp_server((host, port), handler, family)
+        # the udp socket listens on the same port as the tcp server, which may have picked a free one
+        self.port = self.tcp_server.server_address[1]
+        self.udp_socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.udp_socket.bind((host, self.port))
+
+    # return the session with the given id and create it if needed
+    def get_session(self, session_id):
+        with self.sessions_lock:
+            now = time.monotonic()
+            # forget sessions that haven't been used for a while
+            for old_id in [key for key, value in self.sessions.items() if now - value.last_used > 300]:
+                del self.sessions[old_id]
+            if session_id not in self.sessions:
+                self.sessions[session_id] = session()
+            self.sessions[session_id].last_used = now
+            return self.sessions[session_id]
+
+    def handle_connection(self, sock):
+        try:
+            magic, version, kind, duration, session_id = HEADER.unpack(recv_exactly(sock, HEADER.size))
+        except (OSError, struct.error):
+            return
+        if magic != MAGIC or version != VERSION:
+            return
+        test_session = self.get_session(session_id)
+        if kind == KIND_UPLOAD:
+            self.receive_upload(sock, test_session)
+        elif kind == KIND_DOWNLOAD:
+            self.send_download(sock, test_session, min(duration / 1000, MAX_DURATION))
+        elif kind == KIND_CONTROL:
+            self.control(sock, test_session)
+
+    # count all received bytes until the client closes the connection
+    def receive_upload(self, sock, test_session):
+        with test_session.lock:
+            test_session.active += 1
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        received = 0
+        try:
+            while True:
+                count = sock.recv_into(view)
+                if count == 0:
+                    break
+                received += count
+        except OSError:
+            pass
+        finally:
+            with test_session.lock:
+                test_session.received_bytes += received
+                test_session.active -= 1
+
+    # send data for the given duration and remember the retransmits
+    def send_download(self, sock, test_session, duration):
+        with test_session.lock:
+            test_session.active += 1
+        view = memoryview(bytearray(BUFFER_SIZE))
+        end = time.monotonic() + duration
+        try:
+            while time.monotonic() < end:
+                sock.sendmsg([view])
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        finally:
+            retransmits = tcp_info_field(sock, TCP_INFO_TOTAL_RETRANS)
+            with test_session.lock:
+                test_session.retransmits += retransmits or 0
+                test_session.active -= 1
+
+    # wait until the client asks for the result and send it as a json line
+    def control(self, sock, test_session):
+        try:
+            sock.settimeout(600)
+            request = b""
+            while not request.endswith(b"\n"):
+                chunk = sock.recv(64)
+                if not chunk:
+                    return
+                request += chunk
+            # give the data connections a moment to count their last bytes
+            deadline = time.monotonic() + 2
+            while test_session.active > 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            sock.sendall(json.dumps(test_session.result()).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+
+    # evaluate the udp datagrams of all sessions
+    def receive_udp(self):
+        buffer = bytearray(65536)
+        view = memoryview(buffer)
+        while True:
+            try:
+                count = self.udp_socket.recv_into(view)
+            except OSError:
+                return
+            received = time.time_ns()
+            if count < UDP_HEADER.size:
+                continue
+            magic, session_id, sequence, sent = UDP_HEADER.unpack_from(buffer)
+            if magic != MAGIC:
+                continue
+            test_session = self.get_session(session_id)
+            with test_session.lock:
+                test_session.udp_packets += 1
+                test_session.udp_bytes += count
+                if sequence < test_session.udp_highest_sequence:
+                    test_session.udp_out_of_order += 1
+                else:
+                    test_session.udp_highest_sequence = sequence
+                # the clocks of client and server differ, but the difference of the transit times
+                # doesn't depend on the offset
+                transit = received - sent
+                if test_session.udp_last_transit is not None:
+                    difference = abs(transit - test_session.udp_last_transit)
+                    test_session.udp_jitter += (difference - test_session.udp_jitter) / 16
+                test_session.udp_last_transit = transit
+
+    # run the server in background threads
+    def start(self):
+        threading.Thread(target=self.tcp_server.serve_forever, daemon=True).start()
+        threading.Thread(target=self.receive_udp, daemon=True).start()
+
+    def stop(self):
+        self.tcp_server.shutdown()
+        self.tcp_server.server_close()
+        self.udp_socket.close()
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = throughput_server("", port)
+    server.start()
+    print("c't Net-Tester throughput server listening on tcp and udp port " + str(server.port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import socket,struct,select,time,math,array,random
+from concurrent.futures import ThreadPoolExecutor
+from net_helper import build_icmp_echo, is_valid_ipv6_address, ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY, \
+    ICMPV6_ECHO_REQUEST, ICMPV6_ECHO_REPLY
+
+# icmp messages sent by the routers along the way
+ICMP_DEST_UNREACHABLE = 3
+ICMP_TIME_EXCEEDED = 11
+ICMPV6_DEST_UNREACHABLE = 1
+ICMPV6_TIME_EXCEEDED = 3
+
+# rolling statistics of every hop in preallocated arrays. the results of the last window probes of every
+# hop are kept in a ring, lost probes are stored as nan
+class hop_table:
+    def __init__(self, max_hops=30, window=10):
+        self.max_hops = max_hops
+        self.window = window
+        self.sent = array.array("L", [0] * max_hops)
+        self.received = array.array("L", [0] * max_hops)
+        self.last = array.array("d", [math.nan] * max_hops)
+        self.best = array.array("d", [math.inf] * max_hops)
+        self.worst = array.array("d", [0.0] * max_hops)
+        self.ring = array.array("d", [math.nan] * (max_hops * window))
+        self.ring_position = array.array("L", [0] * max_hops)
+        self.ring_fill = array.array("L", [0] * max_hops)
+        # the address that answered last for every hop
+        self.addresses = [None] * max_hops
+
+    # add the result of a probe, hop counts from 0 and rtt is None for a lost probe
+    def add(self, hop, rtt, address=None):
+        self.sent[hop] += 1
+        value = math.nan
+        if rtt is not None:
+            self.received[hop] += 1
+            self.last[hop] = rtt
+            self.best[hop] = min(self.best[hop], rtt)
+            self.worst[hop] = max(self.worst[hop], rtt)
+            value = rtt
+        if address is not None:
+            self.addresses[hop] = address
+        self.ring[hop * self.window + self.ring_position[hop]] = value
+        self.ring_position[hop] = (self.ring_position[hop] + 1) % self.window
+        self.ring_fill[hop] = min(self.window, self.ring_fill[hop] + 1)
+
+    # loss and average rtt of the last window probes of a hop
+    def rolling(self, hop):
+        fill = self.ring_fill[hop]
+        if fill == 0:
+            return None, None
+        start = hop * self.window
+        values = [value for value in self.ring[start:start + fill] if not math.isnan(value)]
+        loss = 1 - len(values) / fill
+        return loss, (sum(values) / len(values) if len(values) > 0 else None)
+
+# an mtr like traceroute. every round sends echo requests with all ttls at the same time from one raw
+# socket and matches the time exceeded messages of the routers by the quoted identifier and sequence
+class traceroute:
+    def __init__(self, target, max_hops=30, timeout=2.0, window=10, resolver=None):
+        self.target = target
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.family = socket.AF_INET6 if is_valid_ipv6_address(target) else socket.AF_INET
+        self.hops = hop_table(max_hops, window)
+        # the hop of the target once it has answered
+        self.destination_hop = None
+        # reverse lookups run in the background, so a slow name server never delays the probes
+        self.resolver = resolver
+        self.names = {}
+        self._lookups = ThreadPoolExecutor(max_workers=2) if resolver is not None else None
+        self.identifier = random.getrandbits(16)
+
+    # look up the name of a new address in the background
+    def _lookup(self, address):
+        if self._lookups is None or address in self.names:
+            return
+        self.names[address] = None
+        def lookup():
+            try:
+                self.names[address] = self.resolver.reverse(address)
+            except Exception:
+                pass
+        self._lookups.submit(lookup)
+
+    # extract identifier, sequence, and whether the sender is the target from an icmp message
+    def _parse(self, packet):
+        if self.family == socket.AF_INET:
+            # raw ipv4 sockets deliver the ip header as well
+            packet = packet[(packet[0] & 0x0f) * 4:]
+            reply, request, errors, final_errors = ICMP_ECHO_REPLY, ICMP_ECHO_REQUEST, \
+                (ICMP_TIME_EXCEEDED, ICMP_DEST_UNREACHABLE), (ICMP_DEST_UNREACHABLE,)
+        else:
+            reply, request, errors, final_errors = ICMPV6_ECHO_REPLY, ICMPV6_ECHO_REQUEST, \
+                (ICMPV6_TIME_EXCEEDED, ICMPV6_DEST_UNREACHABLE), (ICMPV6_DEST_UNREACHABLE,)
+        if len(packet) < 8:
+            return None
+        message_type = packet[0]
+        if message_type == reply:
+            identifier, sequence = struct.unpack("!HH", packet[4:8])
+            return identifier, sequence, True
+        if message_type not in errors:
+            return None
+        # the error quotes the ip header of our request and the first 8 bytes of its icmp header
+        inner = packet[8:]
+        if self.family == socket.AF_INET:
+            if len(inner) < 20:
+                return None
+            inner = inner[(inner[0] & 0x0f) * 4:]
+        else:
+            inner = inner[40:]
+        if len(inner) < 8 or inner[0] != request:
+            return None
+        identifier, sequence = struct.unpack("!HH", inner[4:8])
+        return identifier, sequence, message_type in final_errors
+
+    # run the given number of rounds. the callback is called whenever new results are available.
+    # raises OSError if no raw socket can be opened
+    def run(self, rounds=10, interval=1.0, callback=None):
+        protocol = socket.IPPROTO_ICMPV6 if self.family == socket.AF_INET6 else socket.IPPROTO_ICMP
+        sock = socket.socket(self.family, socket.SOCK_RAW, protocol)
+        try:
+            sock.setblocking(False)
+            # sequence -> (hop, send time)
+            pending = {}
+            round_number = 0
+            next_round = time.monotonic()
+            last_callback = 0
+            while round_number < rounds or len(pending) > 0:
+                now = time.monotonic()
+                if round_number < rounds and now >= next_round:
+                    # probe every hop up to the target at once
+                    limit = self.destination_hop + 1 if self.destination_hop is not None else self.max_hops
+                    for hop in range(limit):
+                        sequence = (round_number * self.max_hops + hop) & 0xffff
+                        if self.family == socket.AF_INET6:
+                            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, hop + 1)
+                        else:
+                            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, hop + 1)
+                        try:
+                            sock.sendto(build_icmp_echo(self.family, self.identifier, sequence, b"ct-net-tester"),
+                                        (self.target, 0))
+                            pending[sequence] = (hop, time.monotonic())
+                        except OSError:
+                            self.hops.add(hop, None)
+                    round_number += 1
+                    next_round += interval
+
+                # probes without an answer are lost
+                for sequence, (hop, sent) in list(pending.items()):
+                    if now - sent > self.timeout:
+                        del pending[sequence]
+                        if self.destination_hop is None or hop <= self.destination_hop:
+                            self.hops.add(hop, None)
+
+                if round_number >= rounds and len(pending) == 0:
+                    break
+                wakeup = min([sent + self.timeout for _, sent in pending.values()] +
+                             ([next_round] if round_number < rounds else []))
+                readable, _, _ = select.select([sock], [], [], max(0.0, wakeup - time.monotonic()))
+                while readable:
+                    try:
+                        packet, address = sock.recvfrom(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = time.monotonic()
+                    result = self._parse(packet)
+                    if result is None or result[0] != self.identifier or result[1] not in pending:
+                        continue
+                    hop, sent = pending.pop(result[1])
+                    if result[2]:
+                        # the target answered, so there are no hops behind it
+                        if self.destination_hop is None or hop < self.destination_hop:
+                            self.destination_hop = hop
+                    if self.destination_hop is not None and hop > self.destination_hop:
+                        continue
+                    self.hops.add(hop, (received - sent) * 1000, address[0])
+                    self._lookup(address[0])
+
+                # don't redraw more often than needed
+                if callback is not None and time.monotonic() - last_callback > 0.25:
+                    last_callback = time.monotonic()
+                    callback(self)
+        finally:
+            sock.close()
+            if self._lookups is not None:
+                self._lookups.shutdown(wait=False)
+        if callback is not None:
+            callback(self)
+
+    # return a table row for every hop up to the target: hop and host, rolling loss, last, rolling
+    # average, best and worst rtt in ms
+    def rows(self):
+        rows = []
+        if self.destination_hop is not None:
+            limit = self.destination_hop + 1
+        else:
+            # without an answer of the target show everything up to the last hop that answered
+            answered = [hop for hop in range(self.max_hops) if self.hops.addresses[hop] is not None]
+            limit = answered[-1] + 1 if len(answered) > 0 else 0
+        for hop in range(limit):
+            address = self.hops.addresses[hop]
+            name = self.names.get(address) if address is not None else None
+            loss, average = self.hops.rolling(hop)
+            received = self.hops.received[hop] > 0
+            rows.append([
+                str(hop + 1) + " " + (name or address or "???"),
+                "%d%%" % round((loss or 0) * 100),
+                self.hops.last[hop] if received else None,
+                average,
+                self.hops.best[hop] if received else None,
+                self.hops.worst[hop] if received else None,
+            ])
+        return rows
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import threading,time,array
+
+# the 20 MHz channels of both bands as (channel, center frequency)
+CHANNELS_24 = [(channel, 2407 + 5 * channel) for channel in range(1, 14)]
+CHANNELS_5 = [(channel, 5000 + 5 * channel) for channel in list(range(36, 65, 4)) + list(range(100, 145, 4)) +
+              list(range(149, 166, 4))]
+# the 2.4 GHz channels that don't overlap each other
+CHANNELS_24_SEPARATE = (1, 6, 11)
+
+# the access points seen by the wifi survey by their bssid. every scan updates the moving average and
+# the range of the signal and drops access points that haven't been seen for max_age seconds. every
+# change gets a version, so a reader can ask for the changes since the version it has shown last
+class survey_table:
+    # the number of removed access points that are remembered for readers that are behind
+    MAX_REMOVED = 1024
+
+    def __init__(self, max_age=120, smoothing=0.3):
+        self.max_age = max_age
+        # weight of a new signal value in the moving average
+        self.smoothing = smoothing
+        self.entries = {}
+        # the number of completed scans
+        self.scans = 0
+        self.version = 0
+        # bssid -> version of the removal
+        self._removed = {}
+        # readers with an older version than this get all entries, the removals before are forgotten
+        self._oldest_version = 0
+        self._lock = threading.Lock()
+
+    # the values that are shown for an access point. only changes of these are reported to the readers
+    @staticmethod
+    def _shown(entry):
+        signal = round(entry["signal"]) if entry["signal"] is not None else None
+        return entry["ssid"], entry["security"], signal, entry["signal_min"], entry["signal_max"], \
+            entry["channel"], entry["width"]
+
+    # the access point library returns diffrent data types for security, so convert it to text
+    @staticmethod
+    def _security(security):
+        if type(security) is list:
+            security = " ".join(str(e) for e in security)
+        else:
+            security = str(security)
+        if security.replace(" ", "") == "":
+            security = "-"
+        return security
+
+    @staticmethod
+    def _signal(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    # add the results of a scan of all interfaces. every access point is a dict with ssid, bssid, signal
+    # in dBm and security and optionally frequency, channel, width and center frequency. returns whether
+    # anything that is shown has changed
+    def update(self, access_points, now=None):
+        now = time.monotonic() if now is None else now
+        # an access point can be seen by more than one interface, keep the strongest signal
+        seen = {}
+        for access_point in access_points:
+            bssid = str(access_point["bssid"]).lower()
+            signal = self._signal(access_point.get("signal"))
+            known = seen.get(bssid)
+            if known is None or (signal is not None and (known[1] is None or signal > known[1])):
+                seen[bssid] = (access_point, signal)
+
+        with self._lock:
+            version = self.version + 1
+            changed = False
+            for bssid, (access_point, signal) in seen.items():
+                entry = self.entries.get(bssid)
+                if entry is None:
+                    entry = self.entries[bssid] = {
+                        "bssid": bssid,
+                        "signal": signal,
+                        "signal_min": signal,
+                        "signal_max": signal,
+                        "first_seen": now,
+                        "count": 0,
+                        "version": version,
+                    }
+                    self._removed.pop(bssid, None)
+                    shown = None
+                else:
+                    shown = self._shown(entry)
+                    if signal is not None:
+                        if entry["signal"] is None:
+                            entry["signal"] = entry["signal_min"] = entry["signal_max"] = signal
+                        else:
+                            entry["signal"] += self.smoothing * (signal - entry["signal"])
+                            entry["signal_min"] = min(entry["signal_min"], signal)
+                            entry["signal_max"] = max(entry["signal_max"], signal)
+                entry["ssid"] = str(access_point.get("ssid", ""))
+                entry["security"] = self._security(access_point.get("security", ""))
+                entry["signal_last"] = signal
+                entry["interface"] = access_point.get("interface")
+                entry["frequency"] = access_point.get("frequency")
+                entry["channel"] = access_point.get("channel")
+                entry["width"] = access_point.get("width") or 20
+                entry["center"] = access_point.get("center") or entry["frequency"]
+                entry["last_seen"] = now
+                entry["count"] += 1
+                if self._shown(entry) != shown:
+                    entry["version"] = version
+                    changed = True
+
+            # drop the access points that have vanished
+            for bssid, entry in list(self.entries.items()):
+                if now - entry["last_seen"] > self.max_age:
+                    del self.entries[bssid]
+                    self._removed[bssid] = version
+                    changed = True
+            if len(self._removed) > self.MAX_REMOVED:
+                self._oldest_version = version
+                self._removed.clear()
+
+            self.scans += 1
+            if changed:
+                self.version = version
+            return changed
+
+    # return copies of all entries
+    def snapshot(self):
+        with self._lock:
+            return [dict(entry) for entry in self.entries.values()]
+
+    # return the current version, copies of the entries that changed after the given version, the bssids
+    # removed since then and whether the reader has to start over because the removals are forgotten
+    def changes(self, since):
+        with self._lock:
+            reset = since < self._oldest_version
+            changed = [dict(entry) for entry in self.entries.values() if reset or entry["version"] > since]
+            removed = [bssid for bssid, version in self._removed.items() if not reset and version > since]
+            return self.version, changed, removed, reset
+
+# the congestion of the channels of a band. every access point adds its weight to all channels its
+# spectrum overlaps with, scaled by the share of the channel it covers. access points with the same
+# center frequency and width overlap the same channels, so the overlaps are computed once for every
+# combination and the access points are summed up per combination before they are applied
+class channel_analysis:
+    def __init__(self, channels, spread=0):
+        self.channels = channels
+        self.index = {channel: index for index, (channel, center) in enumerate(channels)}
+        # 2.4 GHz transmissions are 2 MHz wider than their channel
+        self.spread = spread
+        # (center, width) -> list of (channel index, overlap)
+        self._overlaps = {}
+
+    # the share of every channel that is covered by a transmission
+    def _overlap(self, center, width):
+        key = (center, width)
+        overlaps = self._overlaps.get(key)
+        if overlaps is None:
+            half_width = (width + self.spread) / 2
+            channel_half_width = (20 + self.spread) / 2
+            overlaps = []
+            for index, (channel, channel_center) in enumerate(self.channels):
+                overlap = min(center + half_width, channel_center + channel_half_width) - \
+                    max(center - half_width, channel_center - channel_half_width)
+                if overlap > 0:
+                    overlaps.append((index, overlap / (2 * channel_half_width)))
+            self._overlaps[key] = overlaps
+        return overlaps
+
+    # the weight of an access point by its signal, 1 for -50 dBm and more down to 0.1 for -95 dBm
+    @staticmethod
+    def weight(signal):
+        if signal is None:
+            return 0.5
+        return min(1.0, max(0.1, (signal + 100) / 50))
+
+    # return the number of access points with their primary channel on every channel and the congestion
+    # scores of all channels, both in the order of the channels
+    def analyse(self, entries):
+        counts = array.array("L", [0] * len(self.channels))
+        scores = array.array("d", [0.0] * len(self.channels))
+        combinations = {}
+        for entry in entries:
+            index = self.index.get(entry.get("channel"))
+            if index is None or self.channels[index][1] != entry.get("frequency"):
+                continue
+            counts[index] += 1
+            key = (entry.get("center") or entry["frequency"], entry.get("width") or 20)
+            combinations[key] = combinations.get(key, 0.0) + self.weight(entry.get("signal"))
+        for (center, width), weight in combinations.items():
+            for index, overlap in self._overlap(center, width):
+                scores[index] += weight * overlap
+        return counts, scores
+
+    # return the given number of channels with the lowest score, only of the given channels if candidates
+    # is set. channels with radar detection (dfs) come last on the same score
+    def recommend(self, scores, count=3, candidates=None):
+        channels = [(round(scores[index], 2), 52 <= channel <= 144, channel)
+                    for index, (channel, center) in enumerate(self.channels)
+                    if candidates is None or channel in candidates]
+        return [channel for score, dfs, channel in sorted(channels)[:count]]